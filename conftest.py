@@ -0,0 +1,37 @@
+"""
+Module of the fixtures shared by the tests of the Just Dance Game
+"""
+import numpy as np
+import pytest
+from just_dance_model import JustDanceModel
+
+
+class FakeModel(JustDanceModel):
+    """
+    A `JustDanceModel` that returns random key points instead of loading
+    a TensorFlow Lite model, so tests can run without the model file.
+    """
+
+    def __init__(self, model_path):  # pylint: disable=super-init-not-called
+        self.model_path = model_path
+        self.input_size = 192
+        self.multi_pose = False
+        self.supports_batch = None
+        self.rng = np.random.default_rng(0)
+
+    def run_inference(self, input_image):
+        return self._invoke(input_image)
+
+    def _invoke(self, input_image, num_outputs=None):
+        return self.rng.random(
+            (num_outputs or len(input_image), 1, 17, 3), dtype=np.float32
+        )
+
+
+@pytest.fixture
+def fake_model():
+    """
+    A fixture that returns a `FakeModel`, using the test audio file as a
+    stand-in for the model file.
+    """
+    return FakeModel(model_path="test/test.mp3")
@@ -0,0 +1,109 @@
+"""
+Set 'AngleBuffer' class to store joint angles in a preallocated array
+"""
+from collections.abc import Mapping
+import numpy as np
+from keypoint import JOINTS
+
+
+class AngleBuffer(Mapping):
+    """
+    A growable float32 array of joint angles with one row per frame
+
+    Behaves like the dictionary of angle lists used before: indexing it with
+    a joint name returns that joint's column as a `numpy.ndarray` view.
+
+    Attributes:
+        joints (list): The joint names, in column order
+        columns (dict): A dictionary mapping each joint name to its column
+
+    Methods:
+        __init__: Initialize a new `AngleBuffer` object
+        append: Add the angles of one frame
+        extend: Add the angles of several frames
+        clear: Remove all stored angles
+        array: Return the stored angles as a frames x joints array
+        num_frames: Return the number of stored frames
+    """
+
+    def __init__(self, capacity=256, joints=None):
+        """
+        Initialize a new `AngleBuffer` object
+
+        Args:
+            capacity: An integer representing the number of frames to
+                allocate room for up front
+            joints: A list of joint names, `JOINTS` if None
+        """
+        self.joints = list(JOINTS if joints is None else joints)
+        self.columns = {joint: i for i, joint in enumerate(self.joints)}
+        self._data = np.empty(
+            (max(1, capacity), len(self.joints)), dtype=np.float32
+        )
+        self._size = 0
+
+    def _reserve(self, num_frames):
+        """
+        Make sure there is room for a number of frames, doubling the
+        capacity when the buffer is full
+
+        Args:
+            num_frames: An integer representing the number of frames
+        """
+        if num_frames > len(self._data):
+            capacity = max(num_frames, 2 * len(self._data))
+            data = np.empty((capacity, len(self.joints)), dtype=np.float32)
+            data[: self._size] = self._data[: self._size]
+            self._data = data
+
+    def append(self, angles):
+        """
+        Add the angles of one frame
+
+        Args:
+            angles: A sequence of one angle per joint, in column order
+        """
+        self._reserve(self._size + 1)
+        self._data[self._size] = angles
+        self._size += 1
+
+    def extend(self, angles):
+        """
+        Add the angles of several frames
+
+        Args:
+            angles: An array of shape frames x joints
+        """
+        angles = np.asarray(angles, dtype=np.float32)
+        self._reserve(self._size + len(angles))
+        self._data[self._size : self._size + len(angles)] = angles
+        self._size += len(angles)
+
+    def clear(self):
+        """
+        Remove all stored angles, keeping the allocated memory
+        """
+        self._size = 0
+
+    @property
+    def array(self):
+        """
+        Return the stored angles as a frames x joints array view
+        """
+        return self._data[: self._size]
+
+    @property
+    def num_frames(self):
+        """
+        Return the number of stored frames
+        """
+        return self._size
+
+    def __getitem__(self, joint):
+        return self._data[: self._size, self.columns[joint]]
+
+    def __iter__(self):
+        return iter(self.joints)
+
+    def __len__(self):
+        return len(self.joints)
@@ -0,0 +1,394 @@
+"""
+Score recorded performances of a song without a window or audio, spread
+over a pool of processes, and replay the key points saved by games
+"""
+import argparse
+import csv
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from keypoint import MIN_KEYPOINT_SCORE
+from just_dance_model import JustDanceModel
+from just_dance_angles import AngleBuffer
+from just_dance_cache import bake_reference, load_reference
+from just_dance_recording import RECORDING_EXTENSION, read_recording
+from just_dance_timing import DEFAULT_SAMPLE_RATE, FrameSampler
+from just_dance_tracking import PoseTracker
+
+RECORDING_PATTERNS = (
+    "*.mp4",
+    "*.avi",
+    "*.mov",
+    "*.mkv",
+    "*" + RECORDING_EXTENSION,
+)
+
+# Set up once in every worker process by `_init_worker`
+_worker = {}
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def score_recording(  # pylint: disable=too-many-locals
+    model,
+    reference,
+    recording_path,
+    threshold=20,
+    sample_rate=DEFAULT_SAMPLE_RATE,
+    flip=True,
+    track_pose=False,
+    min_score=MIN_KEYPOINT_SCORE,
+    dtw=False,
+):
+    """
+    Score a recorded performance against the key points of the song video
+
+    Runs the same steps as a live game: the frames of the recording are
+    sampled by their timestamps, flipped like the camera feed, and their
+    angles are compared with the video's angles at the same frame. Only the
+    sampled frames are decoded.
+
+    Args:
+        model: A `JustDanceModel` object used for pose estimation
+        reference: A `numpy.ndarray` of shape Nx17x3 of the key points of
+            every frame of the song video
+        recording_path: A string representing the path to the recording
+        threshold: An integer representing the threshold angle difference
+        sample_rate: A number representing the samples per second of video,
+            or None to score every frame
+        flip: A boolean representing whether to mirror the recording like
+            the live camera feed
+        track_pose: A boolean representing whether to crop the frames
+            around the dancer like `JustDanceController` does with
+            `track_pose`
+        min_score: A number representing the lowest key point score an
+            angle is scored from, or None to score every angle
+        dtw: A boolean representing whether to score with
+            `JustDanceModel.final_score_dtw`, like games with `dtw`
+
+    Returns:
+        A tuple of the final score (None if no frame was scored) and the
+        number of frames scored
+    """
+    capture = cv2.VideoCapture(recording_path)  # pylint: disable=no-member
+    sampler = FrameSampler(sample_rate)
+    tracker = PoseTracker(model.input_size) if track_pose else None
+    angles_video = AngleBuffer()
+    angles_camera = AngleBuffer()
+    frame_index = -1
+
+    # Frames that are not sampled are only grabbed, skipping their decoding
+    # into images
+    while capture.grab():
+        frame_index += 1
+        if frame_index >= len(reference):
+            break
+        timestamp = capture.get(
+            cv2.CAP_PROP_POS_MSEC  # pylint: disable=no-member
+        )
+        if not sampler.should_sample(timestamp):
+            continue
+        success, frame = capture.retrieve()
+        if not success:
+            break
+        if flip:
+            frame = cv2.flip(frame, 1)  # pylint: disable=no-member
+
+        if tracker is None:
+            key_points_with_scores = model.run_inference(
+                model.prepare_input(frame)
+            )
+        else:
+            key_points_with_scores = tracker.run(model, frame, timestamp)
+        model.store_angles(
+            angles_video, frame, reference[frame_index], min_score
+        )
+        model.store_angles(
+            angles_camera, frame, key_points_with_scores, min_score
+        )
+
+    frame_rate = capture.get(cv2.CAP_PROP_FPS)  # pylint: disable=no-member
+    capture.release()
+
+    if angles_camera.num_frames == 0:
+        return None, 0
+    if dtw:
+        score = model.final_score_dtw(
+            angles_video,
+            angles_camera,
+            threshold,
+            sample_rate=sample_rate or frame_rate,
+        )
+    else:
+        score = model.final_score(angles_video, angles_camera, threshold)
+    return float(score), angles_camera.num_frames
+
+
+def replay_recording(
+    reference,
+    recording_path,
+    threshold=20,
+    min_score=MIN_KEYPOINT_SCORE,
+    dtw=False,
+):
+    """
+    Score the key points a game saved with `record_path` against the key
+    points of the song video
+
+    Scores the same frames as the game did, without decoding a video or
+    running the model, so the score only differs from the game's by the
+    rounding of the saved key points.
+
+    Args:
+        reference: A `numpy.ndarray` of shape Nx17x3 of the key points of
+            every frame of the song video
+        recording_path: A string representing the path to the recording
+            written by `just_dance_recording.KeypointRecorder`
+        threshold: An integer representing the threshold angle difference
+        min_score: A number representing the lowest key point score an
+            angle is scored from, or None to score every angle
+        dtw: A boolean representing whether to score with
+            `JustDanceModel.final_score_dtw`, at the rate the game sampled
+
+    Returns:
+        A tuple of the final score (None if no frame was scored) and the
+        number of frames scored
+    """
+    frame_shape, records = read_recording(recording_path)
+    frame_indices = np.asarray(records["frame_index"])
+    in_song = frame_indices < len(reference)
+    if not in_song.any():
+        return None, 0
+
+    angles_video = AngleBuffer(capacity=int(in_song.sum()))
+    angles_camera = AngleBuffer(capacity=int(in_song.sum()))
+    angles_video.extend(
+        JustDanceModel.calculate_angles(
+            reference[frame_indices[in_song]], frame_shape, min_score=min_score
+        )
+    )
+    angles_camera.extend(
+        JustDanceModel.calculate_angles(
+            np.asarray(records["key_points"][in_song], dtype=np.float32),
+            frame_shape,
+            min_score=min_score,
+        )
+    )
+    if dtw:
+        timestamps = np.asarray(records["timestamp_ms"][in_song])
+        span_ms = timestamps[-1] - timestamps[0]
+        sample_rate = (
+            (len(timestamps) - 1) * 1000 / span_ms
+            if span_ms > 0
+            else DEFAULT_SAMPLE_RATE
+        )
+        score = JustDanceModel.final_score_dtw(
+            angles_video, angles_camera, threshold, sample_rate=sample_rate
+        )
+    else:
+        score = JustDanceModel.final_score(
+            angles_video, angles_camera, threshold
+        )
+    return float(score), angles_camera.num_frames
+
+
+def _init_worker(model_path, reference, options):
+    """
+    Set up a worker process, leaving the model to be loaded by
+    `_worker_model` once a video is scored, since replaying saved key
+    points does not need it
+
+    Args:
+        model_path: A string representing the path to the model
+        reference: A `numpy.ndarray` of the key points of the song video
+        options: A dictionary of keyword arguments for `score_recording`
+    """
+    _worker["model"] = None
+    _worker["model_path"] = model_path
+    _worker["reference"] = reference
+    _worker["options"] = options
+
+
+def _worker_model():
+    """
+    Return the model of the worker process, loading it the first time
+
+    Returns:
+        A `JustDanceModel` object
+    """
+    if _worker["model"] is None:
+        # One interpreter thread per process, the pool provides the
+        # parallelism
+        _worker["model"] = JustDanceModel(
+            model_path=_worker["model_path"], num_threads=1
+        )
+    return _worker["model"]
+
+
+def _score_in_worker(recording_path):
+    """
+    Score one recording in a worker process
+
+    Args:
+        recording_path: A string representing the path to the recording
+
+    Returns:
+        A dictionary of the results for the recording
+    """
+    start = time.perf_counter()
+    options = _worker["options"]
+    try:
+        if recording_path.endswith(RECORDING_EXTENSION):
+            score, samples = replay_recording(
+                _worker["reference"],
+                recording_path,
+                threshold=options.get("threshold", 20),
+                min_score=options.get("min_score", MIN_KEYPOINT_SCORE),
+                dtw=options.get("dtw", False),
+            )
+        else:
+            score, samples = score_recording(
+                _worker_model(),
+                _worker["reference"],
+                recording_path,
+                **options,
+            )
+        error = ""
+    except Exception as exception:  # pylint: disable=broad-except
+        score, samples, error = None, 0, repr(exception)
+    return {
+        "recording": recording_path,
+        "score": "" if score is None else f"{score:.1f}",
+        "samples": samples,
+        "seconds": f"{time.perf_counter() - start:.2f}",
+        "error": error,
+    }
+
+
+def score_recordings(
+    video_path,
+    recording_paths,
+    model_path="model/model.tflite",
+    workers=None,
+    **options,
+):
+    """
+    Score many recorded performances of one song in a pool of processes
+
+    Bakes the key points of the song video first if they are not cached.
+
+    Args:
+        video_path: A string representing the path to the song video
+        recording_paths: A list of paths to the recordings
+        model_path: A string representing the path to the model
+        workers: An integer representing the number of processes, or None
+            for one per CPU
+        **options: Keyword arguments for `score_recording`
+
+    Returns:
+        A list of dictionaries of the results, in the order of the
+        recordings
+    """
+    reference = load_reference(video_path, model_path)
+    if reference is None:
+        bake_reference(JustDanceModel(model_path=model_path), video_path)
+        reference = load_reference(video_path, model_path)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(model_path, reference["key_points"], options),
+    ) as pool:
+        return list(pool.map(_score_in_worker, recording_paths))
+
+
+def main():
+    """
+    Score a directory of recordings and write the results to a CSV file
+    """
+    parser = argparse.ArgumentParser(
+        description="Score recorded Just Dance performances offline."
+    )
+    parser.add_argument("song", help="song name in songs/, or a video path")
+    parser.add_argument(
+        "recordings",
+        help="directory of recorded videos, or of key points saved by games",
+    )
+    parser.add_argument("--model", default="model/model.tflite")
+    parser.add_argument("--output", default="results.csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threshold", type=int, default=20)
+    parser.add_argument(
+        "--sample-rate",
+        type=float,
+        default=DEFAULT_SAMPLE_RATE,
+        help="samples per second of video, 0 for every frame",
+    )
+    parser.add_argument(
+        "--no-flip",
+        action="store_true",
+        help="the recordings are already mirrored like the game shows them",
+    )
+    parser.add_argument(
+        "--track-pose",
+        action="store_true",
+        help="crop the frames around the dancer before running the model",
+    )
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        default=MIN_KEYPOINT_SCORE,
+        help="lowest key point score an angle is scored from, 0 for all",
+    )
+    parser.add_argument(
+        "--dtw",
+        action="store_true",
+        help="align the dancer to the video in time before scoring",
+    )
+    args = parser.parse_args()
+
+    video_path = args.song
+    if not os.path.isfile(video_path):
+        video_path = os.path.join("songs", args.song + ".mp4")
+    recording_paths = sorted(
+        path
+        for pattern in RECORDING_PATTERNS
+        for path in glob.glob(os.path.join(args.recordings, pattern))
+    )
+    if not recording_paths:
+        parser.error(f"no recordings found in {args.recordings}")
+
+    start = time.perf_counter()
+    results = score_recordings(
+        video_path,
+        recording_paths,
+        model_path=args.model,
+        workers=args.workers,
+        threshold=args.threshold,
+        sample_rate=args.sample_rate or None,
+        flip=not args.no_flip,
+        track_pose=args.track_pose,
+        min_score=args.min_score or None,
+        dtw=args.dtw,
+    )
+    elapsed = time.perf_counter() - start
+
+    with open(args.output, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(
+            file,
+            fieldnames=["recording", "score", "samples", "seconds", "error"],
+        )
+        writer.writeheader()
+        writer.writerows(results)
+
+    print(
+        f"Scored {len(results)} recordings with {args.workers} workers in"
+        f" {elapsed:.1f} s ({len(results) / elapsed * 60:.1f} videos/min),"
+        f" results in {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
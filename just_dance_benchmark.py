@@ -0,0 +1,583 @@
+"""
+Time the performance-critical parts of the Just Dance game and write the
+results as JSON, to compare releases on the same machine
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import numpy as np
+import cv2
+from keypoint import JOINTS, JOINT_TRIPLETS
+from just_dance_angles import AngleBuffer
+from just_dance_controller import JustDanceController
+from just_dance_metrics import DISABLED_METRICS, PipelineMetrics
+from just_dance_model import JustDanceModel
+from just_dance_scoring import IncrementalScorer
+from just_dance_stations import padded_batch_size
+from just_dance_workers import InferencePool, PooledModel
+from just_dance_score import (
+    get_current_score,
+    get_leaderboard_scores,
+    summary_path,
+)
+import just_dance_leaderboard
+
+VIDEO_PATH = "test/test.mp4"
+MODEL_PATH = "model/model.tflite"
+LEADERBOARD_ROWS = (10, 10_000, 1_000_000)
+
+
+def time_calls(function, repeat, warmup=1):
+    """
+    Call a function repeatedly and return statistics of its run time
+
+    Args:
+        function: A function taking no arguments
+        repeat: An integer representing the number of timed calls
+        warmup: An integer representing the number of calls made first
+            and not timed
+
+    Returns:
+        A dictionary of the number of calls and the mean, median, 95th
+        percentile and minimum time per call in milliseconds
+    """
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        times.append((time.perf_counter_ns() - start) / 1e6)
+    times.sort()
+    return {
+        "calls": repeat,
+        "mean_ms": statistics.fmean(times),
+        "median_ms": statistics.median(times),
+        "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+        "min_ms": times[0],
+    }
+
+
+def read_frames(video_path=VIDEO_PATH, max_frames=None):
+    """
+    Read the frames of a video into memory, so decoding is not timed
+
+    Args:
+        video_path: A string representing the path to the video
+        max_frames: An integer representing the most frames to read, or
+            None for all of them
+
+    Returns:
+        A list of `numpy.ndarray` objects representing the frames
+    """
+    capture = cv2.VideoCapture(video_path)  # pylint: disable=no-member
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        success, frame = capture.read()
+        if not success:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def benchmark_inference(model, video_frames, camera_frames):
+    """
+    Time the pose model on the video frames and the camera frames, one
+    frame at a time, in batches of 4 and in batches of 1 to 4 frames
+
+    Args:
+        model: A `JustDanceModel` object
+        video_frames: A list of frames standing in for the song video
+        camera_frames: A list of frames standing in for the camera
+
+    Returns:
+        A tuple of a dictionary of timings and two arrays of shape Nx17x3
+        of the key points of the video and camera frames
+    """
+    inputs = [model.prepare_input(frame) for frame in camera_frames]
+    frames = iter(camera_frames * 2)
+    prepared = iter(inputs * 2)
+    results = {
+        "prepare_input": time_calls(
+            lambda: model.prepare_input(next(frames)), len(camera_frames) - 1
+        ),
+        "run_inference": time_calls(
+            lambda: model.run_inference(next(prepared)), len(inputs) - 1
+        ),
+        # Several stations' frames in one call, as `just_dance_stations`
+        # runs them; one call per frame if the model has a fixed batch size
+        "run_batch_4": time_calls(
+            lambda: model.run_batch(inputs[:4]), len(inputs) // 4
+        ),
+    }
+    results["run_batch_4"]["supports_batch"] = model.supports_batch
+    # The stations' batches vary in length with the load, and are padded
+    # to a power of two as the inference server pads them
+    sizes = iter([1, 3, 2, 4] * len(inputs))
+
+    def run_padded_batch():
+        size = next(sizes)
+        model.run_batch(inputs[:size], batch_size=padded_batch_size(size, 4))
+
+    results["run_batch_1_to_4"] = time_calls(run_padded_batch, len(inputs) // 4)
+
+    def key_points(frames):
+        return np.array(
+            [
+                np.squeeze(model.run_inference(model.prepare_input(frame)))
+                for frame in frames
+            ]
+        )
+
+    return results, key_points(video_frames), key_points(camera_frames)
+
+
+def benchmark_processes(model, camera_frames, num_workers):
+    """
+    Time the pose model end to end, from a camera frame to its key points,
+    in this process and in an `InferencePool` of worker processes
+
+    Args:
+        model: A `JustDanceModel` object
+        camera_frames: A list of frames standing in for the camera
+        num_workers: An integer representing the number of worker processes
+
+    Returns:
+        A dictionary of the timings of one frame at a time and of all the
+        frames at once, the frames per second, the seconds taken to start
+        the pool, and the largest difference between the key points of
+        both
+    """
+    start = time.perf_counter()
+    pool = InferencePool(model.model_path, num_workers=num_workers)
+    start_seconds = time.perf_counter() - start
+    pooled = PooledModel(pool)
+    try:
+        results = {"workers": num_workers, "start_s": start_seconds}
+        for name, runner in (("in_process", model), ("pool", pooled)):
+            frames = iter(camera_frames * 2)
+            results[f"{name}_frame"] = time_calls(
+                lambda runner=runner, frames=frames: runner.run_inference(
+                    runner.prepare_input(next(frames))
+                ),
+                len(camera_frames) - 1,
+            )
+            # Every frame queued at once, as a pool of stations would
+            results[f"{name}_all_frames"] = time_calls(
+                lambda runner=runner: runner.run_batch(
+                    [runner.prepare_input(frame) for frame in camera_frames]
+                ),
+                3,
+            )
+            results[f"{name}_frames_per_second"] = len(camera_frames) / (
+                results[f"{name}_all_frames"]["median_ms"] / 1000
+            )
+        inputs = [model.prepare_input(frame) for frame in camera_frames[:8]]
+        results["max_difference"] = max(
+            float(
+                np.abs(
+                    pooled.run_inference(image) - model.run_inference(image)
+                ).max()
+            )
+            for image in inputs
+        )
+    finally:
+        pool.close()
+    return results
+
+
+def benchmark_angles(key_points, frame):
+    """
+    Time the angle calculation of the key points of every frame
+
+    Args:
+        key_points: An array of shape Nx17x3 of key points
+        frame: A `numpy.ndarray` object with the shape of the frames
+
+    Returns:
+        A dictionary of timings of `calculate_angle` for one angle,
+        `store_angles` for one frame, and `calculate_angles` for every
+        frame at once
+    """
+    rows = iter(np.concatenate([key_points, key_points]))
+    buffer = AngleBuffer()
+    return {
+        "calculate_angle": time_calls(
+            lambda: JustDanceModel.calculate_angle(
+                frame, key_points[0], *JOINT_TRIPLETS[0]
+            ),
+            len(key_points),
+        ),
+        "store_angles": time_calls(
+            lambda: JustDanceModel.store_angles(buffer, frame, next(rows)),
+            len(key_points) - 1,
+        ),
+        "calculate_angles_all_frames": time_calls(
+            lambda: JustDanceModel.calculate_angles(key_points, frame.shape),
+            10,
+        ),
+    }
+
+
+def benchmark_scoring(angles_video, angles_camera):
+    """
+    Time the scoring of a game's angles
+
+    Args:
+        angles_video: An `AngleBuffer` of the video angles
+        angles_camera: An `AngleBuffer` of the camera angles
+
+    Returns:
+        A dictionary of timings of `score_calculator` for one joint,
+        `final_score`, and `IncrementalScorer.update` for one frame
+    """
+    scorer = IncrementalScorer()
+    rows = iter(
+        list(zip(angles_video.array, angles_camera.array))
+        * (2 + 1000 // max(1, angles_video.num_frames))
+    )
+    return {
+        "samples": angles_video.num_frames,
+        "score_calculator": time_calls(
+            lambda: JustDanceModel.score_calculator(
+                angles_video[JOINTS[0]], angles_camera[JOINTS[0]], 20
+            ),
+            100,
+        ),
+        "final_score": time_calls(
+            lambda: JustDanceModel.final_score(angles_video, angles_camera, 20),
+            100,
+        ),
+        "incremental_update": time_calls(
+            lambda: scorer.update(*next(rows)), 1000
+        ),
+    }
+
+
+def benchmark_compositing(video_frames, camera_frames, sizes):
+    """
+    Time drawing a video frame, a camera frame and the score into the game
+    window's canvas, like `process_frames` does for every frame
+
+    Args:
+        video_frames: A list of frames standing in for the song video
+        camera_frames: A list of frames standing in for the camera
+        sizes: A list of (width, height) tuples of window sizes
+
+    Returns:
+        A dictionary of timings by window size
+    """
+    camera = cv2.VideoCapture(VIDEO_PATH)  # pylint: disable=no-member
+    controller = JustDanceController(None, VIDEO_PATH, camera=camera)
+    results = {}
+    for width, height in sizes:
+        controller.compositor.resize((width, height))
+        pairs = iter(list(zip(video_frames, camera_frames)) * 2)
+        results[f"{width}x{height}"] = time_calls(
+            lambda pairs=pairs: controller.compose_frames(*next(pairs)),
+            len(video_frames) - 1,
+        )
+    controller.release_capture()
+    camera.release()
+    return results
+
+
+def benchmark_metrics():
+    """
+    Time timing a stage of the game loop with the metrics disabled, as in
+    every game by default, and enabled
+
+    Returns:
+        A dictionary of timings of a `start` and `lap` pair
+    """
+    metrics = PipelineMetrics()
+    return {
+        "disabled": time_calls(
+            lambda: DISABLED_METRICS.lap("stage", DISABLED_METRICS.start()),
+            10_000,
+        ),
+        "enabled": time_calls(
+            lambda: metrics.lap("stage", metrics.start()), 10_000
+        ),
+    }
+
+
+def benchmark_leaderboard(row_counts, directory):
+    """
+    Time reading the current and top scores of leaderboards of several
+    sizes, as a CSV file and as a SQLite database
+
+    For the CSV file, "cold" reads build the summary from the whole file
+    and "warm" reads use the summary after one more score was appended.
+
+    Args:
+        row_counts: A list of integers representing leaderboard sizes
+        directory: A string representing a directory for the files
+
+    Returns:
+        A dictionary of timings by number of rows
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for rows in row_counts:
+        csv_file = os.path.join(directory, f"leaderboard-{rows}.csv")
+        database = os.path.join(directory, f"leaderboard-{rows}.db")
+        scores = rng.uniform(0, 100, rows).round(1)
+        with open(csv_file, "w", newline="", encoding="utf-8") as file:
+            csv.writer(file).writerows([[0]] + [[score] for score in scores])
+        repeat = 3 if rows >= 100_000 else 20
+
+        def read_cold(csv_file=csv_file):
+            if os.path.exists(summary_path(csv_file)):
+                os.remove(summary_path(csv_file))
+            get_leaderboard_scores(csv_file)
+
+        def append_and_read(csv_file=csv_file):
+            with open(csv_file, "a", newline="", encoding="utf-8") as file:
+                csv.writer(file).writerow([50])
+            get_leaderboard_scores(csv_file)
+
+        import_start = time.perf_counter()
+        just_dance_leaderboard.import_csv(csv_file, database)
+        import_ms = (time.perf_counter() - import_start) * 1000
+
+        results[str(rows)] = {
+            "csv_current_score": time_calls(
+                lambda csv_file=csv_file: get_current_score(csv_file), repeat
+            ),
+            "csv_top_scores_cold": time_calls(read_cold, repeat),
+            "csv_top_scores_warm": time_calls(append_and_read, repeat),
+            "sqlite_import_ms": import_ms,
+            "sqlite_current_score": time_calls(
+                lambda database=database: get_current_score(database), repeat
+            ),
+            "sqlite_top_scores": time_calls(
+                lambda database=database: get_leaderboard_scores(database),
+                repeat,
+            ),
+        }
+    return results
+
+
+def benchmark_dtw(duration=240, frame_rate=30, window_ms=500, lag_ms=200):
+    """
+    Time `JustDanceModel.final_score_dtw` on a whole song sampled at every
+    frame, with the dancer lagging behind the video
+
+    Args:
+        duration: A number representing the length of the song in seconds
+        frame_rate: A number representing the frames per second
+        window_ms: A number representing the DTW window in milliseconds
+        lag_ms: A number representing how far the dancer lags behind the
+            video in milliseconds
+
+    Returns:
+        A dictionary of the number of samples, the total time and time per
+        sample in milliseconds, the frame time, and the scores with and
+        without time warping
+    """
+    rng = np.random.default_rng(0)
+    num_samples = int(duration * frame_rate)
+    lag = int(round(lag_ms / 1000 * frame_rate))
+    video = np.cumsum(rng.normal(0, 15, (num_samples, len(JOINTS))), axis=0)
+    camera = np.roll(video, lag, axis=0) + rng.normal(0, 3, video.shape)
+    angles_video = {joint: video[:, i] for i, joint in enumerate(JOINTS)}
+    angles_camera = {joint: camera[:, i] for i, joint in enumerate(JOINTS)}
+
+    start = time.perf_counter()
+    score = JustDanceModel.final_score_dtw(
+        angles_video, angles_camera, 20, window_ms, frame_rate
+    )
+    total_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "samples": num_samples,
+        "total_ms": total_ms,
+        "per_sample_ms": total_ms / num_samples,
+        "frame_ms": 1000 / frame_rate,
+        "score": float(score),
+        "score_without_dtw": float(
+            JustDanceModel.final_score(angles_video, angles_camera, 20)
+        ),
+    }
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def run_benchmarks(  # pylint: disable=too-many-locals
+    model_path=MODEL_PATH,
+    leaderboard_rows=LEADERBOARD_ROWS,
+    dtw_duration=240,
+    frame_rate=30,
+    window_ms=500,
+    workers=2,
+):
+    """
+    Run every benchmark on the test video
+
+    The test video stands in for both the song video and the camera, with
+    the camera frames mirrored like the live feed. Without the model, the
+    inference is skipped and the later steps use random key points.
+
+    Args:
+        model_path: A string representing the path to the model
+        leaderboard_rows: A list of integers representing the leaderboard
+            sizes to time
+        dtw_duration: A number representing the length in seconds of the
+            song scored with DTW
+        frame_rate: A number representing the frames per second of the
+            song scored with DTW
+        window_ms: A number representing the DTW window in milliseconds
+        workers: An integer representing the number of worker processes to
+            time the model in, or 0 to not time them
+
+    Returns:
+        A dictionary of the environment and the results of every benchmark
+    """
+    video_frames = read_frames()
+    camera_frames = [
+        cv2.flip(frame, 1)  # pylint: disable=no-member
+        for frame in video_frames
+    ]
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,  # pylint: disable=no-member
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "video": VIDEO_PATH,
+            "frames": len(video_frames),
+        },
+    }
+
+    try:
+        model = JustDanceModel(model_path=model_path)
+    except (ImportError, ValueError) as exception:
+        results["inference"] = {"skipped": str(exception)}
+        rng = np.random.default_rng(0)
+        key_points_video = rng.random((len(video_frames), 17, 3))
+        key_points_camera = rng.random((len(video_frames), 17, 3))
+    else:
+        results["environment"]["model"] = model_path
+        results["inference"], key_points_video, key_points_camera = (
+            benchmark_inference(model, video_frames, camera_frames)
+        )
+        if workers:
+            results["inference"]["processes"] = benchmark_processes(
+                model, camera_frames, workers
+            )
+
+    results["angles"] = benchmark_angles(key_points_camera, camera_frames[0])
+
+    angles_video = AngleBuffer()
+    angles_camera = AngleBuffer()
+    for video_row, camera_row in zip(key_points_video, key_points_camera):
+        JustDanceModel.store_angles(angles_video, camera_frames[0], video_row)
+        JustDanceModel.store_angles(angles_camera, camera_frames[0], camera_row)
+    results["scoring"] = benchmark_scoring(angles_video, angles_camera)
+
+    results["compositing"] = benchmark_compositing(
+        video_frames, camera_frames, [(1920, 800), (3840, 1600)]
+    )
+
+    results["metrics"] = benchmark_metrics()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results["leaderboard"] = benchmark_leaderboard(
+            leaderboard_rows, directory
+        )
+
+    results["dtw"] = benchmark_dtw(dtw_duration, frame_rate, window_ms)
+    return results
+
+
+def print_results(results, prefix=""):
+    """
+    Print the median time of every timed step
+
+    Args:
+        results: A dictionary of results from `run_benchmarks`
+        prefix: A string representing the names of the enclosing results
+    """
+    for name, value in results.items():
+        if not isinstance(value, dict) or name == "environment":
+            continue
+        if "skipped" in value:
+            print(f"{prefix + name:44} skipped: {value['skipped']}")
+        elif "median_ms" in value:
+            print(
+                f"{prefix + name:44} {value['median_ms']:10.3f} ms"
+                f"  (p95 {value['p95_ms']:.3f} ms)"
+            )
+        else:
+            print_results(value, f"{prefix}{name}.")
+
+
+def main():
+    """
+    Run the benchmarks, print their results and optionally save them
+    """
+    parser = argparse.ArgumentParser(
+        description="Time the performance-critical parts of Just Dance."
+    )
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument(
+        "--leaderboard-rows",
+        default=",".join(str(rows) for rows in LEADERBOARD_ROWS),
+        help="comma-separated leaderboard sizes to time",
+    )
+    parser.add_argument("--duration", type=float, default=240)
+    parser.add_argument("--frame-rate", type=float, default=30)
+    parser.add_argument("--window-ms", type=float, default=500)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="worker processes to time the model in, 0 to skip",
+    )
+    parser.add_argument("--output", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.model,
+        [int(rows) for rows in args.leaderboard_rows.split(",") if rows],
+        args.duration,
+        args.frame_rate,
+        args.window_ms,
+        args.workers,
+    )
+    print_results(results)
+    dtw = results["dtw"]
+    print(
+        f"DTW scoring of {dtw['samples']} samples:"
+        f" {dtw['total_ms']:.1f} ms in total,"
+        f" {dtw['per_sample_ms'] * 1000:.1f} us per sample"
+        f" (frame time {dtw['frame_ms']:.1f} ms);"
+        f" score {dtw['score']:.0f} with DTW,"
+        f" {dtw['score_without_dtw']:.0f} without"
+    )
+
+    processes = results["inference"].get("processes")
+    if processes:
+        print(
+            "Frame to key points:"
+            f" {processes['in_process_frame']['median_ms']:.2f} ms in this"
+            f" process, {processes['pool_frame']['median_ms']:.2f} ms in"
+            f" {processes['workers']} worker processes;"
+            f" {processes['in_process_frames_per_second']:.0f} and"
+            f" {processes['pool_frames_per_second']:.0f} frames per second"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
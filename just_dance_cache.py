@@ -0,0 +1,164 @@
+"""
+Bake and load precomputed key points for the dance videos, so the pose
+model does not have to run on the same song video every game
+"""
+import argparse
+import glob
+import hashlib
+import os
+import numpy as np
+import cv2
+from just_dance_model import JustDanceModel
+
+CACHE_DIR = "cache"
+
+
+def file_hash(path):
+    """
+    Return the SHA-1 hex digest of a file's contents
+
+    Args:
+        path (str): The path to the file to hash
+
+    Returns:
+        A string of 40 hexadecimal characters
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(
+    video_path,
+    model_path,
+    cache_dir=CACHE_DIR,
+    video_hash=None,
+    model_hash=None,
+):
+    """
+    Return the cache file path for a video processed by a model
+
+    The file name is keyed by the contents of both files, so editing the
+    video or swapping the model never serves stale key points.
+
+    Args:
+        video_path (str): The path to the dance video
+        model_path (str): The path to the TensorFlow Lite model
+        cache_dir (str): The directory holding the cache files
+        video_hash (str): The `file_hash` of the video if already known,
+            such as from the song catalog, to skip reading the video
+        model_hash (str): The `file_hash` of the model if already known
+
+    Returns:
+        A string representing the path of the `.npz` cache file
+    """
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    video_key = (video_hash or file_hash(video_path))[:16]
+    model_key = (model_hash or file_hash(model_path))[:16]
+    return os.path.join(cache_dir, f"{name}-{video_key}-{model_key}.npz")
+
+
+def bake_reference(model, video_path, cache_dir=CACHE_DIR):
+    """
+    Run the model on every frame of a video and save the results
+
+    Stores the key points of every frame as an array of shape Nx17x3, the
+    joint angles of every frame as an array of shape Nx8 (columns in the
+    order of `JOINTS`) and the frame shape of the video.
+
+    Args:
+        model: A `JustDanceModel` object used for pose estimation
+        video_path (str): The path to the dance video
+        cache_dir (str): The directory holding the cache files
+
+    Returns:
+        A string representing the path of the written cache file
+    """
+    capture = cv2.VideoCapture(video_path)  # pylint: disable=no-member
+    key_points = []
+    frame_shape = (0, 0, 3)
+
+    while True:
+        success, frame = capture.read()
+        if not success:
+            break
+        frame_shape = frame.shape
+        key_points.append(
+            np.squeeze(model.run_inference(model.prepare_input(frame)))
+        )
+
+    capture.release()
+
+    key_points = np.reshape(np.array(key_points, dtype=np.float32), (-1, 17, 3))
+    path = cache_path(video_path, model.model_path, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(
+        path,
+        key_points=key_points,
+        angles=model.calculate_angles(key_points, frame_shape).astype(
+            np.float32
+        ),
+        frame_shape=np.array(frame_shape),
+    )
+    return path
+
+
+def load_reference(
+    video_path,
+    model_path,
+    cache_dir=CACHE_DIR,
+    video_hash=None,
+    model_hash=None,
+):
+    """
+    Load the precomputed key points of a video if they have been baked
+
+    Args:
+        video_path (str): The path to the dance video
+        model_path (str): The path to the TensorFlow Lite model
+        cache_dir (str): The directory holding the cache files
+        video_hash (str): The `file_hash` of the video if already known
+        model_hash (str): The `file_hash` of the model if already known
+
+    Returns:
+        A dictionary with the `key_points`, `angles` and `frame_shape`
+        arrays stored by `bake_reference`, or None if there is no cache
+        for this video and model
+    """
+    if not (os.path.exists(video_path) and os.path.exists(model_path)):
+        return None
+
+    path = cache_path(video_path, model_path, cache_dir, video_hash, model_hash)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def main():
+    """
+    Bake the key point cache for the given songs, or every song video
+    """
+    parser = argparse.ArgumentParser(
+        description="Precompute key points for the Just Dance song videos."
+    )
+    parser.add_argument(
+        "videos",
+        nargs="*",
+        help="paths to the videos to bake (default: every songs/*.mp4)",
+    )
+    parser.add_argument("--model", default="model/model.tflite")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    model = JustDanceModel(model_path=args.model)
+    for video_path in args.videos or sorted(glob.glob("songs/*.mp4")):
+        path = bake_reference(model, video_path, args.cache_dir)
+        print(f"{video_path} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Set 'FrameReader' class to read frames from a capture in the background
+"""
+import queue
+import threading
+import cv2
+
+
+class FrameReader(threading.Thread):
+    """
+    A thread that reads frames from an OpenCV capture into a bounded queue
+
+    The video reader blocks when the queue is full so no frame of the
+    dance video is lost, while the camera reader drops the oldest frame
+    so the game always scores the freshest camera image.
+
+    Attributes:
+        capture (object): A VideoCapture object to read frames from
+        frames (queue.Queue): The queue of frames that have been read, with
+            their timestamps in milliseconds, which ends with (None, None)
+            once the capture runs out of frames
+        drop_oldest (bool): Whether to drop the oldest frame when the queue
+            is full instead of waiting for room
+        transform (callable): A function applied to every frame after
+            reading it, or None
+
+    Methods:
+        __init__: Initialize a new `FrameReader` object
+        run: Read frames until the capture ends or the reader is stopped
+        read: Return the next frame from the queue
+        read_latest: Return the newest frame without waiting for one
+        stop: Stop reading frames
+    """
+
+    def __init__(
+        self, capture, max_frames=4, drop_oldest=False, transform=None
+    ):
+        """
+        Initialize a new `FrameReader` object
+
+        Args:
+            capture: A VideoCapture object to read frames from
+            max_frames: An integer representing the size of the queue
+            drop_oldest: A boolean representing whether to drop the oldest
+                frame when the queue is full
+            transform: A function applied to every frame after reading it
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.capture = capture
+        self.frames = queue.Queue(maxsize=max_frames)
+        self.drop_oldest = drop_oldest
+        self.transform = transform
+        self._stopped = threading.Event()
+
+    def run(self):
+        """
+        Read frames until the capture ends or the reader is stopped
+        """
+        while not self._stopped.is_set():
+            success, frame = self.capture.read()
+            if not success:
+                break
+            timestamp = self.capture.get(
+                cv2.CAP_PROP_POS_MSEC  # pylint: disable=no-member
+            )
+            if self.transform is not None:
+                frame = self.transform(frame)
+            self._put((frame, timestamp))
+        self._put((None, None))
+
+    def _put(self, item):
+        """
+        Add a frame to the queue according to the drop policy
+
+        Args:
+            item: A tuple of a `numpy.ndarray` object representing the image
+                frame and its timestamp, or (None, None) to mark the end of
+                the capture
+        """
+        while not self._stopped.is_set():
+            if self.drop_oldest:
+                try:
+                    self.frames.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.frames.get_nowait()
+                    except queue.Empty:
+                        pass
+            else:
+                try:
+                    self.frames.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+    def read(self):
+        """
+        Return the next frame from the queue, waiting for one if needed
+
+        Returns:
+            A tuple of a `numpy.ndarray` object representing the image frame
+            and its timestamp in milliseconds, or (None, None) once the
+            capture has run out of frames
+        """
+        return self.frames.get()
+
+    def read_latest(self, previous):
+        """
+        Return the newest frame, or the previous one if none is waiting
+
+        Only waits for a frame when there is no previous frame to reuse.
+
+        Args:
+            previous: The last (frame, timestamp) tuple returned by the
+                reader, or None
+
+        Returns:
+            A tuple of a `numpy.ndarray` object representing the image frame
+            and its timestamp in milliseconds, or (None, None) once the
+            capture has run out of frames
+        """
+        if previous is None:
+            return self.read()
+        try:
+            return self.frames.get_nowait()
+        except queue.Empty:
+            return previous
+
+    def stop(self):
+        """
+        Stop reading frames and wait for the thread to finish
+        """
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
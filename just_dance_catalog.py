@@ -0,0 +1,372 @@
+"""
+Set 'SongCatalog' class to list the songs and their metadata without
+opening the media files on every launch
+"""
+import argparse
+import glob
+import json
+import os
+import cv2
+from mutagen.mp3 import MP3
+from just_dance_cache import CACHE_DIR, cache_path, file_hash, load_reference
+
+SONGS_DIR = "songs"
+AUDIO_DIR = "songs_audio"
+CATALOG_FILE = os.path.join(CACHE_DIR, "catalog.json")
+
+# Display names of the songs, by file name; songs missing from it are
+# named after their file
+SONG_TITLES_FILE = "song_titles.json"
+
+
+def file_key(path):
+    """
+    Return the size and modification time of a file, to tell whether it
+    changed since it was last read
+
+    Args:
+        path (str): The path to the file
+
+    Returns:
+        A list of the size in bytes and the modification time in
+        nanoseconds, or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def probe_video(video_path):
+    """
+    Read the frame rate, frame count and resolution of a video
+
+    Args:
+        video_path (str): The path to the video
+
+    Returns:
+        A dictionary of the `fps`, `frame_count`, `width` and `height` of
+        the video
+    """
+    capture = cv2.VideoCapture(video_path)  # pylint: disable=no-member
+    info = {
+        "fps": capture.get(cv2.CAP_PROP_FPS),  # pylint: disable=no-member
+        "frame_count": int(
+            capture.get(cv2.CAP_PROP_FRAME_COUNT)  # pylint: disable=no-member
+        ),
+        "width": int(
+            capture.get(cv2.CAP_PROP_FRAME_WIDTH)  # pylint: disable=no-member
+        ),
+        "height": int(
+            capture.get(cv2.CAP_PROP_FRAME_HEIGHT)  # pylint: disable=no-member
+        ),
+    }
+    capture.release()
+    return info
+
+
+class SongCatalog:
+    """
+    A class that keeps an index of the songs in the songs directories
+
+    The index stores the length, frame rate, frame count, resolution and
+    content hash of every song, keyed by the size and modification time of
+    its files. Loading the catalog only lists the directories and checks
+    the file sizes and times; the media files are only opened for songs
+    that were added or changed since the index was written. Adding a song
+    only takes copying its video and audio into the songs directories.
+
+    Attributes:
+        songs_dir (str): The directory of the song videos
+        audio_dir (str): The directory of the song audio files
+        index_path (str): The path of the index file
+        model_path (str): The path to the model the reference cache is
+            checked for
+        cache_dir (str): The directory of the reference cache
+        songs (dict): A dictionary mapping each song name to its entry
+        model (dict): The size, modification time and hash of the model
+
+    Methods:
+        __init__: Initialize a new `SongCatalog` object
+        refresh: Update the index from the songs directories
+        titles: Return the song names by display name
+        song_length: Return the length of a song in seconds
+        video_path: Return the path to the video of a song
+        audio_path: Return the path to the audio of a song
+        load_reference: Load the baked key points of a song
+    """
+
+    def __init__(
+        self,
+        songs_dir=SONGS_DIR,
+        audio_dir=AUDIO_DIR,
+        index_path=CATALOG_FILE,
+        model_path=None,
+        cache_dir=CACHE_DIR,
+    ):
+        """
+        Initialize a new `SongCatalog` object and bring its index up to
+        date
+
+        Args:
+            songs_dir: A string representing the directory of the videos
+            audio_dir: A string representing the directory of the audio
+            index_path: A string representing the path of the index file
+            model_path: A string representing the path to the model whose
+                reference cache is checked, or None to not check it
+            cache_dir: A string representing the directory of the cache
+        """
+        self.songs_dir = songs_dir
+        self.audio_dir = audio_dir
+        self.index_path = index_path
+        self.model_path = model_path
+        self.cache_dir = cache_dir
+        self.songs = {}
+        self.model = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Update the index from the songs directories
+
+        Keeps the entries of unchanged songs, reads the media files of new
+        or changed songs, and writes the index back if anything changed.
+        """
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            index = {}
+        old_songs = index.get("songs", {})
+        titles = self._read_titles()
+
+        names = {
+            os.path.splitext(os.path.basename(path))[0]
+            for pattern in (
+                os.path.join(self.songs_dir, "*.mp4"),
+                os.path.join(self.audio_dir, "*.mp3"),
+            )
+            for path in glob.glob(pattern)
+        }
+        self.songs = {}
+        for name in sorted(names):
+            entry = old_songs.get(name)
+            video_key = file_key(self.video_path(name))
+            audio_key = file_key(self.audio_path(name))
+            if (
+                entry is None
+                or entry.get("video_key") != video_key
+                or entry.get("audio_key") != audio_key
+            ):
+                entry = self._probe(name, video_key, audio_key)
+            entry["title"] = titles.get(name, name.replace("_", " ").title())
+            self.songs[name] = entry
+
+        self.model = index.get("model")
+        if self.model_path is not None:
+            model_key = file_key(self.model_path)
+            if model_key is None:
+                self.model = None
+            elif self.model is None or self.model.get("key") != model_key:
+                self.model = {
+                    "key": model_key,
+                    "hash": file_hash(self.model_path),
+                }
+        for name, entry in self.songs.items():
+            entry["cached"] = self._is_cached(name, entry)
+
+        new_index = {"songs": self.songs, "model": self.model}
+        if new_index != index:
+            self._write_index(new_index)
+
+    def _read_titles(self):
+        """
+        Read the display names of the songs
+
+        Returns:
+            A dictionary mapping song names to display names
+        """
+        try:
+            with open(SONG_TITLES_FILE, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _probe(self, name, video_key, audio_key):
+        """
+        Read the metadata of a song from its media files
+
+        Args:
+            name: A string representing the name of the song
+            video_key: The `file_key` of the video, None if it is missing
+            audio_key: The `file_key` of the audio, None if it is missing
+
+        Returns:
+            A dictionary of the metadata of the song
+        """
+        entry = {
+            "video_key": video_key,
+            "audio_key": audio_key,
+            "duration": None,
+            "fps": None,
+            "frame_count": None,
+            "width": None,
+            "height": None,
+            "video_hash": None,
+        }
+        if video_key is not None:
+            entry.update(probe_video(self.video_path(name)))
+            entry["video_hash"] = file_hash(self.video_path(name))
+            if entry["fps"]:
+                entry["duration"] = entry["frame_count"] / entry["fps"]
+        if audio_key is not None:
+            entry["duration"] = MP3(self.audio_path(name)).info.length
+        return entry
+
+    def _is_cached(self, name, entry):
+        """
+        Return whether the key points of a song have been baked for the
+        model
+
+        Args:
+            name: A string representing the name of the song
+            entry: A dictionary of the metadata of the song
+
+        Returns:
+            A boolean, or None if there is no model or video to check
+        """
+        if self.model is None or entry["video_hash"] is None:
+            return None
+        return os.path.exists(
+            cache_path(
+                self.video_path(name),
+                self.model_path,
+                self.cache_dir,
+                entry["video_hash"],
+                self.model["hash"],
+            )
+        )
+
+    def _write_index(self, index):
+        """
+        Write the index file in one step, so a reader never sees half of it
+
+        Args:
+            index: A dictionary of the index to write
+        """
+        directory = os.path.dirname(self.index_path)
+        temporary_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(index, file, indent=1)
+            os.replace(temporary_path, self.index_path)
+        except OSError:
+            pass
+
+    def titles(self):
+        """
+        Return the songs that have both a video and audio, by display name
+
+        Returns:
+            A dictionary mapping display names to song names, sorted by
+            display name
+        """
+        return {
+            entry["title"]: name
+            for name, entry in sorted(
+                self.songs.items(), key=lambda item: item[1]["title"]
+            )
+            if entry["video_key"] is not None and entry["audio_key"] is not None
+        }
+
+    def song_length(self, name):
+        """
+        Return the length of a song in seconds
+
+        Args:
+            name: A string representing the name of the song
+
+        Returns:
+            An integer number of seconds, 0 if it is not known
+        """
+        return int(self.songs[name]["duration"] or 0)
+
+    def video_path(self, name):
+        """
+        Return the path to the video of a song
+
+        Args:
+            name: A string representing the name of the song
+
+        Returns:
+            A string representing the path
+        """
+        return os.path.join(self.songs_dir, name + ".mp4")
+
+    def audio_path(self, name):
+        """
+        Return the path to the audio of a song
+
+        Args:
+            name: A string representing the name of the song
+
+        Returns:
+            A string representing the path
+        """
+        return os.path.join(self.audio_dir, name + ".mp3")
+
+    def load_reference(self, name):
+        """
+        Load the baked key points of a song for the catalog's model,
+        without hashing the video or the model again
+
+        Args:
+            name: A string representing the name of the song
+
+        Returns:
+            The dictionary returned by `just_dance_cache.load_reference`, or
+            None if the song has not been baked for the model
+        """
+        entry = self.songs.get(name)
+        if not (entry and entry["cached"]):
+            return None
+        return load_reference(
+            self.video_path(name),
+            self.model_path,
+            self.cache_dir,
+            entry["video_hash"],
+            self.model["hash"],
+        )
+
+
+def main():
+    """
+    Update the song catalog and print it
+    """
+    parser = argparse.ArgumentParser(
+        description="Index the Just Dance songs and print the catalog."
+    )
+    parser.add_argument("--model", default="model/model.tflite")
+    args = parser.parse_args()
+
+    catalog = SongCatalog(model_path=args.model)
+    for name, entry in catalog.songs.items():
+        video = (
+            f"{entry['width']}x{entry['height']} {entry['fps']:.0f} fps"
+            f" {entry['frame_count']} frames"
+            if entry["video_key"]
+            else "no video"
+        )
+        audio = "audio" if entry["audio_key"] else "no audio"
+        cached = {True: "baked", False: "not baked", None: "-"}
+        print(
+            f"{name:16} {entry['title']:20} {catalog.song_length(name):4d} s"
+            f"  {video}, {audio}, {cached[entry['cached']]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
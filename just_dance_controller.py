@@ -1,37 +1,111 @@
 """
 Set 'JustDanceController' class for the application
 """
-import sys
+import queue
+import threading
 import time
 import numpy as np
 import cv2
 from playsound import playsound
-from just_dance_view import JustDanceView
+from keypoint import MIN_KEYPOINT_SCORE
+from just_dance_view import JustDanceView, FrameCompositor
+from just_dance_capture import FrameReader
+from just_dance_angles import AngleBuffer
+from just_dance_metrics import DISABLED_METRICS
+from just_dance_recording import KeypointRecorder
+from just_dance_scoring import IncrementalScorer, MultiPlayerScorer
+from just_dance_timing import (
+    MULTI_PLAYER_SAMPLE_RATE,
+    TRACKING_SAMPLE_RATE,
+    FrameSampler,
+    MediaClock,
+)
+from just_dance_tracking import PlayerTracker, PoseTracker
 
+WINDOW_NAME = "Just Dance"
 
-class JustDanceController:
+
+class JustDanceController:  # pylint: disable=too-many-instance-attributes
     """A class that controls the execution of the Just Dance game.
 
     Attributes:
         model (object): A JustDanceModel object used to run inference on frames
         view (object): A JustDanceView object used to visualize the game
-        angles_video (dict): A dictionary containing the angles of the body
-            parts detected in the video frames
-        angles_camera (dict): A dictionary containing the angles of the body
-            parts detected in the camera frames
+        angles_video (AngleBuffer): An array of the angles of the body
+            parts detected in the video frames, indexable by joint name
+        angles_camera (AngleBuffer): An array of the angles of the body
+            parts detected in the camera frames, indexable by joint name
         cap1 (object): A VideoCapture object for the video file
         cap2 (object): A VideoCapture object for the camera
+        owns_camera (bool): Whether the controller opened the camera and
+            releases it when done
+        reference (ndarray): Precomputed key points for every frame of the
+            video, or None to run the model on the video frames
+        threaded (bool): Whether to read, score and display the frames
+            in separate threads
+        scorer (IncrementalScorer): The running score of the player
+        sampler (FrameSampler): The object choosing the frames to score
+        compositor (FrameCompositor): The canvas the frames are drawn on
+        window_open (bool): Whether the game window has been created
+        clock (MediaClock): The clock the video follows, started with the
+            music
+        tracker (PoseTracker): The tracker cropping the camera frames
+            around the player, or None to squash the whole frame into the
+            model input
+        min_score (float): The lowest key point score an angle is scored
+            from, or None to score every angle
+        stopped (threading.Event): Set when the game is stopped before the
+            end of the song
+        metrics (PipelineMetrics): The timings of the stages of the game
+            loop, disabled unless given
+        recorder (KeypointRecorder): The file the camera key points of the
+            scored frames are saved to, or None to not save them
+        players (PlayerTracker): The tracker telling the players apart in a
+            multi-player game, or None for a single player
+        player_scorer (MultiPlayerScorer): The angles and running scores of
+            every player in a multi-player game, or None for a single player
+        display (bool): Whether to show the frames in the game window
+        window (FrameDisplay): The display another thread shows the frames
+            from, or None to show them from the thread playing the game
 
     Methods:
         __init__: Initialize a new `JustDanceController` object
         process_frame: Process a single frame of the video or camera capture
+        process_camera_frame: Process a camera frame, tracking the player
         process_frames: Process the frames from the video and camera capture
-        release_capture: Release the video and camera captures
+        process_frames_threaded: Process the frames in a threaded pipeline
+        score_frames: Store the angles of a pair of frames
+        score_players: Store the angles of every player in a pair of frames
+        show_frames: Display the video and camera frames and the score
+        handle_events: Handle the window's events and the 'q' key
+        wait_for_frame: Wait until a frame is due on the clock
+        compose_frames: Draw the video and camera frames and the score
+        reference_key_points: Return the key points of a video frame
+        stop: Stop processing frames before the end of the song
+        release_capture: Release the video and (if owned) camera captures
         close_windows: Close all open windows
         play_sound: Play a sound file
     """
 
-    def __init__(self, model, video_path, camera_index=0):
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(  # pylint: disable=too-many-locals
+        self,
+        model,
+        video_path,
+        camera_index=0,
+        reference=None,
+        threaded=False,
+        threshold=20,
+        camera=None,
+        sampler=None,
+        track_pose=False,
+        min_score=MIN_KEYPOINT_SCORE,
+        metrics=None,
+        record_path=None,
+        multi_player=False,
+        display=True,
+        window=None,
+    ):
         """
         Initialize a new `JustDanceController` object
 
@@ -39,34 +113,90 @@ class JustDanceController:
             model: A `JustDanceModel` object used for pose estimation
             video_path: A string representing the path to the video file
             camera_index: An integer representing the index of the camera
+            reference: A `numpy.ndarray` of shape Nx17x3 holding the key
+                points of every video frame, as baked by `just_dance_cache`
+            threaded: A boolean representing whether to read, score and
+                display the frames in separate threads
+            threshold: An integer representing the angle difference up to
+                which a joint counts as being in the correct position
+            camera: An open `cv2.VideoCapture` object to read the camera
+                from instead of opening `camera_index`; it is left open by
+                `release_capture`
+            sampler: A `FrameSampler` object choosing the frames to score,
+                `DEFAULT_SAMPLE_RATE` samples per second if None
+            track_pose: A boolean representing whether to crop the camera
+                frames around the player using the key points of the
+                previous frame; sampled `TRACKING_SAMPLE_RATE` times per
+                second by default
+            min_score: A number representing the lowest key point score an
+                angle is scored from, or None to score every angle; the
+                angles of joints that are hidden or out of the frame are
+                left out of the score
+            metrics: A `PipelineMetrics` object to time the stages of the
+                game loop with, or None to not time them; its summary is
+                written by `release_capture`
+            record_path: A string representing the file to save the camera
+                key points of the scored frames to, for
+                `just_dance_batch.replay_recording`, or None to not save
+                them
+            multi_player: A boolean representing whether to score everyone
+                in front of the camera, up to 6 players, with one inference
+                of the MoveNet MultiPose model per frame; sampled
+                `MULTI_PLAYER_SAMPLE_RATE` times per second by default
+            display: A boolean representing whether to show the frames in
+                the game window, False to run the game without a screen
+            window: A `FrameDisplay` object to post the frames to, for the
+                thread that owns the GUI to show, or None to show them from
+                the thread playing the game
+
+        Raises:
+            ValueError: If `multi_player` is set without a MultiPose model,
+                or together with `track_pose` or `record_path`, which follow
+                a single player
         """
+        if multi_player:
+            if not getattr(model, "multi_pose", False):
+                raise ValueError("multi-player games need a MultiPose model")
+            if track_pose or record_path is not None:
+                raise ValueError(
+                    "track_pose and record_path follow a single player"
+                )
+            if sampler is None:
+                sampler = FrameSampler(MULTI_PLAYER_SAMPLE_RATE)
+        elif track_pose and sampler is None:
+            sampler = FrameSampler(TRACKING_SAMPLE_RATE)
         self.model = model
+        self.reference = reference
+        self.threaded = threaded
         self.view = JustDanceView(model=self.model)
-        self.angles_video = {
-            "left_arm": [],
-            "right_arm": [],
-            "left_elbow": [],
-            "right_elbow": [],
-            "left_thigh": [],
-            "right_thigh": [],
-            "left_leg": [],
-            "right_leg": [],
-        }
-        self.angles_camera = {
-            "left_arm": [],
-            "right_arm": [],
-            "left_elbow": [],
-            "right_elbow": [],
-            "left_thigh": [],
-            "right_thigh": [],
-            "left_leg": [],
-            "right_leg": [],
-        }
+        self.compositor = FrameCompositor()
+        self.window_open = False
+        self.angles_video = AngleBuffer()
+        self.angles_camera = AngleBuffer()
+        self.scorer = IncrementalScorer(threshold)
+        self.sampler = FrameSampler() if sampler is None else sampler
+        self.tracker = PoseTracker(model.input_size) if track_pose else None
+        self.min_score = min_score
+        self.stopped = threading.Event()
+        self.metrics = DISABLED_METRICS if metrics is None else metrics
+        self.recorder = (
+            None if record_path is None else KeypointRecorder(record_path)
+        )
+        self.players = PlayerTracker() if multi_player else None
+        self.display = display
+        self.window = window
+        self.player_scorer = (
+            MultiPlayerScorer(threshold=threshold) if multi_player else None
+        )
         self.cap1 = cv2.VideoCapture(video_path)  # pylint: disable=no-member
-        self.cap2 = cv2.VideoCapture(camera_index)  # pylint: disable=no-member
+        self.owns_camera = camera is None
+        if self.owns_camera:
+            camera = cv2.VideoCapture(camera_index)  # pylint: disable=no-member
+        self.cap2 = camera
         self.frame1_rate = self.cap1.get(
             cv2.CAP_PROP_FPS
         )  # pylint: disable=no-member
+        self.clock = MediaClock(self.frame1_rate)
 
     def process_frame(self, frame):
         """
@@ -79,86 +209,413 @@ class JustDanceController:
             key_points_with_scores: A `numpy.ndarray` object
                 representing the key points with scores
         """
-        img = cv2.resize(frame, (192, 192))  # pylint: disable=no-member
-        img = np.expand_dims(img, axis=0)
+        img = self.model.prepare_input(frame)
         key_points_with_scores = self.model.run_inference(img)
         return key_points_with_scores
 
+    def process_camera_frame(self, frame, timestamp=None):
+        """
+        Process a camera frame, cropped around the player when tracking
+
+        Args:
+            frame: A `numpy.ndarray` object representing the camera frame
+            timestamp: A number representing the position of the frame in
+                milliseconds, for the tracker to drop a crop that is too
+                old, or None to always use the last crop
+
+        Returns:
+            key_points_with_scores: A `numpy.ndarray` object
+                representing the key points with scores, normalized to the
+                whole frame
+        """
+        if self.tracker is None:
+            return self.process_frame(frame)
+        return self.tracker.run(self.model, frame, timestamp)
+
     def process_frames(self):
         """
         Process the frames from the video and camera capture
+
+        Each frame is shown when the clock says it is due, and frames that
+        are already late are skipped so the video keeps up with the music.
         """
-        counter = 0
+        if self.threaded:
+            self.process_frames_threaded()
+            return
+
+        frame_index = -1
+        metrics = self.metrics
+        self.clock.start()
+
+        while self.cap1.isOpened() and not self.stopped.is_set():
+            frame_start = start = metrics.start()
+            # Skip the frames that are already late, without decoding them
+            behind = self.clock.frames_behind(frame_index + 1)
+            if behind > 0:
+                for _ in range(behind):
+                    self.cap1.grab()
+                frame_index += behind
+                self.clock.record_dropped(behind)
+                metrics.increment("frames_dropped", behind)
 
-        while self.cap1.isOpened():
-            start_time = time.time()
             _, frame1 = self.cap1.read()
             _, frame2 = self.cap2.read()
+
+            if frame1 is None or frame2 is None:
+                break
+
             frame2 = cv2.flip(frame2, 1)  # pylint: disable=no-member
+            frame_index += 1
+            timestamp = self.cap1.get(
+                cv2.CAP_PROP_POS_MSEC  # pylint: disable=no-member
+            )
+            metrics.lap("decode", start)
 
-            if counter == 0:
-                key_points_with_scores_video = self.process_frame(frame1)
-                key_points_with_scores_camera = self.process_frame(frame2)
+            if self.sampler.should_sample(timestamp):
+                self.score_frames(frame_index, frame1, frame2, timestamp)
 
-                self.model.store_angles(
-                    self.angles_video, frame2, key_points_with_scores_video
-                )
-                self.model.store_angles(
-                    self.angles_camera, frame2, key_points_with_scores_camera
-                )
+            self.wait_for_frame(frame_index)
+            self.show_frames(frame1, frame2)
+            metrics.lap("frame", frame_start)
+            metrics.tick()
 
-            counter = (counter + 1) % 100
+    def process_frames_threaded(self):
+        """
+        Process the frames from the video and camera capture in a pipeline
 
-            if frame1 is not None and frame2 is not None:
-                # Get the dimensions of frame1 and frame2
-                height1, _, _ = frame1.shape
-                height2, width2, _ = frame2.shape
-            else:
-                break
+        One thread reads the video, one reads the camera and one runs the
+        pose model, while this thread displays the frames on time. The
+        camera reader and the inference worker drop their oldest item when
+        they fall behind, so a slow step never stalls the video.
+        """
+        video_reader = FrameReader(self.cap1)
+        camera_reader = FrameReader(
+            self.cap2,
+            max_frames=1,
+            drop_oldest=True,
+            transform=lambda frame: cv2.flip(  # pylint: disable=no-member
+                frame, 1
+            ),
+        )
+        jobs = queue.Queue(maxsize=2)
+        worker = threading.Thread(
+            target=self._inference_worker, args=(jobs,), daemon=True
+        )
+        video_reader.start()
+        camera_reader.start()
+        worker.start()
+
+        frame_index = -1
+        camera_item = None
+        metrics = self.metrics
+        self.clock.start()
+
+        try:
+            while not self.stopped.is_set():
+                # The readers decode in their own threads, so this only
+                # times how long the loop waits for them
+                frame_start = metrics.start()
+                frame1, timestamp = video_reader.read()
+                camera_item = camera_reader.read_latest(camera_item)
+                frame2 = camera_item[0]
+
+                if frame1 is None or frame2 is None:
+                    break
+
+                frame_index += 1
+                metrics.lap("decode", frame_start)
+
+                if self.sampler.should_sample(timestamp):
+                    self._put_job(
+                        jobs, (frame_index, frame1, frame2, timestamp)
+                    )
+
+                # The reader has already decoded late frames, so only their
+                # display is skipped; the window still handles its events,
+                # so it keeps responding and 'q' works while behind
+                if self.clock.frames_behind(frame_index) > 0:
+                    self.clock.record_dropped()
+                    metrics.increment("frames_dropped")
+                    self.handle_events()
+                    continue
+
+                self.wait_for_frame(frame_index)
+                self.show_frames(frame1, frame2)
+                metrics.lap("frame", frame_start)
+                metrics.tick()
+        finally:
+            video_reader.stop()
+            camera_reader.stop()
+            jobs.put(None)
+            worker.join()
+
+    @staticmethod
+    def _put_job(jobs, job):
+        """
+        Queue a job for the inference worker, dropping the oldest if full
+
+        Args:
+            jobs: A `queue.Queue` object holding the pending jobs
+            job: A tuple of the frame index, video frame, camera frame and
+                video timestamp
+        """
+        while True:
+            try:
+                jobs.put_nowait(job)
+                return
+            except queue.Full:
+                try:
+                    jobs.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _inference_worker(self, jobs):
+        """
+        Score the frames queued by `process_frames_threaded` until None
+
+        Args:
+            jobs: A `queue.Queue` object holding the pending jobs
+        """
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            self.score_frames(*job)
+
+    def score_frames(self, frame_index, frame1, frame2, timestamp=None):
+        """
+        Run the pose model on a pair of frames and store their angles
+
+        Args:
+            frame_index: An integer representing the index of the frame
+                in the video
+            frame1: A `numpy.ndarray` object representing the video frame
+            frame2: A `numpy.ndarray` object representing the camera frame
+            timestamp: A number representing the position of the video
+                frame in milliseconds, saved with the key points when
+                recording and used to age the crop when tracking; taken
+                from the frame rate if None
+        """
+        if self.players is not None:
+            self.score_players(frame_index, frame1, frame2)
+            return
 
-            # Resize frame2 to have the same height as frame1
-            if height1 != height2:
-                scale_factor = height1 / height2
-                width2 = int(width2 * scale_factor)
-                height2 = height1
-                frame2 = cv2.resize(
-                    frame2, (width2, height2)
-                )  # pylint: disable=no-member
-
-            # Combine the video and camera frames horizontally
-            combined_frame = np.concatenate((frame1, frame2), axis=1)
-
-            # Resize the combined frame to fit the window size
-            combined_frame = cv2.resize(  # pylint: disable=no-member
-                combined_frame,
-                (3840, 1600),
-                interpolation=cv2.INTER_LINEAR,  # pylint: disable=no-member
+        if timestamp is None:
+            timestamp = frame_index * 1000 / self.clock.frame_rate
+        start = self.metrics.start()
+        start_time = time.perf_counter()
+        key_points_with_scores_video = self.reference_key_points(
+            frame_index, frame1
+        )
+        key_points_with_scores_camera = self.process_camera_frame(
+            frame2, timestamp
+        )
+        self.sampler.record(time.perf_counter() - start_time)
+        start = self.metrics.lap("inference", start)
+
+        if self.recorder is not None:
+            self.recorder.append(
+                frame_index,
+                timestamp,
+                key_points_with_scores_camera,
+                frame2.shape,
             )
 
-            # Display the combined frame in a named window
-            cv2.namedWindow(
-                "Just Dance", cv2.WINDOW_NORMAL
-            )  # pylint: disable=no-member
-            cv2.imshow(
-                "Just Dance", combined_frame
-            )  # pylint: disable=no-member
-
-            if cv2.waitKey(1) & 0xFF == ord("q"):  # pylint: disable=no-member
-                # Exit program if 'q' key is pressed
-                sys.exit()
-
-            elapsed_time = time.time() - start_time
-            frame_delay = max(
-                1, int(1000 / self.frame1_rate) - int(elapsed_time * 1000)
+        self.model.store_angles(
+            self.angles_video,
+            frame2,
+            key_points_with_scores_video,
+            self.min_score,
+        )
+        self.model.store_angles(
+            self.angles_camera,
+            frame2,
+            key_points_with_scores_camera,
+            self.min_score,
+        )
+        self.scorer.update(
+            self.angles_video.array[-1], self.angles_camera.array[-1]
+        )
+        self.metrics.lap("angles", start)
+
+    def score_players(self, frame_index, frame1, frame2):
+        """
+        Run the MultiPose model on a camera frame and score every player
+
+        The people detected are matched to players by their boxes, and the
+        angles of every player are scored against the video in one batch.
+
+        Args:
+            frame_index: An integer representing the index of the frame
+                in the video
+            frame1: A `numpy.ndarray` object representing the video frame
+            frame2: A `numpy.ndarray` object representing the camera frame
+        """
+        start = self.metrics.start()
+        start_time = time.perf_counter()
+        key_points_with_scores_video = self.reference_key_points(
+            frame_index, frame1
+        )
+        key_points, boxes = self.model.detect_people(
+            self.model.prepare_input(frame2)
+        )
+        self.sampler.record(time.perf_counter() - start_time)
+        start = self.metrics.lap("inference", start)
+
+        slots, joined = self.players.update(boxes)
+        self.player_scorer.reset_players(joined)
+        in_game = slots >= 0
+        angles_players = np.full(
+            self.player_scorer.hits.shape, np.nan, dtype=np.float32
+        )
+        angles_players[slots[in_game]] = self.model.calculate_angles(
+            key_points[in_game], frame2.shape, min_score=self.min_score
+        )
+        self.model.store_angles(
+            self.angles_video,
+            frame2,
+            key_points_with_scores_video,
+            self.min_score,
+        )
+        self.player_scorer.update(self.angles_video.array[-1], angles_players)
+        self.metrics.lap("angles", start)
+
+    def show_frames(self, frame1, frame2):
+        """
+        Display the video and camera frames side by side, with the running
+        score of the player
+
+        Args:
+            frame1: A `numpy.ndarray` object representing the video frame
+            frame2: A `numpy.ndarray` object representing the camera frame
+        """
+        if not self.display:
+            return
+        start = self.metrics.start()
+        if self.window is not None:
+            # The thread that owns the window shows the frame and reads the
+            # keys
+            self.compositor.resize(self.window.size)
+            self.window.put(self.compose_frames(frame1, frame2))
+            self.metrics.lap("compose", start)
+            return
+
+        # Create the window once, then follow its size
+        if self.window_open:
+            self.compositor.resize(self.view.window_size(WINDOW_NAME))
+        else:
+            self.view.open_window(WINDOW_NAME)
+            self.window_open = True
+
+        combined_frame = self.compose_frames(frame1, frame2)
+        start = self.metrics.lap("compose", start)
+        cv2.imshow(WINDOW_NAME, combined_frame)  # pylint: disable=no-member
+
+        self.handle_events()
+        self.metrics.lap("display", start)
+
+    def handle_events(self):
+        """
+        Let the game window handle its events, and stop the game if the
+        'q' key was pressed
+        """
+        if not self.window_open:
+            return
+        key = cv2.waitKey(1)  # pylint: disable=no-member
+        if key & 0xFF == ord("q"):
+            # Stop the game if 'q' key is pressed
+            self.stop()
+
+    def wait_for_frame(self, frame_index):
+        """
+        Wait until a frame is due on the clock, timing the wait and
+        counting the frames shown more than half a frame late
+
+        Args:
+            frame_index: An integer representing the index of the frame
+                in the video
+        """
+        start = self.metrics.start()
+        drift = self.clock.wait_for_frame(frame_index)
+        self.metrics.lap("pace", start)
+        if drift * self.clock.frame_rate > 0.5:
+            self.metrics.increment("frames_late")
+
+    def compose_frames(self, frame1, frame2):
+        """
+        Draw the video and camera frames side by side, with the running
+        score of the player
+
+        Args:
+            frame1: A `numpy.ndarray` object representing the video frame
+            frame2: A `numpy.ndarray` object representing the camera frame
+
+        Returns:
+            A `numpy.ndarray` object representing the combined frame, which
+            is reused for the next frame
+        """
+        combined_frame = self.compositor.compose(frame1, frame2)
+
+        if self.player_scorer is None:
+            text = f"Score: {int(self.scorer.score)}"
+        else:
+            scores = self.player_scorer.scores
+            text = "  ".join(
+                f"P{player + 1}: {int(scores[player])}"
+                for player in self.player_scorer.players
             )
-            time.sleep(frame_delay / 1000.0)
+
+        # Scale the text with the canvas, it was laid out for 1600 pixels
+        height = combined_frame.shape[0]
+        cv2.putText(  # pylint: disable=no-member
+            combined_frame,
+            text,
+            (height // 40, height * 3 // 40),
+            cv2.FONT_HERSHEY_SIMPLEX,  # pylint: disable=no-member
+            height / 533,
+            (255, 255, 255),
+            max(1, height // 266),
+        )
+
+        return combined_frame
+
+    def reference_key_points(self, frame_index, frame):
+        """
+        Return the key points of a video frame, from the cache if possible
+
+        Args:
+            frame_index: An integer representing the index of the frame
+                in the video
+            frame: A `numpy.ndarray` object representing the video frame
+
+        Returns:
+            A `numpy.ndarray` object representing the key points with scores
+        """
+        if self.reference is not None and frame_index < len(self.reference):
+            return self.reference[frame_index]
+        return self.process_frame(frame)
+
+    def stop(self):
+        """
+        Stop processing frames before the end of the song
+
+        Safe to call from any thread; `process_frames` returns after the
+        frame it is on.
+        """
+        self.stopped.set()
 
     def release_capture(self):
         """
-        Release the video and camera captures
+        Release the video capture, and the camera capture unless it was
+        passed in by the caller, and finish the recording and the summary
+        of the metrics
         """
         self.cap1.release()
-        self.cap2.release()
+        if self.owns_camera:
+            self.cap2.release()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.metrics.close({"clock": self.clock.stats()})
 
     @staticmethod
     def close_windows():
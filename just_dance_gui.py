@@ -1,15 +1,25 @@
 """
 Run a GUI for the user to input and call the application
 """
+import queue
 import sys
 import time
 import tkinter as tk
+from tkinter import messagebox
 from tkinter import ttk
 from tkinter import font as tk_font
-from mutagen.mp3 import MP3
-from just_dance_main import run_game
+from just_dance_catalog import SongCatalog
+from just_dance_controller import WINDOW_NAME
+from just_dance_main import MODEL_PATH, GameSession, preload_model
+from just_dance_view import FrameDisplay
 from just_dance_gui_score import Score
 
+# How often the GUI checks for events from the game, in milliseconds
+POLL_INTERVAL_MS = 100
+
+# How often the GUI shows the newest frame of the game, in milliseconds
+DISPLAY_INTERVAL_MS = 10
+
 # colour palette:
 # #2D1E29
 # #272D2B
@@ -18,19 +28,36 @@ from just_dance_gui_score import Score
 # #E6DCA6
 
 
-class App(tk.Tk):
+class App(tk.Tk):  # pylint: disable=too-many-instance-attributes
     """
     The main application window that inherits from `tk.Tk`
 
+    Games run in a `GameSession` thread, so the window stays responsive
+    during a game; the thread posts its progress to a queue that the
+    window polls, and its frames to a `FrameDisplay` that this thread
+    shows, since OpenCV windows must be used from the main thread on some
+    platforms.
+
     Attributes:
         title_font (tk_font.Font): The font used for the title label
         frames (dict): A dictionary of the frames used in the application
+        catalog (SongCatalog): The songs that can be played
+        events (queue.Queue): The queue the game posts its events to
+        session (GameSession): The game being played, or None
+        display (FrameDisplay): The game window, shown from this thread
+        song_length (int): The length of the song being played in seconds
+        start_time (float): When the song started, or None
 
     Methods:
         __init__: Initialize the application window
         show_frame: Show the specified frame
-        start_timer: Starts a timer when the program is run
-        update_timer: Updates the program timer
+        start_game: Start a game in the background
+        cancel_game: Stop the game being played
+        poll_events: Handle the events posted by the game
+        show_game_frame: Show the newest frame of the game
+        handle_event: Handle one event posted by the game
+        start_timer: Starts a timer when the song starts
+        update_timer: Updates the song timer
     """
 
     def __init__(self, *args, **kwargs):
@@ -44,6 +71,11 @@ class App(tk.Tk):
         tk.Tk.__init__(self, *args, **kwargs)
 
         self.start_time = None
+        self.song_length = 0
+        self.events = queue.Queue()
+        self.session = None
+        self.display = FrameDisplay(WINDOW_NAME)
+        self.catalog = SongCatalog(model_path=MODEL_PATH)
 
         self.title_font = tk_font.Font(
             family="Helvetica", size=18, weight="bold"
@@ -70,7 +102,7 @@ class App(tk.Tk):
 
         self.frames = {}
 
-        for F in (StartPage, EndPage):
+        for F in (StartPage, GamePage, EndPage):
             page_name = F.__name__
             frame = F(parent=container, controller=self)
             self.frames[page_name] = frame
@@ -81,9 +113,9 @@ class App(tk.Tk):
             frame.grid(row=0, column=0, sticky="nsew")
 
         self.show_frame("StartPage")
-        start_page = StartPage(parent=container, controller=self)
-        self.song_length = start_page.get_song_length()
-        self.start_timer()
+
+        # Load the pose model while the player picks a song
+        preload_model(MODEL_PATH)
 
     def show_frame(self, page_name):
         """
@@ -95,6 +127,91 @@ class App(tk.Tk):
         frame = self.frames[page_name]
         frame.tkraise()
 
+    def start_game(self, song):
+        """
+        Start a game of a song in the background, unless one is running
+
+        Args:
+            song (str): The name of the song to dance to
+        """
+        if self.session is not None or song is None:
+            return
+        self.song_length = self.catalog.song_length(song)
+        self.start_time = None
+        self.frames["GamePage"].reset()
+        self.show_frame("GamePage")
+
+        self.session = GameSession(
+            song, events=self.events, catalog=self.catalog, window=self.display
+        )
+        self.session.start()
+        self.poll_events()
+        self.show_game_frame()
+
+    def cancel_game(self):
+        """
+        Stop the game being played; the window returns to the start page
+        once the game has stopped
+        """
+        if self.session is not None:
+            self.frames["GamePage"].set_status("Stopping the game...")
+            self.session.cancel()
+
+    def poll_events(self):
+        """
+        Handle the events posted by the game, then check again after
+        `POLL_INTERVAL_MS` while the game is running
+        """
+        while True:
+            try:
+                kind, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            self.handle_event(kind, value)
+
+        if self.session is not None:
+            self.after(POLL_INTERVAL_MS, self.poll_events)
+
+    def show_game_frame(self):
+        """
+        Show the newest frame of the game and stop the game if 'q' was
+        pressed, then show the next one after `DISPLAY_INTERVAL_MS` while
+        the game is running
+        """
+        if self.session is None:
+            return
+        key = self.display.show()
+        if key & 0xFF == ord("q"):
+            self.cancel_game()
+        self.after(DISPLAY_INTERVAL_MS, self.show_game_frame)
+
+    def handle_event(self, kind, value):
+        """
+        Handle one event posted by the game
+
+        Args:
+            kind (str): The kind of event, see `GameSession`
+            value: The text or score of the event
+        """
+        game_page = self.frames["GamePage"]
+        if kind in ("finished", "cancelled", "error"):
+            self.display.close()
+        if kind == "status":
+            game_page.set_status(value)
+        elif kind == "started":
+            game_page.set_status("Dancing! Press 'q' in the game to stop.")
+            self.start_timer()
+        elif kind == "finished":
+            self.session = None
+            self.show_frame("EndPage")
+        elif kind == "cancelled":
+            self.session = None
+            self.show_frame("StartPage")
+        elif kind == "error":
+            self.session = None
+            self.show_frame("StartPage")
+            messagebox.showerror("Just Dance", f"The game failed: {value}")
+
     def start_timer(self):
         """
         Starts a timer and stores the start time.
@@ -108,16 +225,20 @@ class App(tk.Tk):
         Updates the timer by calculating the elapsed time since the timer
         was started.
 
-        If the elapsed time is less than the specified song length,
-        this method will schedule itself to be called again after
-        the song length has elapsed. Otherwise, it will switch to
-        the "EndPage" frame by calling the `show_frame` method.
+        Shows the elapsed time and the running score on the game page, and
+        schedules itself to be called again after a second while the game
+        is running. The game page is left when the game posts that it has
+        finished.
         """
+        if self.session is None or self.start_time is None:
+            return
         current_time = time.time() - self.start_time
-        if current_time < self.song_length:
-            self.after(self.song_length, self.update_timer)
-        else:
-            self.show_frame("EndPage")
+        self.frames["GamePage"].set_progress(
+            min(current_time, self.song_length),
+            self.song_length,
+            self.session.score,
+        )
+        self.after(1000, self.update_timer)
 
 
 class StartPage(tk.Frame):
@@ -125,14 +246,14 @@ class StartPage(tk.Frame):
     The start page frame that inherits from `tk.Frame`
 
     Attributes:
-        songs (dict): A dictionary of the available songs
+        songs (dict): A dictionary of the available songs, from the song
+            catalog
         selected_song_key (str): The key for the currently selected song
         selected_song (str): The value for the currently selected song
         controller (App): The application window
 
     Methods:
         __init__: Initialize the StartPage class and set up the GUI elements
-        get_song_length: Extracts the length of the selected audio.
     """
 
     def __init__(self, parent, controller):
@@ -145,15 +266,9 @@ class StartPage(tk.Frame):
         """
         tk.Frame.__init__(self, parent)
         # Song options
-        self.songs = {
-            "Cheap Thrills": "cheapthrills",
-            "Call Me Maybe": "callmemaybe",
-            "Uptown Funk": "uptownfunk",
-            "Ghungroo (Hindi)": "ghungroo",
-            "Don't Start Now": "dontstartnow",
-        }
-        self.selected_song_key = next(iter(self.songs))
-        self.selected_song = self.songs[self.selected_song_key]
+        self.songs = controller.catalog.titles()
+        self.selected_song_key = next(iter(self.songs), None)
+        self.selected_song = self.songs.get(self.selected_song_key)
         self.controller = controller
 
         label = tk.Label(
@@ -167,19 +282,22 @@ class StartPage(tk.Frame):
             self.selected_song_key = self.dropdown_var.get()
             self.selected_song = self.songs[self.selected_song_key]
 
-        # create the dropdown widget
+        # create the dropdown widget, the first argument after the variable
+        # is the song shown before one is picked
         self.dropdown_var = tk.StringVar(self)
-        self.dropdown_var.set(self.songs[self.selected_song_key])
-        self.dropdown_var.trace("w", dropdown_callback)
         self.dropdown_menu = ttk.OptionMenu(
-            self, self.dropdown_var, *self.songs
+            self,
+            self.dropdown_var,
+            self.selected_song_key or "No songs found",
+            *self.songs,
         )
+        self.dropdown_var.trace("w", dropdown_callback)
         self.dropdown_menu.pack()
 
         start_button = tk.Button(
             self,
             text="Start Game",
-            command=lambda: run_game(song=self.selected_song),
+            command=lambda: controller.start_game(self.selected_song),
         )
         start_button.pack()
 
@@ -190,15 +308,79 @@ class StartPage(tk.Frame):
         )
         end_button.pack()
 
-    def get_song_length(self):
+
+class GamePage(tk.Frame):
+    """
+    The page shown while a game is loading and running, that inherits from
+    `tk.Frame`
+
+    Attributes:
+        controller (App): The application window
+        status_label (tk.Label): The label showing what the game is doing
+        progress_label (tk.Label): The label showing the time and score
+
+    Methods:
+        __init__: Initialize the GamePage object and set up the GUI elements
+        reset: Clear the labels for a new game
+        set_status: Show what the game is doing
+        set_progress: Show the time into the song and the running score
+    """
+
+    def __init__(self, parent, controller):
         """
-        Gets the length of the selected song in seconds.
+        Initialize the GamePage object and set up the GUI elements.
 
-        Returns:
-            The length of the selected song in seconds as an integer.
+        Args:
+            parent (tk.Tk): The parent widget
+            controller (App): The application window
         """
-        song_audio = MP3("songs_audio/" + self.selected_song + ".mp3")
-        return int(song_audio.info.length)
+        tk.Frame.__init__(self, parent)
+        self.controller = controller
+
+        self.status_label = tk.Label(self, font=controller.title_font)
+        self.status_label.pack(side="top", fill="x", pady=20)
+
+        self.progress_label = tk.Label(self)
+        self.progress_label.pack()
+
+        cancel_button = tk.Button(
+            self,
+            text="Cancel Game",
+            command=controller.cancel_game,
+        )
+        cancel_button.pack()
+
+    def reset(self):
+        """
+        Clear the labels for a new game
+        """
+        self.status_label.config(text="Starting the game...")
+        self.progress_label.config(text="")
+
+    def set_status(self, text):
+        """
+        Show what the game is doing
+
+        Args:
+            text (str): The status to show
+        """
+        self.status_label.config(text=text)
+
+    def set_progress(self, elapsed, length, score):
+        """
+        Show the time into the song and the running score
+
+        Args:
+            elapsed (float): The seconds since the song started
+            length (int): The length of the song in seconds
+            score (int): The running score of the player
+        """
+        self.progress_label.config(
+            text=(
+                f"{int(elapsed) // 60}:{int(elapsed) % 60:02d} /"
+                f" {length // 60}:{length % 60:02d}    Score: {score}"
+            )
+        )
 
 
 class EndPage(tk.Frame):
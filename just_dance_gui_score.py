@@ -4,7 +4,11 @@ Run a GUI for the user to display score and leaderboard
 import sys
 import tkinter as tk
 from tkinter import font as tk_font
-from just_dance_score import get_current_score, get_leaderboard_scores
+from just_dance_score import (
+    LEADERBOARD_FILE,
+    get_current_score,
+    get_leaderboard_scores,
+)
 
 # colour palette:
 # #2D1E29
@@ -110,7 +114,7 @@ class ScorePage(tk.Frame):
 
         controller.title("Just Dance - Score")
 
-        filename = "leaderboard.csv"
+        filename = LEADERBOARD_FILE
 
         current_score = get_current_score(filename)
 
@@ -161,7 +165,7 @@ class LeaderboardPage(tk.Frame):
 
         controller.title("Just Dance - Leaderboard")
 
-        filename = "leaderboard.csv"
+        filename = LEADERBOARD_FILE
 
         label = tk.Label(self, text="Leaderboard", font=controller.title_font)
         label.pack(side="top", fill="x", pady=20)
@@ -0,0 +1,208 @@
+"""
+Module for storing the leaderboard of the Just Dance Game in an indexed
+SQLite database, for leaderboards too large to rescan as a CSV file.
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import time
+
+DATABASE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# Every station appends with its own short transaction. WAL lets readers
+# carry on while a station writes, and the busy timeout makes a station
+# wait for another one's write instead of failing.
+BUSY_TIMEOUT_SECONDS = 10
+
+TABLE = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    score REAL NOT NULL,
+    song TEXT,
+    player TEXT,
+    created REAL NOT NULL
+)
+"""
+
+# The indexes serve the top scores overall, per song and per player
+INDEXES = {
+    "scores_by_score": "scores (score DESC)",
+    "scores_by_song": "scores (song, score DESC)",
+    "scores_by_player": "scores (player, score DESC)",
+}
+
+
+def is_database(filename):
+    """
+    Return whether a leaderboard file is a SQLite database.
+
+    Args:
+        filename (str): The name of the leaderboard file.
+
+    Returns:
+        bool: True for the `.db`, `.sqlite` and `.sqlite3` extensions.
+    """
+    return os.path.splitext(filename)[1].lower() in DATABASE_EXTENSIONS
+
+
+def connect(filename):
+    """
+    Open a leaderboard database, creating its table and indexes if needed.
+
+    Args:
+        filename (str): The name of the SQLite database file.
+
+    Returns:
+        sqlite3.Connection: The open connection, in autocommit mode.
+    """
+    connection = sqlite3.connect(
+        filename, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(TABLE)
+    for name, columns in INDEXES.items():
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+    return connection
+
+
+def add_score(filename, score, song=None, player=None):
+    """
+    Append a score to a leaderboard database.
+
+    Args:
+        filename (str): The name of the SQLite database file.
+        score (float): The score to store.
+        song (str): The name of the song danced, or None.
+        player (str): The name of the player, or None.
+    """
+    connection = connect(filename)
+    try:
+        connection.execute(
+            "INSERT INTO scores (score, song, player, created)"
+            " VALUES (?, ?, ?, ?)",
+            (float(score), song, player, time.time()),
+        )
+    finally:
+        connection.close()
+
+
+def get_current_score(filename):
+    """
+    Return the last score added to a leaderboard database.
+
+    Args:
+        filename (str): The name of the SQLite database file.
+
+    Returns:
+        int: The last (current) score, or 0 if there is none.
+    """
+    connection = connect(filename)
+    try:
+        row = connection.execute(
+            "SELECT score FROM scores ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    finally:
+        connection.close()
+    return 0 if row is None else int(row[0])
+
+
+def get_top_scores(filename, k=5, song=None, player=None):
+    """
+    Retrieve the top scores from a leaderboard database.
+
+    The scores are read in order from an index, so only the k rows
+    returned are visited.
+
+    Args:
+        filename (str): The name of the SQLite database file.
+        k (int): The number of scores to return.
+        song (str): Only return the scores of this song, if given.
+        player (str): Only return the scores of this player, if given.
+
+    Returns:
+        A list of at most k integers representing the top scores in
+        descending order.
+    """
+    conditions = []
+    parameters = []
+    if song is not None:
+        conditions.append("song = ?")
+        parameters.append(song)
+    if player is not None:
+        conditions.append("player = ?")
+        parameters.append(player)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    connection = connect(filename)
+    try:
+        rows = connection.execute(
+            f"SELECT score FROM scores {where} ORDER BY score DESC LIMIT ?",
+            (*parameters, k),
+        ).fetchall()
+    finally:
+        connection.close()
+    return [int(score) for (score,) in rows]
+
+
+def import_csv(csv_filename, filename, song=None):
+    """
+    Copy the scores of a leaderboard CSV file into a leaderboard database.
+
+    The first row of the CSV file is skipped like in
+    `just_dance_score.get_leaderboard_scores`, and the scores are added in
+    a single transaction in the order of the file. The indexes are rebuilt
+    once after the insert, which is several times faster than updating
+    them row by row.
+
+    Args:
+        csv_filename (str): The name of the CSV file to read the scores
+            from.
+        filename (str): The name of the SQLite database file.
+        song (str): The name of the song to file the scores under, or None.
+
+    Returns:
+        int: The number of scores imported.
+    """
+    created = time.time()
+    with open(csv_filename, "r", newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        rows = [(float(row[0]), song, None, created) for row in reader if row]
+
+    connection = connect(filename)
+    try:
+        with connection:
+            connection.execute("BEGIN")
+            for name in INDEXES:
+                connection.execute(f"DROP INDEX {name}")
+            connection.executemany(
+                "INSERT INTO scores (score, song, player, created)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            for name, columns in INDEXES.items():
+                connection.execute(f"CREATE INDEX {name} ON {columns}")
+    finally:
+        connection.close()
+    return len(rows)
+
+
+def main():
+    """
+    Import a leaderboard CSV file into a leaderboard database
+    """
+    parser = argparse.ArgumentParser(
+        description="Import a Just Dance leaderboard CSV file into SQLite."
+    )
+    parser.add_argument("csv_file", help="leaderboard CSV file to import")
+    parser.add_argument("database", help="SQLite file to add the scores to")
+    parser.add_argument("--song", help="song to file the scores under")
+    args = parser.parse_args()
+
+    count = import_csv(args.csv_file, args.database, song=args.song)
+    print(f"Imported {count} scores into {args.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,119 @@
 """
-Set 'JustDanceGame' class and 'run_game' function to link all classes together
+Set 'JustDanceGame' class and 'run_game' function to link all classes together,
+and 'GameSession' class to run a game in the background
 """
+import atexit
 import csv
+import os
+import queue
+import threading
+import time
+import cv2
 from just_dance_model import JustDanceModel
 from just_dance_view import JustDanceView
 from just_dance_controller import JustDanceController
+from just_dance_cache import load_reference
+from just_dance_score import LEADERBOARD_FILE, update_summary
+from just_dance_metrics import (
+    METRICS_DIR,
+    METRICS_LOG_INTERVAL,
+    PipelineMetrics,
+)
+from just_dance_recording import RECORDING_EXTENSION, RECORDINGS_DIR
+from just_dance_scoring import SCORE_WITH_DTW
+from just_dance_workers import INFERENCE_PROCESSES, InferencePool, PooledModel
+import just_dance_leaderboard
+
+MODEL_PATH = "model/model.tflite"
+
+# Models and cameras are kept open for the whole process, so that games
+# after the first one don't pay for loading the model or opening the camera
+_models = {}
+_models_lock = threading.Lock()
+_cameras = {}
+_cameras_lock = threading.Lock()
+
+
+def get_model(model_path, processes=INFERENCE_PROCESSES):
+    """
+    Return the model for a model path, loading it on first use
+
+    Args:
+        model_path: A string representing the path to the TensorFlow Lite
+            model
+        processes: An integer representing the number of worker processes
+            to run the model in when it is first loaded, or 0 to run it in
+            this process
+
+    Returns:
+        A `JustDanceModel` object shared by every game in the process
+    """
+    with _models_lock:
+        if model_path not in _models:
+            if processes:
+                _models[model_path] = PooledModel(
+                    InferencePool(model_path, num_workers=processes)
+                )
+            else:
+                _models[model_path] = JustDanceModel(model_path=model_path)
+        return _models[model_path]
+
+
+def preload_model(model_path):
+    """
+    Start loading a model in a background thread
+
+    Args:
+        model_path: A string representing the path to the TensorFlow Lite
+            model
+
+    Returns:
+        The `threading.Thread` loading the model
+    """
+    thread = threading.Thread(target=get_model, args=(model_path,), daemon=True)
+    thread.start()
+    return thread
+
+
+def get_camera(camera_index):
+    """
+    Return the capture of a camera, opening it on first use
+
+    Args:
+        camera_index: An integer representing the index of the camera
+
+    Returns:
+        A `cv2.VideoCapture` object shared by every game in the process
+    """
+    with _cameras_lock:
+        camera = _cameras.get(camera_index)
+        if camera is None or not camera.isOpened():
+            camera = cv2.VideoCapture(camera_index)  # pylint: disable=no-member
+            _cameras[camera_index] = camera
+        return camera
+
+
+@atexit.register
+def release_cameras():
+    """
+    Release every camera opened by `get_camera`
+    """
+    with _cameras_lock:
+        for camera in _cameras.values():
+            camera.release()
+        _cameras.clear()
+
+
+@atexit.register
+def close_models():
+    """
+    Stop the worker processes of the models loaded by `get_model`
+    """
+    with _models_lock:
+        for model in _models.values():
+            if isinstance(model, PooledModel):
+                model.pool.close()
+        _models.clear()
 
 
 class JustDanceGame:
@@ -17,25 +126,75 @@ class JustDanceGame:
         view: An object representing the application display
         controller: An object representing the application
             controller using the user input
+        audio_path: A string representing the path to the music of the
+            song, or None for the file named after the song
+        dtw: A boolean representing whether the final score aligns the
+            user's moves to the video in time
 
     Methods:
         run: Run the JustDance Application
     """
 
-    def __init__(self, model_path, video_path, camera_index):
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        model_path,
+        video_path,
+        camera_index,
+        video_hash=None,
+        model_hash=None,
+        metrics=None,
+        record_path=None,
+        window=None,
+        audio_path=None,
+        dtw=SCORE_WITH_DTW,
+    ):
         """
         Initialize a new instance of the JustDanceGame Class
 
+        The model and camera are shared with earlier games in the process.
+
         Args:
             model_path: An object representing the TensorFlow model path
             video_path: An object representing the dance video file path
             camera_index: An object representing the camera index for
                 the user input camera feed
+            video_hash: A string representing the content hash of the video
+                if known, such as from the song catalog, so the reference
+                cache is found without reading the whole video
+            model_hash: A string representing the content hash of the model
+                if known
+            metrics: A `PipelineMetrics` object to time the game loop with,
+                or None to not time it
+            record_path: A string representing the file to save the camera
+                key points to, or None to not save them
+            window: A `FrameDisplay` object to post the frames to, for the
+                thread that owns the GUI to show, or None to show them from
+                the thread running the game
+            audio_path: A string representing the path to the music of the
+                song, such as from the song catalog, or None for the file
+                named after the song in songs_audio
+            dtw: A boolean representing whether to score the user with
+                `JustDanceModel.final_score_dtw`, forgiving moves made a
+                little ahead of or behind the video
         """
-        self.model = JustDanceModel(model_path=model_path)
+        self.audio_path = audio_path
+        self.dtw = dtw
+        self.model = get_model(model_path)
         self.view = JustDanceView(model=self.model)
+        reference = load_reference(
+            video_path, model_path, video_hash=video_hash, model_hash=model_hash
+        )
         self.controller = JustDanceController(
-            model=self.model, video_path=video_path, camera_index=camera_index
+            model=self.model,
+            video_path=video_path,
+            camera_index=camera_index,
+            camera=get_camera(camera_index),
+            reference=None if reference is None else reference["key_points"],
+            threaded=True,
+            metrics=metrics,
+            record_path=record_path,
+            window=window,
         )
         self.score = 0
 
@@ -47,34 +206,65 @@ class JustDanceGame:
             song: A string representing the chosen for the user to
             dance to
         """
-        self.controller.play_sound("songs_audio/" + song + ".mp3")
+        audio_path = self.audio_path
+        if audio_path is None:
+            audio_path = "songs_audio/" + song + ".mp3"
+        self.controller.play_sound(audio_path)
+        self.controller.clock.start()
         self.controller.process_frames()
         self.controller.release_capture()
-        self.controller.close_windows()
+        # A window shown by another thread is closed by that thread
+        if self.controller.window is None:
+            self.controller.close_windows()
 
     def calculate_final_score(self):
         """
         Calculate the player's final score for the current dance song.
+
+        The controller keeps a running score during the song, so this only
+        reads the final value, unless the score aligns the user's moves to
+        the video in time, which needs every sample of the song.
         """
-        self.score = self.model.final_score(
-            self.controller.angles_video, self.controller.angles_camera, 20
+        if not self.dtw:
+            self.score = self.controller.scorer.score
+            return
+        controller = self.controller
+        self.score = JustDanceModel.final_score_dtw(
+            controller.angles_video,
+            controller.angles_camera,
+            controller.scorer.threshold,
+            sample_rate=controller.sampler.rate or controller.frame1_rate,
         )
 
-    def store_leaderboard(self, csv_file):
+    def store_leaderboard(self, csv_file, song=None, player=None):
         """
-        Store the player's score in a leaderboard CSV file.
+        Store the player's score in a leaderboard CSV file, or in a SQLite
+        leaderboard if the file has a database extension.
 
         Args:
             csv_file (str): The name of the CSV file to store the leaderboard.
+            song (str): The name of the song danced, kept by the SQLite
+                leaderboard only.
+            player (str): The name of the player, kept by the SQLite
+                leaderboard only.
 
         Returns:
             None
         """
+        if just_dance_leaderboard.is_database(csv_file):
+            just_dance_leaderboard.add_score(
+                csv_file, self.score, song=song, player=player
+            )
+            return
+
         # Write scores to the file
         with open(csv_file, "a", newline="", encoding="utf-8") as file:
             writer = csv.writer(file)
             writer.writerow([self.score])
 
+        # Fold the new row into the leaderboard summary while it is cheap
+        update_summary(csv_file)
+
 
 def run_game(song):
     """
@@ -87,10 +277,222 @@ def run_game(song):
             dance to.
     """
     game = JustDanceGame(
-        model_path="model/model.tflite",
+        model_path=MODEL_PATH,
         video_path="songs/" + song + ".mp4",
         camera_index=0,
     )
     game.run(song)
     game.calculate_final_score()
-    game.store_leaderboard("leaderboard.csv")
+    game.store_leaderboard(LEADERBOARD_FILE, song=song)
+
+
+# pylint: disable-next=too-many-instance-attributes
+class GameSession(threading.Thread):
+    """
+    A thread that runs one game and reports its progress through a queue
+
+    Lets a GUI keep its event loop running during the game; with a
+    `FrameDisplay`, the GUI's thread also shows the game window, as OpenCV
+    needs on macOS and with its Qt backend. Every event is a tuple of a
+    kind and a value:
+
+    - ("status", text) while the game is loading
+    - ("started", None) when the song starts
+    - ("finished", score) when the song has ended and the score is stored
+    - ("cancelled", None) when the game was stopped before the end
+    - ("error", text) when the game could not be run
+
+    Attributes:
+        song (str): The name of the song to dance to
+        events (queue.Queue): The queue the events are posted to
+        model_path (str): The path to the TensorFlow Lite model
+        camera_index (int): The index of the camera
+        leaderboard_file (str): The leaderboard to store the score in
+        catalog (SongCatalog): The song catalog to find the song in, or None
+        metrics_dir (str): The directory to write the game loop timings
+            to, or None
+        metrics_log_interval (float): The seconds between the printed
+            game loop timings, or None
+        recordings_dir (str): The directory to save the camera key points
+            to, or None
+        window (FrameDisplay): The display the frames are posted to, or
+            None
+        dtw (bool): Whether the score aligns the moves to the video in time
+        game (JustDanceGame): The game once it is loaded, or None
+
+    Methods:
+        __init__: Initialize a new `GameSession` object
+        run: Load and run the game, posting its events
+        _session_path: Return a file path named after the song and time
+        _metrics: Return the metrics to time the game loop with
+        cancel: Stop the game
+        score: Return the running score of the game
+    """
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        song,
+        events=None,
+        model_path=MODEL_PATH,
+        camera_index=0,
+        leaderboard_file=LEADERBOARD_FILE,
+        catalog=None,
+        metrics_dir=METRICS_DIR,
+        metrics_log_interval=METRICS_LOG_INTERVAL,
+        recordings_dir=RECORDINGS_DIR,
+        window=None,
+        dtw=SCORE_WITH_DTW,
+    ):
+        """
+        Initialize a new `GameSession` object
+
+        Args:
+            song: A string representing the name of the song to dance to
+            events: A `queue.Queue` object to post the events to, a new one
+                if None
+            model_path: A string representing the path to the model
+            camera_index: An integer representing the index of the camera
+            leaderboard_file: A string representing the leaderboard file
+            catalog: A `SongCatalog` object to take the song's video and
+                hashes from, or None to use the default song path
+            metrics_dir: A string representing the directory to write a
+                summary of the game loop timings to, or None to not write it
+            metrics_log_interval: A number representing the seconds between
+                the printed game loop timings, or None to not print them
+            recordings_dir: A string representing the directory to save the
+                camera key points of the game to, for replaying it with
+                `just_dance_batch`, or None to not save them
+            window: A `FrameDisplay` object to post the frames to, for the
+                thread that owns the GUI to show, or None to show them from
+                this thread, which only works with some OpenCV backends
+            dtw: A boolean representing whether to score the dancer with
+                `JustDanceModel.final_score_dtw`
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.song = song
+        self.events = queue.Queue() if events is None else events
+        self.model_path = model_path
+        self.camera_index = camera_index
+        self.leaderboard_file = leaderboard_file
+        self.catalog = catalog
+        self.metrics_dir = metrics_dir
+        self.metrics_log_interval = metrics_log_interval
+        self.recordings_dir = recordings_dir
+        self.window = window
+        self.dtw = dtw
+        self.game = None
+        self._cancelled = threading.Event()
+
+    def run(self):
+        """
+        Load and run the game, posting its progress to the event queue
+        """
+        try:
+            self.events.put(("status", "Loading the pose model..."))
+            get_model(self.model_path)
+            if self._cancelled.is_set():
+                self.events.put(("cancelled", None))
+                return
+
+            self.events.put(("status", "Opening the camera..."))
+            self.game = JustDanceGame(
+                model_path=self.model_path,
+                camera_index=self.camera_index,
+                metrics=self._metrics(),
+                record_path=self._session_path(
+                    self.recordings_dir, RECORDING_EXTENSION
+                ),
+                window=self.window,
+                dtw=self.dtw,
+                **self._song_files(),
+            )
+            # Catch a cancel that came in while the game was being created,
+            # before the music starts
+            if self._cancelled.is_set():
+                self.game.controller.release_capture()
+                self.events.put(("cancelled", None))
+                return
+
+            self.events.put(("started", None))
+            self.game.run(self.song)
+            if self.game.controller.stopped.is_set():
+                self.events.put(("cancelled", None))
+                return
+
+            self.game.calculate_final_score()
+            self.game.store_leaderboard(self.leaderboard_file, song=self.song)
+            self.events.put(("finished", self.game.score))
+        except Exception as exception:  # pylint: disable=broad-except
+            self.events.put(("error", str(exception)))
+
+    def _song_files(self):
+        """
+        Return the video and music of the song and the known content hashes
+
+        Returns:
+            A dictionary of the `video_path`, `audio_path`, `video_hash` and
+            `model_hash` arguments of `JustDanceGame`
+        """
+        if self.catalog is None or self.song not in self.catalog.songs:
+            return {"video_path": "songs/" + self.song + ".mp4"}
+        model = self.catalog.model
+        same_model = self.catalog.model_path == self.model_path
+        return {
+            "video_path": self.catalog.video_path(self.song),
+            "audio_path": self.catalog.audio_path(self.song),
+            "video_hash": self.catalog.songs[self.song]["video_hash"],
+            "model_hash": model["hash"] if model and same_model else None,
+        }
+
+    def _session_path(self, directory, extension):
+        """
+        Return the path of a file for this game, named after the song and
+        the time
+
+        Args:
+            directory: A string representing the directory of the file, or
+                None
+            extension: A string representing the file extension
+
+        Returns:
+            A string representing the path, or None if the directory is None
+        """
+        if directory is None:
+            return None
+        return os.path.join(
+            directory,
+            f"{self.song}-{time.strftime('%Y%m%d-%H%M%S')}{extension}",
+        )
+
+    def _metrics(self):
+        """
+        Return the metrics to time the game loop with
+
+        Returns:
+            A `PipelineMetrics` object writing to a file named after the
+            song and the time, or None if the timings are not wanted
+        """
+        if self.metrics_dir is None and self.metrics_log_interval is None:
+            return None
+        return PipelineMetrics(
+            path=self._session_path(self.metrics_dir, ".json"),
+            log_interval=self.metrics_log_interval,
+        )
+
+    def cancel(self):
+        """
+        Stop the game, from any thread; the score is not stored
+        """
+        self._cancelled.set()
+        game = self.game
+        if game is not None:
+            game.controller.stop()
+
+    @property
+    def score(self):
+        """
+        Return the running score of the game, 0 until it has started
+        """
+        game = self.game
+        return 0 if game is None else int(game.controller.scorer.score)
@@ -0,0 +1,351 @@
+"""
+Set 'LatencyHistogram' class to keep latency percentiles in fixed memory
+and 'PipelineMetrics' class to time the stages of the game loop
+"""
+import json
+import os
+import time
+
+# Games write a summary of their stage timings to this directory when it is
+# set, one file per game
+METRICS_DIR = None
+
+# Seconds between the progress lines printed while a game runs, or None
+METRICS_LOG_INTERVAL = None
+
+# Each power of two is split into 2 ** SUB_BUCKET_BITS buckets, so a
+# recorded value is off by at most 1 / 2 ** SUB_BUCKET_BITS (6%)
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# Values up to 2 ** 40 ns (about 18 minutes) get their own bucket
+MAX_VALUE_BITS = 40
+NUM_BUCKETS = SUB_BUCKETS * (MAX_VALUE_BITS - SUB_BUCKET_BITS + 1)
+
+# Stages printed in the progress line, when they have been recorded
+LOG_STAGES = ("decode", "inference", "compose", "display", "frame")
+
+
+class LatencyHistogram:
+    """
+    A histogram of durations with logarithmic buckets, like HdrHistogram
+
+    Small durations have buckets of 1 ns and every larger power of two is
+    split into the same number of buckets, so the memory is fixed however
+    many values are recorded and every percentile is within a few percent
+    of the true value.
+
+    Attributes:
+        counts (list): The number of values recorded in each bucket
+        count (int): The number of values recorded
+        total (int): The sum of the values recorded, in nanoseconds
+        min (int): The smallest value recorded, in nanoseconds
+        max (int): The largest value recorded, in nanoseconds
+
+    Methods:
+        __init__: Initialize a new `LatencyHistogram` object
+        record: Add a duration to the histogram
+        bucket_index: Return the bucket of a duration
+        bucket_value: Return the duration a bucket stands for
+        percentile: Return a percentile of the durations recorded
+        summary: Return the count, mean and percentiles in milliseconds
+    """
+
+    def __init__(self):
+        """
+        Initialize a new, empty `LatencyHistogram` object
+        """
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        """
+        Add a duration to the histogram
+
+        Args:
+            value: An integer representing the duration in nanoseconds;
+                negative durations are counted as 0
+        """
+        value = max(int(value), 0)
+        self.counts[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        self.max = max(self.max, value)
+
+    @staticmethod
+    def bucket_index(value):
+        """
+        Return the bucket a duration is counted in
+
+        Args:
+            value: A non-negative integer representing the duration in
+                nanoseconds
+
+        Returns:
+            An integer index into `counts`; durations too long for the
+            histogram go in the last bucket
+        """
+        if value < SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        index = SUB_BUCKETS * (shift + 1) + (value >> shift) - SUB_BUCKETS
+        return min(index, NUM_BUCKETS - 1)
+
+    @staticmethod
+    def bucket_value(index):
+        """
+        Return the duration in the middle of a bucket
+
+        Args:
+            index: An integer index into `counts`
+
+        Returns:
+            A number representing the duration in nanoseconds
+        """
+        if index < SUB_BUCKETS:
+            return index
+        shift = index // SUB_BUCKETS - 1
+        low = (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def percentile(self, percent):
+        """
+        Return a percentile of the durations recorded
+
+        Args:
+            percent: A number between 0 and 100
+
+        Returns:
+            A number representing the duration in nanoseconds, within the
+            smallest and largest value recorded, or 0 if none were
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, percent / 100 * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(self.bucket_value(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Return the count, mean, percentiles and maximum of the durations
+
+        Returns:
+            A dictionary of the count and the `mean_ms`, `p50_ms`, `p95_ms`,
+            `p99_ms` and `max_ms` durations in milliseconds
+        """
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / 1e6 if self.count else 0.0,
+            "p50_ms": self.percentile(50) / 1e6,
+            "p95_ms": self.percentile(95) / 1e6,
+            "p99_ms": self.percentile(99) / 1e6,
+            "max_ms": self.max / 1e6,
+        }
+
+
+class PipelineMetrics:  # pylint: disable=too-many-instance-attributes
+    """
+    A class that times the stages of the game loop and counts its events
+
+    Stages are timed with `time.perf_counter_ns` laps:
+
+        start = metrics.start()
+        ...
+        start = metrics.lap("decode", start)
+
+    When disabled, `start` and `lap` return at once without reading the
+    clock, so the calls can stay in the game loop. Each stage should be
+    timed from a single thread.
+
+    Attributes:
+        enabled (bool): Whether to record anything
+        path (str): The file `close` writes the summary to, or None
+        log_interval (float): The seconds between progress lines, or None
+        log (callable): The function the progress lines are passed to
+        stages (dict): A dictionary mapping stage names to their
+            `LatencyHistogram`
+        counters (dict): A dictionary mapping event names to their counts
+        start_time (int): The `time.perf_counter_ns` value when the
+            metrics were created
+        next_log_time (int): The `time.perf_counter_ns` value of the next
+            progress line
+
+    Methods:
+        __init__: Initialize a new `PipelineMetrics` object
+        start: Return the time a stage starts at
+        lap: Record the time since a stage started
+        record: Record the duration of a stage
+        increment: Add to the count of an event
+        tick: Count a frame and print a progress line when one is due
+        log_line: Return a progress line
+        summary: Return the statistics of every stage and event
+        close: Write the summary to the file
+    """
+
+    def __init__(self, enabled=True, path=None, log_interval=None, log=print):
+        """
+        Initialize a new `PipelineMetrics` object
+
+        Args:
+            enabled: A boolean representing whether to record anything
+            path: A string representing the JSON file `close` writes the
+                summary to, or None to not write it
+            log_interval: A number representing the seconds between the
+                progress lines, or None to not print them
+            log: A function taking a string, called with each progress line
+        """
+        self.enabled = enabled
+        self.path = path
+        self.log_interval = log_interval
+        self.log = log
+        self.stages = {}
+        self.counters = {}
+        self.start_time = time.perf_counter_ns()
+        self.next_log_time = (
+            None
+            if log_interval is None
+            else self.start_time + int(log_interval * 1e9)
+        )
+
+    def start(self):
+        """
+        Return the time a stage starts at
+
+        Returns:
+            An integer `time.perf_counter_ns` value, 0 when disabled
+        """
+        if not self.enabled:
+            return 0
+        return time.perf_counter_ns()
+
+    def lap(self, stage, start):
+        """
+        Record the time since a stage started
+
+        Args:
+            stage: A string representing the name of the stage
+            start: An integer returned by `start` or `lap`
+
+        Returns:
+            An integer representing the current time, for the next stage to
+            start at; 0 when disabled
+        """
+        if not self.enabled:
+            return 0
+        now = time.perf_counter_ns()
+        self.record(stage, now - start)
+        return now
+
+    def record(self, stage, duration):
+        """
+        Record the duration of a stage
+
+        Args:
+            stage: A string representing the name of the stage
+            duration: An integer representing the duration in nanoseconds
+        """
+        if not self.enabled:
+            return
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.record(duration)
+
+    def increment(self, counter, amount=1):
+        """
+        Add to the count of an event, such as a dropped frame
+
+        Args:
+            counter: A string representing the name of the event
+            amount: An integer to add to the count
+        """
+        if not self.enabled:
+            return
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def tick(self):
+        """
+        Count a frame shown, and print a progress line when one is due
+        """
+        if not self.enabled:
+            return
+        self.counters["frames"] = self.counters.get("frames", 0) + 1
+        if self.next_log_time is None:
+            return
+        now = time.perf_counter_ns()
+        if now >= self.next_log_time:
+            self.next_log_time = now + int(self.log_interval * 1e9)
+            self.log(self.log_line())
+
+    def log_line(self):
+        """
+        Return a progress line of the frame counts and the 95th percentile
+        of the main stages
+
+        Returns:
+            A string representing the line
+        """
+        elapsed = (time.perf_counter_ns() - self.start_time) / 1e9
+        parts = [f"{elapsed:.0f}s"]
+        parts += [f"{name}={count}" for name, count in self.counters.items()]
+        parts += [
+            f"{stage}_p95={self.stages[stage].percentile(95) / 1e6:.1f}ms"
+            for stage in LOG_STAGES
+            if stage in self.stages
+        ]
+        return "metrics " + " ".join(parts)
+
+    def summary(self, extra=None):
+        """
+        Return the statistics of every stage and event
+
+        Args:
+            extra: A dictionary of more statistics to include, or None
+
+        Returns:
+            A dictionary of the elapsed seconds, the counters, and the
+            `LatencyHistogram.summary` of every stage
+        """
+        summary = {
+            "elapsed_s": (time.perf_counter_ns() - self.start_time) / 1e9,
+            "counters": dict(self.counters),
+            "stages": {
+                stage: histogram.summary()
+                for stage, histogram in self.stages.items()
+            },
+        }
+        if extra:
+            summary.update(extra)
+        return summary
+
+    def close(self, extra=None):
+        """
+        Write the summary to the file, if enabled and a file was given
+
+        The file is written in one step, so a reader never sees half of it.
+
+        Args:
+            extra: A dictionary of more statistics to include, or None
+        """
+        if not self.enabled or self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(extra), file, indent=2)
+        os.replace(temporary_path, self.path)
+
+
+# Shared by every controller created without metrics
+DISABLED_METRICS = PipelineMetrics(enabled=False)
@@ -1,30 +1,107 @@
 """
 Set 'JustDanceModel' class for the application
 """
-import tensorflow as tf
+import importlib
 import numpy as np
+import cv2
+from keypoint import JOINTS, JOINT_TRIPLETS
+from just_dance_angles import AngleBuffer
+from just_dance_scoring import dtw_align
+from just_dance_timing import DEFAULT_SAMPLE_RATE
+
+# TensorFlow Lite interpreters in order of preference, as (backend name,
+# module, attribute path of the class). The lightweight runtimes load in a
+# fraction of the time and memory of the full TensorFlow package, which is
+# only a fallback.
+INTERPRETER_BACKENDS = [
+    ("litert", "ai_edge_litert.interpreter", "Interpreter"),
+    ("tflite_runtime", "tflite_runtime.interpreter", "Interpreter"),
+    ("tensorflow", "tensorflow", "lite.Interpreter"),
+]
+
+# MoveNet MultiPose detects up to 6 people, each as 17 key points (y, x,
+# score) followed by a bounding box (ymin, xmin, ymax, xmax, score)
+MULTIPOSE_VALUES = 56
+MULTIPOSE_BOX = slice(51, 56)
+
+# Input size given to MultiPose, whose input size is not fixed; a multiple
+# of 32 as the model requires
+MULTIPOSE_INPUT_SIZE = 256
+
+
+def load_interpreter_class(backend=None):
+    """
+    Import and return a TensorFlow Lite interpreter class
+
+    The import only happens when a model is first created, so importing
+    this module (and the GUI) does not load TensorFlow.
+
+    Args:
+        backend: A string naming one of `INTERPRETER_BACKENDS`, or None for
+            the first one that is installed
 
+    Returns:
+        The `Interpreter` class of the backend
 
-class JustDanceModel:
+    Raises:
+        ImportError: If the backend, or with None every backend, is not
+            installed
+    """
+    for name, module_name, class_path in INTERPRETER_BACKENDS:
+        if backend not in (None, name):
+            continue
+        try:
+            interpreter_class = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        for attribute in class_path.split("."):
+            interpreter_class = getattr(interpreter_class, attribute)
+        return interpreter_class
+
+    raise ImportError(
+        f"No TensorFlow Lite interpreter found for backend {backend!r}; "
+        "install ai-edge-litert, tflite-runtime or tensorflow"
+    )
+
+
+class JustDanceModel:  # pylint: disable=too-many-instance-attributes
     """
     A class to represent the model for the application
 
       Attributes:
           model_path (object): An object representing the model path
+          interpreter (object): The TensorFlow Lite interpreter of the model
+          input_index (int): The index of the input tensor of the model
+          input_dtype (type): The data type of the input tensor of the model
+          output_index (int): The index of the output tensor of the model
+          input_size (int): The width and height of the model input, 192
+              for MoveNet Lightning and 256 for MoveNet Thunder
+          multi_pose (bool): Whether the model is MoveNet MultiPose, which
+              detects several people per frame
+          batch_size (int): The number of images the input tensor holds
+          supports_batch (bool): Whether the model runs batches of images
+              in one call, or None until a batch is first run
 
        Methods:
            __init__: Initialize the JustDanceModel class
-           run_interface: Process a frame and return key points
-           calculate_angles: Calculate angles between specified joints
+           prepare_input: Resize a frame into the model input format
+           run_inference: Process a frame and return key points
+           detect_people: Process a frame and return everyone's key points
+           run_batch: Process a batch of frames in one call if possible
+           split_people: Split MultiPose output into key points and boxes
+           calculate_angle: Calculate the angle between three joints
+           calculate_angles: Calculate the angles of a batch of key points
            store_angles: Store all angles between triplets of joints
            score_calculator: Calculate a user's score based on
                the accuracy to the video
            final_score: Return the final score for the user
+           final_score_dtw: Return the final score after aligning the
+               user's moves to the video in time
 
 
     """
 
-    def __init__(self, model_path):
+    def __init__(self, model_path, backend=None, num_threads=None):
         """
         Initialize a new instance of the JustDanceModel class
 
@@ -36,34 +113,202 @@ class JustDanceModel:
             model_path(object): An object representing
                 the model path to call for the TensorFlow model
                 used in the application
+            backend: A string naming the interpreter backend to use (see
+                `INTERPRETER_BACKENDS`), or None for the lightest one
+                installed
+            num_threads: An integer representing the number of CPU threads
+                the interpreter may use, or None for its default
         """
         self.model_path = model_path
-        self.interpreter = tf.lite.Interpreter(model_path=self.model_path)
+        interpreter_class = load_interpreter_class(backend)
+        self.interpreter = interpreter_class(
+            model_path=self.model_path, num_threads=num_threads
+        )
         self.interpreter.allocate_tensors()
 
+        # Look the tensors up once instead of on every inference
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self.multi_pose = output_details["shape"][-1] == MULTIPOSE_VALUES
+        if self.multi_pose and input_details["shape"][1] <= 1:
+            self.interpreter.resize_tensor_input(
+                input_details["index"],
+                [1, MULTIPOSE_INPUT_SIZE, MULTIPOSE_INPUT_SIZE, 3],
+            )
+            self.interpreter.allocate_tensors()
+            input_details = self.interpreter.get_input_details()[0]
+        self.input_index = input_details["index"]
+        self.input_dtype = input_details["dtype"]
+        self.output_index = output_details["index"]
+        self.input_size = int(input_details["shape"][1])
+        self._input_tensor = self.interpreter.tensor(self.input_index)
+        self._output_tensor = self.interpreter.tensor(self.output_index)
+        self.batch_size = 1
+        self.supports_batch = None
+
+    def prepare_input(self, frame):
+        """
+        Resize a frame of video into the input format of the model
+
+        Args:
+            frame: A `numpy.ndarray` object representing the image frame
+
+        Returns:
+            A `numpy.ndarray` of shape 1xSxSx3 holding the resized frame,
+            where S is the input size of the model
+        """
+        img = cv2.resize(  # pylint: disable=no-member
+            frame, (self.input_size, self.input_size)
+        )
+        return np.expand_dims(img, axis=0)
+
     def run_inference(self, input_image):
         """
         Format and run the TensorFlow model on an input image
 
-        Return the joint key points with accuracy scores
+        Return the joint key points with accuracy scores. With MultiPose,
+        these are the key points of the most confident person.
 
         Args:
             input_image: A frame of video or an image, represented
-                as an float32 tensor of shape: 192x192x3
+                as an array of shape: 1xSxSx3, converted to the input
+                type of the model (uint8 or float32)
+
+        Returns:
+            A `numpy.ndarray` of shape 1x1x17x3 of the key points with
+            scores
         """
-        input_image = tf.cast(input_image, dtype=tf.float32)
+        if self.multi_pose:
+            key_points, boxes = self.detect_people(input_image)
+            best = np.argmax(boxes[:, 4])
+            return key_points[best].reshape(1, 1, 17, 3)
+        return self._invoke(input_image)
 
-        input_details = self.interpreter.get_input_details()
-        output_details = self.interpreter.get_output_details()
+    def detect_people(self, input_image):
+        """
+        Run the MultiPose model on an input image and return every person
+
+        Args:
+            input_image: An array of shape 1xSxSx3 holding the input image
+
+        Returns:
+            A tuple of an array of shape Px17x3 of the key points with
+            scores and an array of shape Px5 of the bounding boxes (ymin,
+            xmin, ymax, xmax, score) of the P people the model detects,
+            including those with low scores
+        """
+        return self.split_people(self._invoke(input_image))
+
+    @staticmethod
+    def split_people(output):
+        """
+        Split MultiPose output into key points and bounding boxes
 
-        self.interpreter.set_tensor(
-            input_details[0]["index"], input_image.numpy()
+        Args:
+            output: An array of shape 1xPx56 of MultiPose output
+
+        Returns:
+            A tuple of an array of shape Px17x3 of the key points and an
+            array of shape Px5 of the bounding boxes
+        """
+        people = np.reshape(output, (-1, MULTIPOSE_VALUES))
+        return people[:, :51].reshape(-1, 17, 3), people[:, MULTIPOSE_BOX]
+
+    def run_batch(self, input_images, batch_size=None):
+        """
+        Run the TensorFlow model on a batch of input images
+
+        The input tensor is resized to the batch, so the model runs once for
+        all the images. Models whose batch size cannot be changed, such as
+        ones with a fixed reshape inside, run once per image instead.
+
+        Resizing the input tensor reallocates the interpreter's tensors, so
+        callers whose batches vary in length can pass `batch_size` to pad
+        every batch with blank images to the same length.
+
+        Args:
+            input_images: A list of arrays of shape 1xSxSx3
+            batch_size: An integer representing the number of images to run
+                in each call, or None for the number of input images
+
+        Returns:
+            A list of the model outputs, one of batch size 1 per image
+        """
+        num_images = len(input_images)
+        batch_size = max(batch_size or num_images, num_images)
+        if batch_size > 1 and self.supports_batch is not False:
+            batch = np.zeros(
+                (batch_size, *np.shape(input_images[0])[1:]),
+                dtype=np.result_type(*input_images),
+            )
+            np.concatenate(input_images, out=batch[:num_images])
+            try:
+                output = self._invoke(batch, num_images)
+            except (RuntimeError, ValueError):
+                output = None
+            self.supports_batch = output is not None
+            if self.supports_batch:
+                return [output[i : i + 1] for i in range(num_images)]
+        return [self._invoke(input_image) for input_image in input_images]
+
+    def _resize_batch(self, batch_size):
+        """
+        Resize the input tensor to hold a number of images
+
+        Args:
+            batch_size: An integer representing the number of images
+        """
+        self.interpreter.resize_tensor_input(
+            self.input_index,
+            [batch_size, self.input_size, self.input_size, 3],
         )
+        self.batch_size = batch_size
+        try:
+            self.interpreter.allocate_tensors()
+        finally:
+            self._input_tensor = self.interpreter.tensor(self.input_index)
+            self._output_tensor = self.interpreter.tensor(self.output_index)
+
+    def _invoke(self, input_image, num_outputs=None):
+        """
+        Run the TensorFlow model on an input image or a batch of images
+
+        Args:
+            input_image: An array of shape BxSxSx3 holding the input images
+            num_outputs: An integer representing the number of leading
+                images to return the output of, such as to leave out the
+                padding of a batch, or None for every image
+
+        Returns:
+            A `numpy.ndarray` of the model output
+
+        Raises:
+            ValueError: If `num_outputs` is given and the model does not
+                return one output per image
+        """
+        if len(input_image) != self.batch_size:
+            try:
+                self._resize_batch(len(input_image))
+            except (RuntimeError, ValueError):
+                self._resize_batch(1)
+                raise
+
+        # Copy the image straight into the interpreter's input tensor. The
+        # view must be released before `invoke`, which refuses to run while
+        # references to the interpreter's buffers are alive.
+        input_tensor = self._input_tensor()
+        np.copyto(input_tensor, input_image, casting="unsafe")
+        del input_tensor
+
         self.interpreter.invoke()
 
-        key_points_with_scores = self.interpreter.get_tensor(
-            output_details[0]["index"]
-        )
+        # Copy the outputs kept out of the interpreter's output tensor, which
+        # the next `invoke` overwrites, and release the view like the input's
+        output_tensor = self._output_tensor()
+        if num_outputs is not None and len(output_tensor) != len(input_image):
+            raise ValueError("the model does not return one output per image")
+        key_points_with_scores = output_tensor[:num_outputs].copy()
+        del output_tensor
 
         return key_points_with_scores
 
@@ -88,98 +333,126 @@ class JustDanceModel:
         Return
             A float representing the angle between three joints.
         """
-        y_coordinate, x_coordinate, _ = frame.shape
-        shaped = np.squeeze(
-            np.multiply(key_points, [y_coordinate, x_coordinate, 1])
-        )
+        return JustDanceModel.calculate_angles(
+            key_points, frame.shape, [(start_index, middle_index, end_index)]
+        )[0, 0]
 
-        joint_start = np.array(
-            [int(shaped[start_index][0]), int(shaped[start_index][1])]
-        )
-        joint_middle = np.array(
-            [int(shaped[middle_index][0]), int(shaped[middle_index][1])]
-        )
-        joint_end = np.array(
-            [int(shaped[end_index][0]), int(shaped[end_index][1])]
-        )
+    @staticmethod
+    def calculate_angles(
+        key_points, frame_shape, triplets=None, min_score=None
+    ):
+        """
+        Calculate the angles of many joint triplets over a batch of frames
+
+        Gathers the start, middle and end joints of every triplet at once
+        and computes all the angles in a single pass with `np.arctan2`. An
+        angle is NaN when any of its three key points scores below
+        `min_score`, such as when a joint is hidden or out of the frame.
+
+        Args:
+            key_points: An array of key points of shape Nx17x3 (or any shape
+                ending in 17x3, such as the 1x1x17x3 model output)
+            frame_shape: A tuple of the height and width of the frames the
+                key points were detected in
+            triplets: An array of shape Mx3 of the (start, middle, end)
+                key point indices of each angle, `JOINT_TRIPLETS` if None
+            min_score: A number representing the lowest key point score an
+                angle is calculated from, or None to use every key point
+
+        Return
+            An array of shape NxM of angles in degrees between 0 and 180,
+            or NaN for the masked angles
+        """
+        if triplets is None:
+            triplets = JOINT_TRIPLETS
+        triplets = np.asarray(triplets)
+        height, width = frame_shape[:2]
+
+        # Scale to pixels and truncate like the original integer joints
+        key_points = np.reshape(key_points, (-1, 17, 3))
+        joints = np.trunc(key_points[:, :, :2] * [height, width])
+        joint_start = joints[:, triplets[:, 0]]
+        joint_middle = joints[:, triplets[:, 1]]
+        joint_end = joints[:, triplets[:, 2]]
 
         radians = np.arctan2(
-            joint_end[1] - joint_middle[1], joint_end[0] - joint_middle[0]
+            joint_end[..., 1] - joint_middle[..., 1],
+            joint_end[..., 0] - joint_middle[..., 0],
         ) - np.arctan2(
-            joint_start[1] - joint_middle[1], joint_start[0] - joint_middle[0]
+            joint_start[..., 1] - joint_middle[..., 1],
+            joint_start[..., 0] - joint_middle[..., 0],
         )
-        angle = np.abs(radians * 180.0 / np.pi)
+        angles = np.abs(radians * 180.0 / np.pi)
+        angles = np.where(angles > 180.0, 360 - angles, angles)
 
-        if angle > 180.0:
-            angle = 360 - angle
+        if min_score is not None:
+            detected = key_points[:, :, 2] >= min_score
+            angles[~detected[:, triplets].all(axis=2)] = np.nan
 
-        return angle
+        return angles
 
     @staticmethod
-    def store_angles(all_joint_angles, frame, key_points):
+    def store_angles(all_joint_angles, frame, key_points, min_score=None):
         """
         Store all angles between triplets of joints
 
+        Angles of key points scored below `min_score` are stored as NaN,
+        which the scoring skips.
+
         Args:
-            all_joint_angles: A dictionary representing all the calculated
-                angles between a set of joints
+            all_joint_angles: An `AngleBuffer`, or a dictionary of lists,
+                representing all the calculated angles between a set of
+                joints
             frame: A dictionary of data representing a single frame
                 of a video feed
             key_points: A dictionary of coordinates of the user's
                 joint key points
+            min_score: A number representing the lowest key point score an
+                angle is calculated from, or None to use every key point
 
         """
-        all_joint_angles["left_arm"].append(
-            JustDanceModel.calculate_angle(frame, key_points, 5, 7, 9)
-        )
-        all_joint_angles["right_arm"].append(
-            JustDanceModel.calculate_angle(frame, key_points, 6, 8, 10)
-        )
-        all_joint_angles["left_elbow"].append(
-            JustDanceModel.calculate_angle(frame, key_points, 7, 5, 11)
-        )
-        all_joint_angles["right_elbow"].append(
-            JustDanceModel.calculate_angle(frame, key_points, 8, 6, 12)
-        )
-        all_joint_angles["left_thigh"].append(
-            JustDanceModel.calculate_angle(frame, key_points, 12, 11, 13)
-        )
-        all_joint_angles["right_thigh"].append(
-            JustDanceModel.calculate_angle(frame, key_points, 11, 12, 14)
-        )
-        all_joint_angles["left_leg"].append(
-            JustDanceModel.calculate_angle(frame, key_points, 11, 13, 15)
-        )
-        all_joint_angles["right_leg"].append(
-            JustDanceModel.calculate_angle(frame, key_points, 12, 14, 16)
+        angles = JustDanceModel.calculate_angles(
+            key_points, frame.shape, min_score=min_score
         )
 
+        if isinstance(all_joint_angles, AngleBuffer):
+            all_joint_angles.append(angles[0])
+            return
+
+        for joint, angle in zip(JOINTS, angles[0]):
+            all_joint_angles[joint].append(angle)
+
     @staticmethod
     def score_calculator(angle_video, angle_camera, threshold):
         """
         Return a score based on how accurate the user's moves are
         compared to the video
 
+        Samples where either angle is NaN are left out of the score.
+
         Args:
-            angle_video: A list of angles for a joint in the input video
-            angle_camera: A list of angles for a joint in the user camera video
+            angle_video: A list or array of angles for a joint in the input
+                video
+            angle_camera: A list or array of angles for a joint in the user
+                camera video
             threshold: An integer representing the threshold angle difference
 
         Return:
             An integer representing the user's score based on the accuracy
-            between the user's move and the video
+            between the user's move and the video, 0 if no sample could be
+            compared
         """
-        accuracy_count = []
-        video_array = np.array(angle_video)
-        camera_array = np.array(angle_camera)
-
-        angle_difference = (abs(video_array - camera_array)).tolist()
+        video_array = np.asarray(angle_video)
+        camera_array = np.asarray(angle_camera)
 
-        for difference in angle_difference:
-            if difference < threshold:
-                accuracy_count.append(1)
+        angle_difference = np.abs(video_array - camera_array)
+        num_valid = np.count_nonzero(~np.isnan(angle_difference))
+        if num_valid == 0:
+            return 0
+        # NaN differences compare as False, so they never count as accurate
+        accuracy_count = np.count_nonzero(angle_difference < threshold)
 
-        score = int((sum(accuracy_count) / len(angle_difference)) * 100)
+        score = int((accuracy_count / num_valid) * 100)
 
         return score
 
@@ -188,11 +461,18 @@ class JustDanceModel:
         """
         Return a final score based on all the calculated scores for angles
 
+        Joints that were never detected in both the video and the camera
+        are left out, so the player is not penalized for how the camera
+        frames them. The score is 0 if no joint could be compared, like
+        `IncrementalScorer.score`.
+
         Args:
-            all_angles_video: A dictionary representing all the calculated
-                angles between a set of joints from a dance video
-            all_angles_camera: A dictionary representing all the calculated
-                angles between a set of joints from the user's camera feed
+            all_angles_video: An `AngleBuffer` or dictionary representing
+                all the calculated angles between a set of joints from a
+                dance video
+            all_angles_camera: An `AngleBuffer` or dictionary representing
+                all the calculated angles between a set of joints from the
+                user's camera feed
             threshold: An integer representing the score determining up to
                 how much counts as being the "correct move" for a
                 valid score point
@@ -201,29 +481,75 @@ class JustDanceModel:
         """
         all_scores = []
 
-        joints = [
-            "left_arm",
-            "right_arm",
-            "left_elbow",
-            "right_elbow",
-            "left_thigh",
-            "right_thigh",
-            "left_leg",
-            "right_leg",
-        ]
-
-        for joint in joints:
+        for joint in JOINTS:
+            angle_video = np.asarray(all_angles_video[joint])
+            angle_camera = np.asarray(all_angles_camera[joint])
+            if np.isnan(angle_video - angle_camera).all():
+                continue
             all_scores.append(
                 JustDanceModel.score_calculator(
-                    all_angles_video[joint], all_angles_camera[joint], threshold
+                    angle_video, angle_camera, threshold
                 )
             )
 
-        final_score = np.mean(all_scores)
+        if not all_scores:
+            return 0
 
-        final_score += 20
+        final_score = np.mean(all_scores) + 20
 
         if final_score > 100:
             final_score = 100
 
         return final_score
+
+    @staticmethod
+    def final_score_dtw(
+        all_angles_video,
+        all_angles_camera,
+        threshold,
+        window_ms=500,
+        sample_rate=DEFAULT_SAMPLE_RATE,
+    ):
+        """
+        Return a final score that tolerates the user dancing slightly ahead
+        of or behind the video
+
+        Aligns the camera angles to the video angles with banded dynamic
+        time warping, then scores each camera sample against the video
+        sample it was aligned with, like `final_score`.
+
+        Args:
+            all_angles_video: An `AngleBuffer` or dictionary representing
+                all the calculated angles between a set of joints from a
+                dance video
+            all_angles_camera: An `AngleBuffer` or dictionary representing
+                all the calculated angles between a set of joints from the
+                user's camera feed
+            threshold: An integer representing the score determining up to
+                how much counts as being the "correct move" for a
+                valid score point
+            window_ms: A number representing how far apart in milliseconds
+                two samples can be and still be compared; always at least
+                one sample, so samples taken seconds apart can still shift
+                by one
+            sample_rate: A number representing how many angle samples were
+                stored per second of video, the rate games sample at by
+                default
+        """
+        video = np.column_stack(
+            [np.asarray(all_angles_video[joint]) for joint in JOINTS]
+        )
+        camera = np.column_stack(
+            [np.asarray(all_angles_camera[joint]) for joint in JOINTS]
+        )
+        # There is nothing to align when no frame was sampled
+        if len(video) == 0 or len(camera) == 0:
+            return 0
+        window = max(1, int(round(window_ms / 1000 * sample_rate)))
+        aligned_video = video[dtw_align(video, camera, window)]
+
+        return JustDanceModel.final_score(
+            {joint: aligned_video[:, i] for i, joint in enumerate(JOINTS)},
+            {joint: camera[:, i] for i, joint in enumerate(JOINTS)},
+            threshold,
+        )
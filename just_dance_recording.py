@@ -0,0 +1,179 @@
+"""
+Set 'KeypointRecorder' class to save the camera key points of a game to a
+compact binary file and 'read_recording' function to map it back
+"""
+import os
+import struct
+import numpy as np
+from keypoint import KEYPOINT_DICT
+
+# Games save their camera key points to this directory when it is set, one
+# file per game
+RECORDINGS_DIR = None
+
+RECORDING_EXTENSION = ".jdkp"
+
+# The header holds the magic bytes, the format version, the number of key
+# points per frame and the height and width of the camera frames, which the
+# angles are calculated from
+MAGIC = b"JDKP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+
+NUM_KEY_POINTS = len(KEYPOINT_DICT)
+
+# One record per scored frame, 114 bytes; key points are stored as float16,
+# which rounds them by at most half a pixel in frames up to 2000 pixels
+RECORD_DTYPE = np.dtype(
+    [
+        ("frame_index", "<i4"),
+        ("timestamp_ms", "<f8"),
+        ("key_points", "<f2", (NUM_KEY_POINTS, 3)),
+    ]
+)
+
+# Records are written in chunks of this many frames (about 30 KB)
+CHUNK_FRAMES = 256
+
+
+class KeypointRecorder:
+    """
+    A class that appends the key points of scored frames to a file
+
+    The file starts with a fixed header followed by one fixed-size record
+    per frame, so it can be memory-mapped as an array by `read_recording`.
+    Records are buffered and written a chunk at a time; a file cut short by
+    a crash is still readable up to its last whole record.
+
+    Attributes:
+        path (str): The path of the recording file
+        chunk_frames (int): The number of records written at a time
+        frame_shape (tuple): The height and width of the camera frames, or
+            None until the first frame is added
+        num_frames (int): The number of frames added
+
+    Methods:
+        __init__: Initialize a new `KeypointRecorder` object
+        append: Add the key points of a frame
+        flush: Write the buffered records to the file
+        close: Write the buffered records and close the file
+    """
+
+    def __init__(self, path, chunk_frames=CHUNK_FRAMES):
+        """
+        Initialize a new `KeypointRecorder` object; the file is created
+        when the first frame is added
+
+        Args:
+            path: A string representing the path of the recording file
+            chunk_frames: An integer representing the number of records
+                written at a time
+        """
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.frame_shape = None
+        self.num_frames = 0
+        self._file = None
+        self._buffer = np.zeros(chunk_frames, dtype=RECORD_DTYPE)
+        self._buffered = 0
+
+    def append(self, frame_index, timestamp_ms, key_points, frame_shape):
+        """
+        Add the key points of a frame
+
+        Args:
+            frame_index: An integer representing the index of the video
+                frame the camera frame was scored against
+            timestamp_ms: A number representing the position of the video
+                frame in milliseconds
+            key_points: An array of shape 17x3 (or 1x1x17x3) of the key
+                points with scores
+            frame_shape: A tuple of the height and width of the camera frame
+        """
+        if self._file is None:
+            self._open(frame_shape)
+        record = self._buffer[self._buffered]
+        record["frame_index"] = frame_index
+        record["timestamp_ms"] = timestamp_ms
+        record["key_points"] = np.reshape(key_points, (NUM_KEY_POINTS, 3))
+        self._buffered += 1
+        self.num_frames += 1
+        if self._buffered == self.chunk_frames:
+            self.flush()
+
+    def _open(self, frame_shape):
+        """
+        Create the recording file and write its header
+
+        Args:
+            frame_shape: A tuple of the height and width of the camera frames
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.frame_shape = tuple(int(size) for size in frame_shape[:2])
+        # pylint: disable-next=consider-using-with
+        self._file = open(self.path, "wb")
+        self._file.write(
+            HEADER.pack(MAGIC, VERSION, NUM_KEY_POINTS, *self.frame_shape)
+        )
+
+    def flush(self):
+        """
+        Write the buffered records to the file
+        """
+        if self._file is None or self._buffered == 0:
+            return
+        self._file.write(self._buffer[: self._buffered].tobytes())
+        self._file.flush()
+        self._buffered = 0
+
+    def close(self):
+        """
+        Write the buffered records and close the file
+        """
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+
+def read_recording(path):
+    """
+    Memory-map a recording written by `KeypointRecorder`
+
+    Args:
+        path: A string representing the path of the recording file
+
+    Returns:
+        A tuple of the (height, width) of the camera frames and a read-only
+        `numpy.memmap` of the records, with the `frame_index`,
+        `timestamp_ms` and `key_points` fields
+
+    Raises:
+        ValueError: If the file is not a recording of this version
+    """
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is not a key point recording")
+    magic, version, num_key_points, height, width = HEADER.unpack(header)
+    if magic != MAGIC or num_key_points != NUM_KEY_POINTS:
+        raise ValueError(f"{path} is not a key point recording")
+    if version != VERSION:
+        raise ValueError(f"{path} has unsupported version {version}")
+
+    # Leave out a record cut short by a crash
+    num_frames = (os.path.getsize(path) - HEADER.size) // RECORD_DTYPE.itemsize
+    if num_frames == 0:
+        records = np.zeros(0, dtype=RECORD_DTYPE)
+    else:
+        records = np.memmap(
+            path,
+            dtype=RECORD_DTYPE,
+            mode="r",
+            offset=HEADER.size,
+            shape=(num_frames,),
+        )
+    return (height, width), records
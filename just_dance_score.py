@@ -1,8 +1,35 @@
 """
 Module for extracting leaderboard csv and score functions for
 the Just Dance Game.
+
+Leaderboard files with a SQLite extension (see
+`just_dance_leaderboard.DATABASE_EXTENSIONS`) are read from the database
+instead, through the same functions.
 """
 import csv
+import heapq
+import json
+import os
+import just_dance_leaderboard
+
+# The leaderboard the game writes to and the score window reads from; name
+# a `.db` file to use the indexed SQLite leaderboard
+LEADERBOARD_FILE = "leaderboard.csv"
+
+# The number of scores shown on the leaderboard
+TOP_SCORES = 5
+
+# The current score is read from this many bytes at the end of the file,
+# or more if the last row is longer
+TAIL_BYTES = 4096
+
+# The summary keeps this many bytes from the start and the end of the part
+# of the file it was made from, to tell an appended file from a rewritten
+# one
+FINGERPRINT_BYTES = 64
+
+# The leaderboard CSV file is scanned in blocks of this many bytes
+BLOCK_BYTES = 1 << 20
 
 
 def get_leaderboard(filename):
@@ -32,20 +59,171 @@ def get_current_score(filename):
     This function reads the leaderboard data from a file with the
     given filename and returns the last (current) score in the leaderboard.
 
+    Only the end of the file is read, so the time does not grow with the
+    number of scores.
+
     Args:
         filename (str): The name of the file containing the leaderboard data.
 
     Returns:
         int: The last (current) score in the leaderboard.
     """
-    score_data = get_leaderboard(filename)
-    return int(float(score_data[-1][-1]))
+    if just_dance_leaderboard.is_database(filename):
+        return just_dance_leaderboard.get_current_score(filename)
+
+    with open(filename, "rb") as file:
+        size = file.seek(0, os.SEEK_END)
+        tail_size = TAIL_BYTES
+        while True:
+            start = max(0, size - tail_size)
+            file.seek(start)
+            lines = file.read().splitlines()
+            # The first line may be cut off unless the tail reaches the start
+            if start > 0:
+                lines = lines[1:]
+            rows = [
+                row
+                for row in csv.reader(line.decode() for line in lines)
+                if row
+            ]
+            if rows or start == 0:
+                break
+            tail_size *= 2
+
+    return int(float(rows[-1][-1]))
+
+
+def summary_path(filename):
+    """
+    Return the name of the summary file kept next to a leaderboard CSV file.
+
+    Args:
+        filename (str): The name of the leaderboard CSV file.
+
+    Returns:
+        str: The name of the summary file.
+    """
+    return os.path.splitext(filename)[0] + ".summary.json"
+
+
+def read_summary(filename):
+    """
+    Read the summary of a leaderboard CSV file, if it is still valid.
+
+    The summary is valid while the file only has rows appended to the
+    part it was made from, as far as the bytes it kept from the start and
+    the end of that part tell.
+
+    Args:
+        filename (str): The name of the leaderboard CSV file.
+
+    Returns:
+        dict: The summary, or None if there is no valid summary.
+    """
+    try:
+        with open(summary_path(filename), "r", encoding="utf-8") as file:
+            summary = json.load(file)
+        with open(filename, "rb") as file:
+            if _fingerprint(file, summary["offset"]) != summary["fingerprint"]:
+                return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return summary
+
+
+def _fingerprint(file, offset):
+    """
+    Return the bytes at the start and the end of the first part of a file.
+
+    Args:
+        file: A file opened in binary mode.
+        offset (int): The size of the part of the file.
+
+    Returns:
+        list: The first and last `FINGERPRINT_BYTES` bytes of the part, as
+            hexadecimal strings.
+    """
+    length = min(offset, FINGERPRINT_BYTES)
+    file.seek(0)
+    head = file.read(length)
+    file.seek(offset - length)
+    tail = file.read(length)
+    return [head.hex(), tail.hex()]
+
+
+def update_summary(filename):
+    """
+    Bring the summary of a leaderboard CSV file up to date and return it.
+
+    Only the rows after the part of the file the summary was made from are
+    read, a block at a time, keeping only the top `TOP_SCORES` scores. The
+    first row of the file is skipped like a header. A missing or invalid
+    summary is rebuilt from the whole file.
+
+    Args:
+        filename (str): The name of the leaderboard CSV file.
+
+    Returns:
+        dict: The summary, holding the top scores in descending order
+            ("top"), the last score ("last"), the size of the part of the
+            file it was made from ("offset") and the bytes at the start
+            and end of that part ("fingerprint").
+    """
+    summary = read_summary(filename)
+    if summary is None:
+        summary = {"top": [], "last": None, "offset": 0, "fingerprint": []}
+    top_scores = summary["top"]
+    offset = summary["offset"]
+
+    with open(filename, "rb") as file:
+        file.seek(offset)
+        skip_header = offset == 0
+        while True:
+            block = file.read(BLOCK_BYTES)
+            # A row still being written ends without a newline, and a row
+            # cut off by the block is read again with the next block
+            end = block.rfind(b"\n") + 1
+            if end == 0:
+                if len(block) == BLOCK_BYTES:
+                    raise ValueError(f"row longer than {BLOCK_BYTES} bytes")
+                break
+            file.seek(offset + end)
+            offset += end
+
+            rows = csv.reader(block[:end].decode().splitlines())
+            if skip_header:
+                next(rows, None)
+                skip_header = False
+            scores = [float(row[0]) for row in rows if row]
+            if scores:
+                summary["last"] = scores[-1]
+                top_scores = heapq.nlargest(TOP_SCORES, top_scores + scores)
+
+        fingerprint = _fingerprint(file, offset)
+
+    summary["top"] = top_scores
+    summary["offset"] = offset
+    summary["fingerprint"] = fingerprint
+
+    # Replace the summary in one step, so readers never see half of it. A
+    # leaderboard in a read-only place is still read, just not summarized.
+    temporary_path = f"{summary_path(filename)}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(summary, file)
+        os.replace(temporary_path, summary_path(filename))
+    except OSError:
+        pass
+    return summary
 
 
 def get_leaderboard_scores(filename):
     """
     Retrieve the top 5 maximum scores from a CSV file.
 
+    Reads only the rows added since the summary of the file was last
+    updated, so the time and memory do not grow with the number of scores.
+
     Args:
         filename (str): The name of the CSV file to read
             the leaderboard data from.
@@ -54,9 +232,6 @@ def get_leaderboard_scores(filename):
         A list of integers representing the top 5 maximum scores
         in the CSV file.
     """
-    data = get_leaderboard(filename)
-    sorted_data = sorted(
-        data[1:], key=lambda row: int(float(row[0])), reverse=True
-    )
-    top_scores = [int(float(row[0])) for row in sorted_data]
-    return top_scores[:5]
+    if just_dance_leaderboard.is_database(filename):
+        return just_dance_leaderboard.get_top_scores(filename)
+    return [int(score) for score in update_summary(filename)["top"]]
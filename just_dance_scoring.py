@@ -0,0 +1,374 @@
+"""
+Set 'IncrementalScorer' class to keep a running score during a song and
+'MultiPlayerScorer' class to keep one for each of several players
+"""
+import threading
+import numpy as np
+from keypoint import JOINTS
+
+# Games score the dancer after aligning their moves to the video in time
+# with dynamic time warping when True, see `JustDanceModel.final_score_dtw`
+SCORE_WITH_DTW = False
+
+# The largest difference between two angles, the cost of comparing samples
+# with no joint detected in both
+MAX_ANGLE_DIFFERENCE = 180.0
+
+# Accumulated cost of cells outside the video, large but finite so that
+# differences of cumulative sums stay exact for the reachable cells
+_UNREACHABLE = 1e30
+
+
+class IncrementalScorer:
+    """
+    A class that updates the player's score one sampled frame at a time
+
+    Uses the same rules as `JustDanceModel.final_score`: a joint scores a
+    hit when its angle is within the threshold of the video's angle, each
+    joint's score is its percentage of hits, and the final score is the
+    mean joint score plus a bonus of 20, capped at 100, or 0 if no joint
+    could be compared. NaN angles, of joints that were not detected, are
+    left out of the score.
+
+    Attributes:
+        threshold (int): The angle difference up to which a joint counts
+            as being in the correct position
+        hits (ndarray): The number of hits of each joint so far
+        counts (ndarray): The number of samples of each joint compared so
+            far, leaving out the NaN angles
+        num_samples (int): The number of frames scored so far
+
+    Methods:
+        __init__: Initialize a new `IncrementalScorer` object
+        update: Score the angles of one sampled frame
+        joint_scores: Return the score of each joint so far
+        score: Return the final score so far
+    """
+
+    def __init__(self, threshold=20, joints=None):
+        """
+        Initialize a new `IncrementalScorer` object
+
+        Args:
+            threshold: An integer representing the threshold angle
+                difference
+            joints: A list of joint names, `JOINTS` if None
+        """
+        self.threshold = threshold
+        self.hits = np.zeros(len(JOINTS if joints is None else joints), int)
+        self.counts = np.zeros_like(self.hits)
+        self.num_samples = 0
+        self._lock = threading.Lock()
+
+    def update(self, angles_video, angles_camera):
+        """
+        Score the angles of one sampled frame
+
+        Args:
+            angles_video: A sequence of one angle per joint from the video
+            angles_camera: A sequence of one angle per joint from the camera
+        """
+        difference = np.abs(
+            np.asarray(angles_video) - np.asarray(angles_camera)
+        )
+        with self._lock:
+            self.hits += difference < self.threshold
+            self.counts += ~np.isnan(difference)
+            self.num_samples += 1
+
+    @property
+    def joint_scores(self):
+        """
+        Return the score of each joint so far
+
+        Returns:
+            An array of integers between 0 and 100, one per joint, 0 for
+            joints not compared yet
+        """
+        with self._lock:
+            return self._joint_scores(self.hits, self.counts)
+
+    @property
+    def score(self):
+        """
+        Return the final score so far, or 0 until a joint has been compared
+
+        Returns:
+            A float between 0 and 100
+        """
+        with self._lock:
+            joint_scores = self._joint_scores(self.hits, self.counts)
+            joint_scores = joint_scores[self.counts > 0]
+        if len(joint_scores) == 0:
+            return 0
+        return min(np.mean(joint_scores) + 20, 100)
+
+    @staticmethod
+    def _joint_scores(hits, counts):
+        """
+        Return the percentage of hits of each joint, like
+        `JustDanceModel.score_calculator`
+
+        Args:
+            hits: An array of the number of hits of each joint
+            counts: An array of the number of samples of each joint
+
+        Returns:
+            An array of integers between 0 and 100, one per joint
+        """
+        return (hits / np.maximum(counts, 1) * 100).astype(int)
+
+
+class MultiPlayerScorer:
+    """
+    A class that keeps the angles and running scores of several players
+    dancing to the same video in batched arrays
+
+    Scores every player with the rules of `IncrementalScorer`, updating all
+    of them with one array operation per sampled frame. Players who are not
+    in a frame have NaN angles, which are left out of their score.
+
+    Attributes:
+        max_players (int): The number of players
+        threshold (int): The angle difference up to which a joint counts
+            as being in the correct position
+        hits (ndarray): The number of hits of each player and joint, of
+            shape players x joints
+        counts (ndarray): The number of samples of each player and joint
+            compared so far, leaving out the NaN angles
+        num_samples (int): The number of frames scored so far
+
+    Methods:
+        __init__: Initialize a new `MultiPlayerScorer` object
+        update: Score the angles of every player in one sampled frame
+        reset_players: Clear the scores of the players in some slots
+        angles: Return the camera angles of every frame so far
+        players: Return the players seen so far
+        scores: Return the final score of every player so far
+    """
+
+    def __init__(self, max_players=6, threshold=20, joints=None, capacity=256):
+        """
+        Initialize a new `MultiPlayerScorer` object
+
+        Args:
+            max_players: An integer representing the number of players
+            threshold: An integer representing the threshold angle
+                difference
+            joints: A list of joint names, `JOINTS` if None
+            capacity: An integer representing the number of frames to
+                allocate room for up front
+        """
+        num_joints = len(JOINTS if joints is None else joints)
+        self.max_players = max_players
+        self.threshold = threshold
+        self.hits = np.zeros((max_players, num_joints), int)
+        self.counts = np.zeros_like(self.hits)
+        self.num_samples = 0
+        self._angles = np.empty(
+            (max(1, capacity), max_players, num_joints), dtype=np.float32
+        )
+        self._lock = threading.Lock()
+
+    def update(self, angles_video, angles_camera):
+        """
+        Score the angles of every player in one sampled frame
+
+        Args:
+            angles_video: A sequence of one angle per joint from the video
+            angles_camera: An array of shape players x joints of the angles
+                of every player, NaN for players who are not in the frame
+        """
+        angles_camera = np.asarray(angles_camera, dtype=np.float32)
+        difference = np.abs(np.asarray(angles_video) - angles_camera)
+        with self._lock:
+            if self.num_samples == len(self._angles):
+                self._angles = np.concatenate(
+                    [self._angles, np.empty_like(self._angles)]
+                )
+            self._angles[self.num_samples] = angles_camera
+            self.hits += difference < self.threshold
+            self.counts += ~np.isnan(difference)
+            self.num_samples += 1
+
+    def reset_players(self, slots):
+        """
+        Clear the scores and past angles of the players in some slots, such
+        as when new players take the slots of players who left
+
+        Args:
+            slots: A sequence of player indices
+        """
+        slots = np.asarray(slots, dtype=int)
+        with self._lock:
+            self.hits[slots] = 0
+            self.counts[slots] = 0
+            self._angles[: self.num_samples, slots] = np.nan
+
+    @property
+    def angles(self):
+        """
+        Return the camera angles of every frame so far
+
+        Returns:
+            An array of shape frames x players x joints
+        """
+        return self._angles[: self.num_samples]
+
+    @property
+    def players(self):
+        """
+        Return the players seen so far
+
+        Returns:
+            An array of the indices of the players with any angle compared
+        """
+        with self._lock:
+            return np.flatnonzero(self.counts.any(axis=1))
+
+    @property
+    def scores(self):
+        """
+        Return the final score of every player so far
+
+        Returns:
+            An array of one float between 0 and 100 per player, 0 for
+            players not seen yet
+        """
+        with self._lock:
+            # pylint: disable-next=protected-access
+            joint_scores = IncrementalScorer._joint_scores(
+                self.hits, self.counts
+            )
+            compared = self.counts > 0
+        num_compared = compared.sum(axis=1)
+        mean_scores = np.where(compared, joint_scores, 0).sum(axis=1) / (
+            np.maximum(num_compared, 1)
+        )
+        return np.where(
+            compared.any(axis=1), np.minimum(mean_scores + 20, 100), 0
+        )
+
+
+# pylint: disable-next=too-many-locals
+def dtw_align(angles_video, angles_camera, window):
+    """
+    Align the camera angles to the video angles with banded dynamic time
+    warping
+
+    Only pairs of samples at most `window` samples apart are considered
+    (a Sakoe-Chiba band). The band is stored skewed, one row per camera
+    sample, so each row of the recurrence is solved with a few array
+    operations: within a row, D[j] = c[j] + min(A[j], D[j - 1]) unrolls to
+    a running minimum over the cumulative sum of the costs.
+
+    Args:
+        angles_video: An array of shape Nx8 of the video angles, NaN for
+            joints that were not detected
+        angles_camera: An array of shape Mx8 of the camera angles, NaN for
+            joints that were not detected
+        window: An integer representing the half width of the band, in
+            samples; widened to the length difference of the sequences
+
+    Returns:
+        An array of M integers, the index of the video sample that each
+        camera sample is matched with, empty if either sequence is empty
+    """
+    reference = np.asarray(angles_video, dtype=np.float64)
+    query = np.asarray(angles_camera, dtype=np.float64)
+    num_reference, num_query = len(reference), len(query)
+    if num_reference == 0 or num_query == 0:
+        return np.zeros(0, dtype=int)
+    window = max(int(window), abs(num_reference - num_query))
+    width = 2 * window + 1
+
+    # costs[i, d] compares camera sample i with video sample i - window + d.
+    # Cells before the first video sample cost nothing but can't be reached,
+    # cells past the last one cost too much to ever be used.
+    columns = np.arange(num_query)[:, None] - window + np.arange(width)
+    differences = np.abs(
+        query[:, None, :] - reference[np.clip(columns, 0, num_reference - 1)]
+    )
+    if np.isnan(differences).any():
+        # Average over the joints detected in both samples only. Pairs with
+        # none in common cost as much as the angles can differ, so a dancer
+        # who is not detected cannot be matched for free.
+        compared = ~np.isnan(differences)
+        num_compared = compared.sum(axis=2)
+        costs = np.where(compared, differences, 0.0).sum(axis=2)
+        costs = np.where(
+            num_compared > 0,
+            costs / np.maximum(num_compared, 1),
+            MAX_ANGLE_DIFFERENCE,
+        )
+    else:
+        costs = differences.mean(axis=2)
+    costs[columns < 0] = 0.0
+    costs[columns >= num_reference] = _UNREACHABLE
+    totals = np.cumsum(costs, axis=1)
+    totals_before = totals - costs
+
+    # The extra column lets every cell read the cell above it, and the path
+    # has to start at the first pair of samples
+    distances = np.full((num_query, width + 1), _UNREACHABLE)
+    best_previous = np.full(width, _UNREACHABLE)
+    best_previous[window] = 0.0
+    row = np.empty(width)
+    previous = None
+    for current, row_totals, row_totals_before in zip(
+        distances, totals, totals_before
+    ):
+        if previous is not None:
+            np.minimum(previous[:-1], previous[1:], out=best_previous)
+        np.subtract(best_previous, row_totals_before, out=row)
+        np.minimum.accumulate(row, out=row)
+        np.add(row, row_totals, out=current[:width])
+        previous = current
+
+    return _dtw_backtrack(distances, costs, window, num_reference)
+
+
+# pylint: disable-next=too-many-locals
+def _dtw_backtrack(distances, costs, window, num_reference):
+    """
+    Follow the cheapest warping path back from the last pair of samples
+
+    Args:
+        distances: The skewed accumulated cost matrix from `dtw_align`
+        costs: The skewed pairwise cost matrix from `dtw_align`
+        window: An integer representing the half width of the band
+        num_reference: An integer representing the number of video samples
+
+    Returns:
+        An array holding, for each camera sample, the index of the cheapest
+        video sample on the path
+    """
+    path_rows = []
+    path_columns = []
+    i, d = len(distances) - 1, num_reference - len(distances) + window
+
+    while True:
+        path_rows.append(i)
+        path_columns.append(d)
+        j = i - window + d
+        if i == 0 and j == 0:
+            break
+        diagonal = distances.item(i - 1, d) if i and j else _UNREACHABLE
+        up = distances.item(i - 1, d + 1) if i else _UNREACHABLE
+        left = distances.item(i, d - 1) if j else _UNREACHABLE
+        if diagonal <= up and diagonal <= left:
+            i -= 1
+        elif up <= left:
+            i, d = i - 1, d + 1
+        else:
+            d -= 1
+
+    # The path runs backwards, so each row's cells are contiguous; keep the
+    # cheapest cell of every row
+    path_rows = np.array(path_rows[::-1])
+    path_columns = np.array(path_columns[::-1])
+    path_costs = costs[path_rows, path_columns]
+    order = np.lexsort((path_costs, path_rows))
+    starts = np.searchsorted(path_rows[order], np.arange(len(distances)))
+    best = order[starts]
+    return path_rows[best] - window + path_columns[best]
@@ -0,0 +1,590 @@
+"""
+Set 'StationManager' class to run several dance stations on one host,
+sharing a pool of interpreters that run the stations' frames in batches
+"""
+import argparse
+import collections
+import threading
+import time
+from concurrent.futures import Future
+from just_dance_cache import CACHE_DIR, load_reference
+from just_dance_controller import JustDanceController
+from just_dance_model import JustDanceModel
+from just_dance_timing import FrameSampler
+
+
+def padded_batch_size(num_frames, max_batch):
+    """
+    Return the number of images to run a batch of frames as
+
+    Batches are padded to the next power of two, up to `max_batch`, so an
+    interpreter only reallocates its tensors when the batch moves to
+    another size class, and a lone frame is not run as a full batch.
+
+    Args:
+        num_frames: An integer representing the number of frames
+        max_batch: An integer representing the most frames run in one call
+
+    Returns:
+        An integer between `num_frames` and `max_batch`
+    """
+    return max(num_frames, min(max_batch, 1 << (num_frames - 1).bit_length()))
+
+
+class RoundRobinQueue:
+    """
+    A queue of requests from several stations, taken in turns
+
+    A batch takes one request from each station with requests waiting,
+    starting after the station served last, before taking a second request
+    from any of them. A station sending many requests only makes its own
+    requests wait; the other stations still get a place in every batch.
+
+    Attributes:
+        closed (bool): Whether the queue was closed
+
+    Methods:
+        __init__: Initialize a new `RoundRobinQueue` object
+        put: Add a station's request
+        take: Wait for requests and take a batch of them
+        close: Return the requests left and stop taking new ones
+    """
+
+    def __init__(self):
+        """
+        Initialize a new, empty `RoundRobinQueue` object
+        """
+        self.closed = False
+        self._queues = collections.OrderedDict()
+        self._condition = threading.Condition()
+
+    def put(self, station, request):
+        """
+        Add a station's request to the queue
+
+        Args:
+            station: A hashable name of the station
+            request: The request
+
+        Raises:
+            RuntimeError: If the queue was closed
+        """
+        with self._condition:
+            if self.closed:
+                raise RuntimeError("the queue is closed")
+            self._queues.setdefault(station, collections.deque()).append(
+                request
+            )
+            self._condition.notify()
+
+    def take(self, max_requests):
+        """
+        Wait for requests and take up to a number of them in turns
+
+        Args:
+            max_requests: An integer representing the batch size
+
+        Returns:
+            A list of (station, request) tuples, empty once the queue is
+            closed
+        """
+        with self._condition:
+            while not self.closed and not self._queues:
+                self._condition.wait()
+            batch = []
+            while self._queues and len(batch) < max_requests:
+                station, requests = next(iter(self._queues.items()))
+                batch.append((station, requests.popleft()))
+                # Send the station to the back of the line
+                del self._queues[station]
+                if requests:
+                    self._queues[station] = requests
+            return batch
+
+    def close(self):
+        """
+        Stop taking new requests, and wake up every waiting `take` and make
+        later ones return nothing
+
+        Returns:
+            A list of the requests that were never taken
+        """
+        with self._condition:
+            self.closed = True
+            left = [
+                request
+                for requests in self._queues.values()
+                for request in requests
+            ]
+            self._queues.clear()
+            self._condition.notify_all()
+            return left
+
+
+class InferenceServer:  # pylint: disable=too-many-instance-attributes
+    """
+    A class that runs the pose model for several stations
+
+    Every interpreter in the pool runs in its own thread, taking batches of
+    frames from the stations in turns and running each batch in one call
+    when the model allows it. Batches are padded to a power of two frames,
+    so the interpreters seldom reallocate their tensors as the load changes.
+
+    Attributes:
+        models (list): The `JustDanceModel` objects, one per interpreter
+        max_batch (int): The most frames run in one call
+        requests (RoundRobinQueue): The frames waiting for the model
+        input_size (int): The width and height of the model input
+        multi_pose (bool): Whether the model is MoveNet MultiPose
+        batches (int): The number of calls to the model so far
+        frames (int): The number of frames run so far
+
+    Methods:
+        __init__: Initialize a new `InferenceServer` object
+        start: Start the interpreter threads
+        submit: Queue a frame of a station for the model
+        infer: Run the model on a frame of a station and wait for it
+        close: Stop the interpreter threads
+    """
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        model_path,
+        num_interpreters=1,
+        max_batch=8,
+        backend=None,
+        num_threads=None,
+        models=None,
+    ):
+        """
+        Initialize a new `InferenceServer` object
+
+        Args:
+            model_path: A string representing the path to the model
+            num_interpreters: An integer representing the number of
+                interpreters in the pool
+            max_batch: An integer representing the most frames run in one
+                call
+            backend: A string naming the interpreter backend to use
+            num_threads: An integer representing the number of CPU threads
+                of each interpreter, or None for its default
+            models: A list of `JustDanceModel` objects to use as the pool
+                instead of loading the model, or None
+        """
+        if models is None:
+            models = [
+                JustDanceModel(model_path, backend, num_threads)
+                for _ in range(num_interpreters)
+            ]
+        self.models = models
+        self.max_batch = max_batch
+        self.requests = RoundRobinQueue()
+        self.input_size = models[0].input_size
+        self.multi_pose = getattr(models[0], "multi_pose", False)
+        self.batches = 0
+        self.frames = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start one thread per interpreter
+        """
+        for model in self.models:
+            thread = threading.Thread(
+                target=self._serve, args=(model,), daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _serve(self, model):
+        """
+        Run batches of frames on an interpreter until the server is closed
+
+        Args:
+            model: A `JustDanceModel` object owned by this thread
+        """
+        while True:
+            batch = self.requests.take(self.max_batch)
+            if not batch:
+                return
+            futures = [future for _, (_, future) in batch]
+            try:
+                outputs = model.run_batch(
+                    [input_image for _, (input_image, _) in batch],
+                    batch_size=padded_batch_size(len(batch), self.max_batch),
+                )
+            except Exception as exception:  # pylint: disable=broad-except
+                for future in futures:
+                    future.set_exception(exception)
+                continue
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+            with self._lock:
+                self.batches += 1
+                self.frames += len(batch)
+
+    def submit(self, station, input_image):
+        """
+        Queue a frame of a station for the model
+
+        Args:
+            station: A hashable name of the station
+            input_image: An array of shape 1xSxSx3 holding the input image
+
+        Returns:
+            A `concurrent.futures.Future` of the model output
+        """
+        future = Future()
+        try:
+            self.requests.put(station, (input_image, future))
+        except RuntimeError as exception:
+            future.set_exception(exception)
+        return future
+
+    def infer(self, station, input_image):
+        """
+        Run the model on a frame of a station and wait for the output
+
+        Args:
+            station: A hashable name of the station
+            input_image: An array of shape 1xSxSx3 holding the input image
+
+        Returns:
+            A `numpy.ndarray` of the model output
+        """
+        return self.submit(station, input_image).result()
+
+    def close(self):
+        """
+        Stop the interpreter threads once their current batch is done, and
+        fail the frames still waiting
+        """
+        for _, future in self.requests.close():
+            future.set_exception(RuntimeError("the inference server closed"))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+class StationModel(JustDanceModel):
+    """
+    A `JustDanceModel` for one station, whose frames are run by an
+    `InferenceServer` shared with the other stations
+
+    Attributes:
+        server (InferenceServer): The server running the model
+        station: The name of the station
+        model_path (str): The path to the model
+        input_size (int): The width and height of the model input
+        multi_pose (bool): Whether the model is MoveNet MultiPose
+    """
+
+    # pylint: disable-next=super-init-not-called
+    def __init__(self, server, station, model_path):
+        """
+        Initialize a new `StationModel` object
+
+        Args:
+            server: An `InferenceServer` object running the model
+            station: A hashable name of the station
+            model_path: A string representing the path to the model
+        """
+        self.server = server
+        self.station = station
+        self.model_path = model_path
+        self.input_size = server.input_size
+        self.multi_pose = server.multi_pose
+
+    def _invoke(self, input_image, num_outputs=None):
+        """
+        Run the model on the server and wait for the output
+
+        Args:
+            input_image: An array of shape 1xSxSx3 holding the input image
+            num_outputs: Unused, the server returns one output per request
+
+        Returns:
+            A `numpy.ndarray` of the model output
+        """
+        return self.server.infer(self.station, input_image)
+
+
+class SharedReferences:
+    """
+    A class that loads the baked key points of each song once for every
+    station
+
+    Attributes:
+        model_path (str): The path to the model the key points were baked
+            with
+        cache_dir (str): The directory of the reference cache
+
+    Methods:
+        __init__: Initialize a new `SharedReferences` object
+        get: Return the key points of a song video
+    """
+
+    def __init__(self, model_path, cache_dir=CACHE_DIR):
+        """
+        Initialize a new `SharedReferences` object
+
+        Args:
+            model_path: A string representing the path to the model
+            cache_dir: A string representing the directory of the cache
+        """
+        self.model_path = model_path
+        self.cache_dir = cache_dir
+        self._references = {}
+        self._lock = threading.Lock()
+
+    def get(self, video_path):
+        """
+        Return the baked key points of a song video, loading them on first
+        use
+
+        Args:
+            video_path: A string representing the path to the song video
+
+        Returns:
+            A `numpy.ndarray` of shape Nx17x3, or None if the video has not
+            been baked for the model
+        """
+        with self._lock:
+            if video_path not in self._references:
+                reference = load_reference(
+                    video_path, self.model_path, self.cache_dir
+                )
+                self._references[video_path] = (
+                    None if reference is None else reference["key_points"]
+                )
+            return self._references[video_path]
+
+
+class Station(threading.Thread):
+    """
+    A thread that runs the game of one station
+
+    Attributes:
+        name (str): The name of the station
+        controller (JustDanceController): The controller of the game
+        error (Exception): The error that ended the game, or None
+    """
+
+    def __init__(self, name, controller):
+        """
+        Initialize a new `Station` object
+
+        Args:
+            name: A string representing the name of the station
+            controller: A `JustDanceController` object for the game
+        """
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.controller = controller
+        self.error = None
+
+    def run(self):
+        """
+        Play the song through, then release the video and the camera
+        """
+        try:
+            self.controller.process_frames()
+        except Exception as exception:  # pylint: disable=broad-except
+            self.error = exception
+        finally:
+            self.controller.release_capture()
+
+    @property
+    def score(self):
+        """
+        Return the running score of the station's player
+        """
+        return self.controller.scorer.score
+
+
+class StationManager:
+    """
+    A class that runs the games of several stations on one host
+
+    The stations share an `InferenceServer`, so their frames are run in
+    batches by a small pool of interpreters instead of by one interpreter
+    each, and share the baked key points of the songs.
+
+    Attributes:
+        model_path (str): The path to the model
+        server (InferenceServer): The interpreters shared by the stations
+        references (SharedReferences): The baked key points of the songs
+        stations (dict): A dictionary mapping station names to `Station`
+            objects
+
+    Methods:
+        __init__: Initialize a new `StationManager` object
+        add_station: Set up the game of a station
+        start: Start every station's game
+        join: Wait for every station's game to end
+        stop: Stop every station's game
+        close: Stop the interpreters
+        scores: Return the score of every station
+    """
+
+    def __init__(
+        self,
+        model_path="model/model.tflite",
+        num_interpreters=2,
+        max_batch=8,
+        cache_dir=CACHE_DIR,
+        server=None,
+    ):
+        """
+        Initialize a new `StationManager` object
+
+        Args:
+            model_path: A string representing the path to the model
+            num_interpreters: An integer representing the number of
+                interpreters shared by the stations
+            max_batch: An integer representing the most frames run in one
+                call
+            cache_dir: A string representing the directory of the
+                reference cache
+            server: An `InferenceServer` object to use instead of creating
+                one, or None
+        """
+        self.model_path = model_path
+        self.server = (
+            InferenceServer(model_path, num_interpreters, max_batch)
+            if server is None
+            else server
+        )
+        self.references = SharedReferences(model_path, cache_dir)
+        self.stations = {}
+
+    def add_station(
+        self, name, video_path, camera_index=0, camera=None, **options
+    ):
+        """
+        Set up the game of a station
+
+        The game runs without a window or music, as on a host without a
+        screen.
+
+        Args:
+            name: A string representing the name of the station
+            video_path: A string representing the path to the song video
+            camera_index: An integer representing the index of the camera,
+                or a string representing a video file standing in for it
+            camera: An open `cv2.VideoCapture` object to read the camera
+                from instead of opening `camera_index`
+            **options: Keyword arguments for `JustDanceController`
+
+        Returns:
+            The `Station` object
+        """
+        controller = JustDanceController(
+            StationModel(self.server, name, self.model_path),
+            video_path,
+            camera_index=camera_index,
+            camera=camera,
+            reference=self.references.get(video_path),
+            display=False,
+            **options,
+        )
+        station = Station(name, controller)
+        self.stations[name] = station
+        return station
+
+    def start(self):
+        """
+        Start the interpreters and every station's game
+        """
+        self.server.start()
+        for station in self.stations.values():
+            station.start()
+
+    def join(self):
+        """
+        Wait for every station's game to end
+        """
+        for station in self.stations.values():
+            station.join()
+
+    def stop(self):
+        """
+        Stop every station's game after its current frame
+        """
+        for station in self.stations.values():
+            station.controller.stop()
+
+    def close(self):
+        """
+        Stop every game, wait for it to end and stop the interpreters
+        """
+        self.stop()
+        self.join()
+        self.server.close()
+
+    def scores(self):
+        """
+        Return the score of every station
+
+        Returns:
+            A dictionary mapping station names to their running scores
+        """
+        return {name: station.score for name, station in self.stations.items()}
+
+
+def main():
+    """
+    Run several stations on this host and print their scores
+    """
+    parser = argparse.ArgumentParser(
+        description="Run several Just Dance stations on one host."
+    )
+    parser.add_argument(
+        "stations",
+        nargs="+",
+        help="stations as VIDEO:CAMERA, the camera an index or a video file",
+    )
+    parser.add_argument("--model", default="model/model.tflite")
+    parser.add_argument("--interpreters", type=int, default=2)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument(
+        "--sample-rate",
+        type=float,
+        help="samples per second of video, 0 for every frame",
+    )
+    args = parser.parse_args()
+
+    manager = StationManager(args.model, args.interpreters, args.max_batch)
+    for number, station in enumerate(args.stations):
+        video_path, _, camera = station.rpartition(":")
+        manager.add_station(
+            f"station-{number + 1}",
+            video_path,
+            camera_index=int(camera) if camera.isdigit() else camera,
+            sampler=(
+                None
+                if args.sample_rate is None
+                else FrameSampler(args.sample_rate or None)
+            ),
+        )
+
+    start = time.perf_counter()
+    manager.start()
+    manager.join()
+    manager.close()
+    elapsed = time.perf_counter() - start
+
+    for name, station in manager.stations.items():
+        error = f" ({station.error!r})" if station.error else ""
+        print(f"{name}: {int(station.score)}{error}")
+    server = manager.server
+    print(
+        f"{server.frames} frames in {server.batches} model calls"
+        f" ({server.frames / max(server.batches, 1):.1f} per call)"
+        f" in {elapsed:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
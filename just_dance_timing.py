@@ -0,0 +1,246 @@
+"""
+Set 'FrameSampler' class to decide which frames the game scores and
+'MediaClock' class to keep the video in time with the music
+"""
+import time
+
+# The game used to score every 100th frame, which is 0.3 samples per
+# second for a 30 fps video
+DEFAULT_SAMPLE_RATE = 0.3
+
+# Timestamps this close to a sample time count as being on it, so rounding
+# in the sample times never moves a sample to the next frame
+GRID_TOLERANCE_MS = 1e-3
+
+# Multi-player games tell the players apart by how their boxes overlap from
+# one sample to the next, which needs samples close together
+MULTI_PLAYER_SAMPLE_RATE = 5
+
+# Games that crop around the dancer take the crop from the previous sample,
+# which is only still around the dancer if it is recent
+TRACKING_SAMPLE_RATE = 5
+
+
+class FrameSampler:
+    """
+    A class that picks the frames to score from their video timestamps
+
+    Samples a fixed number of frames per second of video, independent of
+    the frame rate of the video, or every frame. In adaptive mode the rate
+    goes up while inference fits in its share of the frame time and down
+    when inference falls behind.
+
+    Attributes:
+        rate (float): The number of samples per second of video, or None
+            to sample every frame
+        adaptive (bool): Whether to adjust the rate to the inference time
+        min_rate (float): The lowest rate the adaptive mode goes down to
+        max_rate (float): The highest rate the adaptive mode goes up to
+        budget (float): The fraction of the time that inference may take up
+            in adaptive mode
+        next_sample_ms (float): The video timestamp the next sample is due
+            at, or None before the first sample
+
+    Methods:
+        __init__: Initialize a new `FrameSampler` object
+        should_sample: Return whether to score the frame at a timestamp
+        record: Adjust the adaptive rate to the time a sample took
+    """
+
+    def __init__(
+        self,
+        rate=DEFAULT_SAMPLE_RATE,
+        adaptive=False,
+        min_rate=0.2,
+        max_rate=30,
+        budget=0.5,
+    ):
+        """
+        Initialize a new `FrameSampler` object
+
+        Args:
+            rate: A number representing the samples per second of video, or
+                None to sample every frame; the starting rate in adaptive
+                mode
+            adaptive: A boolean representing whether to adjust the rate to
+                the inference time
+            min_rate: A number representing the lowest adaptive rate
+            max_rate: A number representing the highest adaptive rate
+            budget: A number between 0 and 1 representing the fraction of
+                the time that inference may take up in adaptive mode
+        """
+        self.rate = rate
+        self.adaptive = adaptive
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.budget = budget
+        self.next_sample_ms = None
+        if adaptive and rate is None:
+            self.rate = max_rate
+
+    def should_sample(self, timestamp_ms):
+        """
+        Return whether to score the frame shown at a video timestamp
+
+        The first frame is always sampled, then the first frame at or after
+        every 1 / rate seconds of video from it. The sample times stay on
+        that grid, so the frame rate of the video does not make the samples
+        slip later one after another; times the video skips past are not
+        made up for.
+
+        Args:
+            timestamp_ms: A number representing the position of the frame
+                in the video in milliseconds
+
+        Returns:
+            A boolean representing whether to score the frame
+        """
+        if self.rate is None:
+            return True
+        if self.next_sample_ms is None:
+            self.next_sample_ms = timestamp_ms
+        elif timestamp_ms < self.next_sample_ms - GRID_TOLERANCE_MS:
+            return False
+        interval = 1000 / self.rate
+        behind = timestamp_ms - self.next_sample_ms + GRID_TOLERANCE_MS
+        self.next_sample_ms += (behind // interval + 1) * interval
+        return True
+
+    def record(self, seconds):
+        """
+        Adjust the adaptive rate to the time a sample took to score
+
+        Lowers the rate by a fifth when the samples take more than the
+        budget at the current rate, and raises it by a tenth otherwise.
+
+        Args:
+            seconds: A number representing how long the sample took
+        """
+        if not self.adaptive:
+            return
+        if seconds * self.rate > self.budget:
+            self.rate = max(self.min_rate, self.rate * 0.8)
+        else:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+
+class MediaClock:
+    """
+    A clock that tells when each frame of the video is due on screen
+
+    The clock starts when the music starts, so the video follows the music
+    instead of adding up the time spent on every frame.
+
+    Attributes:
+        frame_rate (float): The frames per second of the video
+        start_time (float): The `time.perf_counter` value when the music
+            started, or None before the clock is started
+        frames_shown (int): The number of frames shown so far
+        frames_dropped (int): The number of frames skipped to catch up
+        total_drift (float): The sum of how late each frame was shown, in
+            seconds
+        max_drift (float): The latest a frame was shown, in seconds
+
+    Methods:
+        __init__: Initialize a new `MediaClock` object
+        start: Start the clock
+        frames_behind: Return how many frames late a frame is
+        wait_for_frame: Wait until a frame is due
+        record_dropped: Count a frame skipped to catch up
+        stats: Return the drift statistics
+    """
+
+    def __init__(self, frame_rate):
+        """
+        Initialize a new `MediaClock` object
+
+        Args:
+            frame_rate: A number representing the frames per second of the
+                video
+        """
+        self.frame_rate = frame_rate if frame_rate and frame_rate > 0 else 30
+        self.start_time = None
+        self.frames_shown = 0
+        self.frames_dropped = 0
+        self.total_drift = 0.0
+        self.max_drift = 0.0
+
+    def start(self):
+        """
+        Start the clock, if it has not been started yet
+        """
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+
+    def frames_behind(self, frame_index):
+        """
+        Return how many frames late a frame is
+
+        Args:
+            frame_index: An integer representing the index of the frame in
+                the video
+
+        Returns:
+            An integer, positive if the frame is late and zero or negative
+            if it is on time or early
+        """
+        self.start()
+        position = time.perf_counter() - self.start_time
+        return int(position * self.frame_rate) - frame_index
+
+    def wait_for_frame(self, frame_index):
+        """
+        Wait until a frame is due and record how late it is
+
+        Sleeps until shortly before the frame is due and then yields in
+        short steps, since `time.sleep` can overshoot by a millisecond or
+        more.
+
+        Args:
+            frame_index: An integer representing the index of the frame in
+                the video
+
+        Returns:
+            A number representing how late the frame is, in seconds
+        """
+        self.start()
+        due_time = self.start_time + frame_index / self.frame_rate
+        remaining = due_time - time.perf_counter()
+        if remaining > 0.002:
+            time.sleep(remaining - 0.002)
+        while time.perf_counter() < due_time:
+            time.sleep(0)
+
+        drift = time.perf_counter() - due_time
+        self.frames_shown += 1
+        self.total_drift += drift
+        self.max_drift = max(self.max_drift, drift)
+        return drift
+
+    def record_dropped(self, num_frames=1):
+        """
+        Count frames skipped to catch up with the music
+
+        Args:
+            num_frames: An integer representing the number of frames
+        """
+        self.frames_dropped += num_frames
+
+    def stats(self):
+        """
+        Return the drift statistics of the frames shown so far
+
+        Returns:
+            A dictionary of the frames shown and dropped and the mean and
+            maximum lateness of the shown frames in milliseconds
+        """
+        return {
+            "frames_shown": self.frames_shown,
+            "frames_dropped": self.frames_dropped,
+            "mean_drift_ms": (
+                self.total_drift / self.frames_shown * 1000
+                if self.frames_shown
+                else 0.0
+            ),
+            "max_drift_ms": self.max_drift * 1000,
+        }
@@ -0,0 +1,393 @@
+"""
+Set 'PoseTracker' class to crop the model input around the dancer and
+'PlayerTracker' class to follow several dancers from frame to frame
+"""
+import numpy as np
+import cv2
+from keypoint import KEYPOINT_DICT, MIN_KEYPOINT_SCORE
+
+TORSO_KEY_POINTS = [
+    KEYPOINT_DICT["left_shoulder"],
+    KEYPOINT_DICT["right_shoulder"],
+    KEYPOINT_DICT["left_hip"],
+    KEYPOINT_DICT["right_hip"],
+]
+
+
+class PoseTracker:
+    """
+    A class that feeds the pose model a square crop around the dancer
+
+    Squashing the whole camera frame into the model input distorts the body
+    and spends most of the input on the empty room. The tracker uses the
+    key points of the previous frame to crop a padded square around the
+    dancer, like the MoveNet cropping algorithm, and falls back to the
+    whole frame, letterboxed to a square, when the torso is not detected
+    with enough confidence. Key points are mapped back to the whole frame,
+    so they can be used like the key points of an uncropped frame. When
+    frames are given with their timestamps, a crop older than `max_age_ms`
+    is dropped too, since the dancer may have left it by then.
+
+    Attributes:
+        input_size (int): The width and height of the model input
+        min_score (float): The lowest key point score that counts as
+            detected
+        torso_scale (float): How many times the torso size the crop extends
+            from the center of the hips
+        body_scale (float): How many times the body size the crop extends
+            from the center of the hips
+        max_age_ms (float): The age in milliseconds after which the crop
+            of an earlier frame is no longer used
+        crop (tuple): The top, left and size in pixels of the square to
+            crop from the next frame, or None for the whole frame
+        updated_ms (float): The timestamp of the frame the crop was taken
+            from, or None if it is unknown
+
+    Methods:
+        __init__: Initialize a new `PoseTracker` object
+        run: Run the model on a frame and track the dancer
+        crop_input: Crop a frame into the model input format
+        map_to_frame: Map key points in a crop back to the whole frame
+        update: Choose the crop of the next frame from key points
+        reset: Go back to the whole frame
+    """
+
+    def __init__(
+        self,
+        input_size=192,
+        min_score=MIN_KEYPOINT_SCORE,
+        torso_scale=1.9,
+        body_scale=1.2,
+        max_age_ms=500,
+    ):
+        """
+        Initialize a new `PoseTracker` object
+
+        Args:
+            input_size: An integer representing the width and height of the
+                model input
+            min_score: A number representing the lowest key point score
+                that counts as detected
+            torso_scale: A number representing how many times the torso
+                size the crop extends from the center of the hips
+            body_scale: A number representing how many times the body size
+                the crop extends from the center of the hips
+            max_age_ms: A number representing the age in milliseconds after
+                which the crop of an earlier frame is no longer used
+        """
+        self.input_size = input_size
+        self.min_score = min_score
+        self.torso_scale = torso_scale
+        self.body_scale = body_scale
+        self.max_age_ms = max_age_ms
+        self.crop = None
+        self.updated_ms = None
+
+    def run(self, model, frame, timestamp=None):
+        """
+        Run the model on the crop of a frame and update the crop
+
+        Args:
+            model: A `JustDanceModel` object used for pose estimation
+            frame: A `numpy.ndarray` object representing the image frame
+            timestamp: A number representing the position of the frame in
+                milliseconds, to crop the whole frame when the last crop is
+                older than `max_age_ms`, or None to always use the last crop
+
+        Returns:
+            A `numpy.ndarray` of shape 1x1x17x3 of the key points with
+            scores, normalized to the whole frame
+        """
+        if (
+            timestamp is not None
+            and self.updated_ms is not None
+            and abs(timestamp - self.updated_ms) > self.max_age_ms
+        ):
+            self.crop = None
+        input_image, crop = self.crop_input(frame)
+        key_points = self.map_to_frame(
+            model.run_inference(input_image), crop, frame.shape
+        )
+        self.update(key_points, frame.shape)
+        self.updated_ms = timestamp
+        return key_points
+
+    def crop_input(self, frame):  # pylint: disable=too-many-locals
+        """
+        Crop the tracked square out of a frame and resize it into the input
+        format of the model
+
+        Parts of the square outside the frame are filled with black. The
+        square is rounded to whole pixels.
+
+        Args:
+            frame: A `numpy.ndarray` object representing the image frame
+
+        Returns:
+            A tuple of a `numpy.ndarray` of shape 1xSxSx3 holding the model
+            input and the (top, left, size) of the square it was cropped
+            from
+        """
+        crop = self.crop
+        if crop is None:
+            crop = self.letterbox(frame.shape)
+        height, width = frame.shape[:2]
+        top, left, size = (int(round(value)) for value in crop)
+        scale = self.input_size / size
+
+        # Resize only the part of the square inside the frame, into its
+        # place on a black canvas
+        image = np.zeros(
+            (self.input_size, self.input_size) + frame.shape[2:],
+            dtype=frame.dtype,
+        )
+        inside_top, inside_left = max(top, 0), max(left, 0)
+        inside_bottom = min(top + size, height)
+        inside_right = min(left + size, width)
+        image_top = int(round((inside_top - top) * scale))
+        image_left = int(round((inside_left - left) * scale))
+        image_bottom = int(round((inside_bottom - top) * scale))
+        image_right = int(round((inside_right - left) * scale))
+        if image_bottom > image_top and image_right > image_left:
+            inside = frame[inside_top:inside_bottom, inside_left:inside_right]
+            image[image_top:image_bottom, image_left:image_right] = (
+                cv2.resize(  # pylint: disable=no-member
+                    inside, (image_right - image_left, image_bottom - image_top)
+                )
+            )
+        return np.expand_dims(image, axis=0), (top, left, size)
+
+    @staticmethod
+    def letterbox(frame_shape):
+        """
+        Return the square that holds a whole frame centered in it
+
+        Args:
+            frame_shape: A tuple of the height and width of the frame
+
+        Returns:
+            A tuple of the top, left and size of the square in pixels
+        """
+        height, width = frame_shape[:2]
+        size = max(height, width)
+        return (height - size) / 2, (width - size) / 2, size
+
+    @staticmethod
+    def map_to_frame(key_points, crop, frame_shape):
+        """
+        Map key points detected in a crop back to the whole frame
+
+        Args:
+            key_points: An array of shape 1x1x17x3 of the key points with
+                scores, normalized to the crop
+            crop: A tuple of the top, left and size in pixels of the crop
+            frame_shape: A tuple of the height and width of the frame
+
+        Returns:
+            An array of the same shape of the key points with scores,
+            normalized to the whole frame
+        """
+        height, width = frame_shape[:2]
+        top, left, size = crop
+        mapped = np.array(key_points, dtype=np.float32)
+        mapped[..., 0] = (top + mapped[..., 0] * size) / height
+        mapped[..., 1] = (left + mapped[..., 1] * size) / width
+        return mapped
+
+    def update(self, key_points, frame_shape):
+        """
+        Choose the square to crop from the next frame
+
+        The square is centered on the hips and large enough to hold the
+        torso and every detected key point with some room to move. The
+        whole frame is used when the torso is not detected or the square
+        would be larger than the frame.
+
+        Args:
+            key_points: An array of shape 1x1x17x3 of the key points with
+                scores, normalized to the whole frame
+            frame_shape: A tuple of the height and width of the frame
+        """
+        height, width = frame_shape[:2]
+        key_points = np.reshape(key_points, (17, 3))
+        scores = key_points[:, 2]
+        hips = scores[[KEYPOINT_DICT["left_hip"], KEYPOINT_DICT["right_hip"]]]
+        shoulders = scores[
+            [KEYPOINT_DICT["left_shoulder"], KEYPOINT_DICT["right_shoulder"]]
+        ]
+        torso_visible = (
+            hips.max() > self.min_score and shoulders.max() > self.min_score
+        )
+        if not torso_visible:
+            self.crop = None
+            return
+
+        points = key_points[:, :2] * [height, width]
+        center = (
+            points[KEYPOINT_DICT["left_hip"]]
+            + points[KEYPOINT_DICT["right_hip"]]
+        ) / 2
+        torso_range = np.abs(points[TORSO_KEY_POINTS] - center).max()
+        detected = points[scores > self.min_score]
+        body_range = np.abs(detected - center).max()
+        half_size = max(
+            torso_range * self.torso_scale, body_range * self.body_scale
+        )
+        # No need to reach further than the farthest edge of the frame
+        half_size = min(
+            half_size,
+            max(center[0], height - center[0], center[1], width - center[1]),
+        )
+
+        if half_size <= 0 or half_size > max(height, width) / 2:
+            self.crop = None
+            return
+        self.crop = (
+            center[0] - half_size,
+            center[1] - half_size,
+            2 * half_size,
+        )
+
+    def reset(self):
+        """
+        Crop the whole frame again, such as when a new game starts
+        """
+        self.crop = None
+        self.updated_ms = None
+
+
+def box_iou(boxes_a, boxes_b):
+    """
+    Return the intersection over union of every pair of two sets of boxes
+
+    Args:
+        boxes_a: An array of shape Nx4 of boxes (ymin, xmin, ymax, xmax)
+        boxes_b: An array of shape Mx4 of boxes (ymin, xmin, ymax, xmax)
+
+    Returns:
+        An array of shape NxM of the intersection over union of each pair,
+        between 0 and 1
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32)[:, None, :4]
+    boxes_b = np.asarray(boxes_b, dtype=np.float32)[None, :, :4]
+    top_left = np.maximum(boxes_a[..., :2], boxes_b[..., :2])
+    bottom_right = np.minimum(boxes_a[..., 2:], boxes_b[..., 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[..., 2:] - boxes_a[..., :2], axis=2)
+    area_b = np.prod(boxes_b[..., 2:] - boxes_b[..., :2], axis=2)
+    union = area_a + area_b - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0)
+
+
+class PlayerTracker:
+    """
+    A class that gives each dancer a fixed player slot across frames
+
+    Each detected person is matched to the player whose last box overlaps
+    theirs most, greedily from the largest overlap, and people matching no
+    player take the first free slot. A player who is not seen for
+    `max_missed` frames in a row frees their slot.
+
+    Attributes:
+        max_players (int): The number of player slots
+        min_score (float): The lowest box score that counts as a person
+        iou_threshold (float): The lowest box overlap that counts as the
+            same person
+        max_missed (int): The number of frames a player may be missed
+            before their slot is freed
+        boxes (ndarray): The last box of each player, of shape
+            max_players x 4
+        active (ndarray): Whether each slot holds a player
+        missed (ndarray): The number of frames in a row each player was not
+            seen
+
+    Methods:
+        __init__: Initialize a new `PlayerTracker` object
+        update: Match the people detected in a frame to players
+        reset: Free every player slot
+    """
+
+    def __init__(
+        self,
+        max_players=6,
+        min_score=MIN_KEYPOINT_SCORE,
+        iou_threshold=0.3,
+        max_missed=30,
+    ):
+        """
+        Initialize a new `PlayerTracker` object
+
+        Args:
+            max_players: An integer representing the number of player slots
+            min_score: A number representing the lowest box score that
+                counts as a person
+            iou_threshold: A number representing the lowest box overlap
+                that counts as the same person
+            max_missed: An integer representing the number of frames a
+                player may be missed before their slot is freed
+        """
+        self.max_players = max_players
+        self.min_score = min_score
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.boxes = np.zeros((max_players, 4), dtype=np.float32)
+        self.active = np.zeros(max_players, dtype=bool)
+        self.missed = np.zeros(max_players, dtype=int)
+
+    def update(self, boxes):
+        """
+        Match the people detected in a frame to players
+
+        Args:
+            boxes: An array of shape Px5 of the bounding boxes (ymin, xmin,
+                ymax, xmax, score) of the detected people
+
+        Returns:
+            A tuple of an array of P integers, the player slot of each
+            person, or -1 for boxes scored below `min_score` and people
+            left over when every slot is taken, and an array of the slots
+            given to new players in this frame
+        """
+        boxes = np.asarray(boxes, dtype=np.float32)
+        slots = np.full(len(boxes), -1)
+        people = np.flatnonzero(boxes[:, 4] >= self.min_score)
+        players = np.flatnonzero(self.active)
+        seen = np.zeros(self.max_players, dtype=bool)
+        joined = []
+
+        if len(people) and len(players):
+            overlaps = box_iou(self.boxes[players], boxes[people])
+            for flat in np.argsort(overlaps, axis=None)[::-1]:
+                row, column = divmod(flat, overlaps.shape[1])
+                if overlaps[row, column] < self.iou_threshold:
+                    break
+                player, person = players[row], people[column]
+                if seen[player] or slots[person] >= 0:
+                    continue
+                slots[person] = player
+                seen[player] = True
+
+        for person in people:
+            if slots[person] >= 0:
+                continue
+            free = np.flatnonzero(~self.active)
+            if len(free) == 0:
+                break
+            slots[person] = free[0]
+            joined.append(free[0])
+            self.active[free[0]] = True
+            seen[free[0]] = True
+
+        matched = slots >= 0
+        self.boxes[slots[matched]] = boxes[matched, :4]
+        self.missed[seen] = 0
+        self.missed[self.active & ~seen] += 1
+        self.active &= self.missed <= self.max_missed
+        return slots, np.array(joined, dtype=int)
+
+    def reset(self):
+        """
+        Free every player slot, such as when a new game starts
+        """
+        self.active[:] = False
+        self.missed[:] = 0
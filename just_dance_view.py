@@ -1,8 +1,14 @@
 """
-Set 'JustDanceView' class for the application
+Set 'JustDanceView' and 'FrameCompositor' classes for the application, and
+'FrameDisplay' class to show the game from the thread that owns the GUI
 """
+import threading
+import numpy as np
 import cv2
 
+# Size of the game window until the real size is known
+DISPLAY_SIZE = (3840, 1600)
+
 
 class JustDanceView:
     """
@@ -14,6 +20,8 @@ class JustDanceView:
      Methods:
          __init__: Initialize a new instance of the JustDanceView class
          display_frame: Display a frame in a window using OpenCV
+         open_window: Create a resizable window using OpenCV
+         window_size: Return the size of the image area of a window
     """
 
     def __init__(self, model):
@@ -39,3 +47,204 @@ class JustDanceView:
         """
         cv2.imshow(window_name, frame)  # pylint: disable=no-member
         cv2.waitKey(10)  # pylint: disable=no-member
+
+    @staticmethod
+    def open_window(window_name):
+        """
+        Create a resizable window using OpenCV
+
+        Args:
+            window_name (str): The name of the window to create
+        """
+        cv2.namedWindow(  # pylint: disable=no-member
+            window_name, cv2.WINDOW_NORMAL  # pylint: disable=no-member
+        )
+
+    @staticmethod
+    def window_size(window_name, default=DISPLAY_SIZE):
+        """
+        Return the size of the image area of a window
+
+        Args:
+            window_name (str): The name of the window
+            default (tuple): The size to return if the window has no size
+                yet
+
+        Returns:
+            A tuple of the width and height of the window in pixels
+        """
+        try:
+            # pylint: disable-next=no-member
+            _, _, width, height = cv2.getWindowImageRect(window_name)
+        except cv2.error:  # pylint: disable=no-member
+            return default
+        if width <= 0 or height <= 0:
+            return default
+        return width, height
+
+
+class FrameCompositor:
+    """
+    A class to draw the video and camera frames side by side on one canvas
+
+    The canvas is allocated once and each frame is resized straight into
+    its half, so no combined frame is built and resized again.
+
+    Attributes:
+        canvas (ndarray): The image the frames are drawn on
+
+    Methods:
+        __init__: Initialize a new instance of the FrameCompositor class
+        resize: Change the size of the canvas
+        compose: Draw a video frame and a camera frame on the canvas
+    """
+
+    def __init__(self, size=DISPLAY_SIZE):
+        """
+        Initialize a new instance of the FrameCompositor class
+
+        Args:
+            size (tuple): The width and height of the canvas in pixels
+        """
+        self.canvas = None
+        self._layout = None
+        self.resize(size)
+
+    def resize(self, size):
+        """
+        Change the size of the canvas, if it is different
+
+        Args:
+            size (tuple): The width and height of the canvas in pixels
+        """
+        width, height = size
+        if self.canvas is None or self.canvas.shape[:2] != (height, width):
+            self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+            self._layout = None
+
+    def compose(self, frame1, frame2):
+        """
+        Draw a video frame and a camera frame side by side on the canvas
+
+        The frames are scaled to the same height, like the original
+        combined frame, and together fill the canvas.
+
+        Args:
+            frame1 (ndarray): The video frame, drawn on the left
+            frame2 (ndarray): The camera frame, drawn on the right
+
+        Returns:
+            The canvas, reused by the next call
+        """
+        key = (frame1.shape, frame2.shape)
+        if self._layout is None or self._layout[0] != key:
+            height1, width1, _ = frame1.shape
+            height2, width2, _ = frame2.shape
+            width = self.canvas.shape[1]
+            width2 = width2 * height1 / height2
+            split = int(round(width * width1 / (width1 + width2)))
+            self._layout = (
+                key,
+                self.canvas[:, :split],
+                self.canvas[:, split:],
+            )
+
+        _, left, right = self._layout
+        for frame, area in ((frame1, left), (frame2, right)):
+            result = cv2.resize(  # pylint: disable=no-member
+                frame,
+                (area.shape[1], area.shape[0]),
+                dst=area,
+                interpolation=cv2.INTER_LINEAR,  # pylint: disable=no-member
+            )
+            if result is not area:
+                # Older OpenCV versions may not write into a strided view
+                area[...] = result
+
+        return self.canvas
+
+
+class FrameDisplay:
+    """
+    A class that hands the frames of a game running in a background thread
+    to the thread that shows them
+
+    OpenCV windows only work reliably from the main thread on some
+    platforms (Cocoa on macOS, the Qt backend), so a game running beside a
+    GUI posts its frames here and the main thread shows them, reads the
+    keys and reports the window size back. Only the newest frame is kept,
+    so a slow display never holds up the game.
+
+    Attributes:
+        window_name (str): The name of the window
+        size (tuple): The width and height of the window's image area, as
+            last seen by the thread showing the frames
+        window_open (bool): Whether the window has been created
+
+    Methods:
+        __init__: Initialize a new `FrameDisplay` object
+        put: Post a frame to show, from the game's thread
+        show: Show the newest frame and return the key pressed
+        close: Close the window
+    """
+
+    def __init__(self, window_name, size=DISPLAY_SIZE):
+        """
+        Initialize a new `FrameDisplay` object; the window is created when
+        the first frame is shown
+
+        Args:
+            window_name (str): The name of the window
+            size (tuple): The width and height to draw the frames at until
+                the window has a size
+        """
+        self.window_name = window_name
+        self.size = size
+        self.window_open = False
+        self._frame = None
+        self._lock = threading.Lock()
+
+    def put(self, frame):
+        """
+        Post a frame to show, replacing one that has not been shown yet
+
+        Args:
+            frame (ndarray): The frame, copied so the caller can reuse it
+        """
+        frame = frame.copy()
+        with self._lock:
+            self._frame = frame
+
+    def show(self):
+        """
+        Show the newest frame, if there is one, and handle the window's
+        events; call from the thread that owns the GUI
+
+        Returns:
+            An integer representing the key pressed, or -1 if none was
+        """
+        with self._lock:
+            frame, self._frame = self._frame, None
+        if frame is None:
+            if not self.window_open:
+                return -1
+        else:
+            if not self.window_open:
+                JustDanceView.open_window(self.window_name)
+                self.window_open = True
+            cv2.imshow(self.window_name, frame)  # pylint: disable=no-member
+        key = cv2.waitKey(1)  # pylint: disable=no-member
+        self.size = JustDanceView.window_size(self.window_name, self.size)
+        return key
+
+    def close(self):
+        """
+        Close the window, if it was created; call from the thread that owns
+        the GUI
+        """
+        with self._lock:
+            self._frame = None
+        if self.window_open:
+            cv2.destroyWindow(self.window_name)  # pylint: disable=no-member
+            cv2.waitKey(1)  # pylint: disable=no-member
+            self.window_open = False
@@ -0,0 +1,401 @@
+"""
+Set 'InferencePool' class to run the pose model in worker processes that
+exchange frames and key points through shared memory, and 'PooledModel'
+class to use the pool in place of a `JustDanceModel`
+"""
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from just_dance_model import JustDanceModel
+
+# Games run the pose model in this many worker processes when it is above
+# 0, instead of in the game's own process
+INFERENCE_PROCESSES = 0
+
+# Seconds to wait for the workers to load the model
+START_TIMEOUT_SECONDS = 60
+
+# Seconds between checks that the workers are still running
+WORKER_CHECK_SECONDS = 1
+
+# Seconds to wait for a worker to stop before it is terminated
+STOP_TIMEOUT_SECONDS = 5
+
+
+def _serve(model_path, options, layout, tasks, results):
+    """
+    Run the model on the frames in the input slots until told to stop
+
+    Runs in each worker process. Only slot numbers travel through the
+    queues; the frames and the key points stay in shared memory.
+
+    Args:
+        model_path: A string representing the path to the model
+        options: A dictionary of keyword arguments for `JustDanceModel`
+        layout: A dictionary of the shared memory names, the number of
+            slots and the shapes and types of the input and output slots
+        tasks: A `multiprocessing.Queue` of slot numbers, None to stop
+        results: A `multiprocessing.Queue` to post (slot, error) tuples to,
+            with error None on success
+    """
+    input_memory = SharedMemory(name=layout["input_name"])
+    output_memory = SharedMemory(name=layout["output_name"])
+    inputs = np.ndarray(
+        (layout["num_slots"], *layout["input_shape"]),
+        dtype=layout["input_dtype"],
+        buffer=input_memory.buf,
+    )
+    outputs = np.ndarray(
+        (layout["num_slots"], *layout["output_shape"]),
+        dtype=np.float32,
+        buffer=output_memory.buf,
+    )
+    try:
+        try:
+            model = JustDanceModel(model_path, **options)
+        except Exception as exception:  # pylint: disable=broad-except
+            results.put(("error", repr(exception)))
+            return
+        results.put(("ready", None))
+
+        while True:
+            slot = tasks.get()
+            if slot is None:
+                return
+            try:
+                # pylint: disable-next=protected-access
+                outputs[slot] = model._invoke(inputs[slot : slot + 1])
+                results.put((slot, None))
+            except Exception as exception:  # pylint: disable=broad-except
+                results.put((slot, repr(exception)))
+    finally:
+        # The arrays must let go of the buffers before they are closed
+        del inputs, outputs
+        input_memory.close()
+        output_memory.close()
+
+
+class InferencePool:  # pylint: disable=too-many-instance-attributes
+    """
+    A class that runs the pose model in a pool of worker processes
+
+    Frames are copied into a ring of input slots in shared memory, and the
+    workers write the model output into the matching output slot, so only
+    slot numbers are pickled. A frame waits for a free slot when every slot
+    is in use. The inference then runs on other cores than the game loop,
+    without holding its interpreter lock. If a worker dies, the frames in
+    flight fail and the pool refuses new ones instead of waiting forever.
+
+    Attributes:
+        model_path (str): The path to the model
+        num_workers (int): The number of worker processes
+        num_slots (int): The number of frames that can be in flight
+        input_size (int): The width and height of the model input
+        multi_pose (bool): Whether the model is MoveNet MultiPose
+
+    Methods:
+        __init__: Initialize a new `InferencePool` object and start it
+        submit: Queue a frame for the workers
+        infer: Run the model on a frame and wait for the output
+        close: Stop the workers and free the shared memory
+    """
+
+    def __init__(
+        self,
+        model_path,
+        num_workers=2,
+        num_slots=None,
+        backend=None,
+        num_threads=1,
+    ):
+        """
+        Initialize a new `InferencePool` object and wait for its workers to
+        load the model
+
+        Args:
+            model_path: A string representing the path to the model
+            num_workers: An integer representing the number of worker
+                processes
+            num_slots: An integer representing the number of frames that
+                can be in flight, twice the number of workers if None
+            backend: A string naming the interpreter backend to use
+            num_threads: An integer representing the number of CPU threads
+                of each worker's interpreter
+
+        Raises:
+            RuntimeError: If a worker fails to load the model
+        """
+        self.model_path = model_path
+        self.num_workers = num_workers
+        self.num_slots = num_slots or 2 * num_workers
+        options = {"backend": backend, "num_threads": num_threads}
+
+        # Read the tensor shapes from the model once in this process
+        model = JustDanceModel(model_path, **options)
+        self.input_size = model.input_size
+        self.multi_pose = model.multi_pose
+        input_shape = (model.input_size, model.input_size, 3)
+        input_dtype = np.dtype(model.input_dtype)
+        output_shape = tuple(model.interpreter.get_output_details()[0]["shape"])
+        del model
+
+        self._input_memory = SharedMemory(
+            create=True,
+            size=self.num_slots
+            * int(np.prod(input_shape))
+            * input_dtype.itemsize,
+        )
+        self._output_memory = SharedMemory(
+            create=True, size=self.num_slots * int(np.prod(output_shape)) * 4
+        )
+        self._inputs = np.ndarray(
+            (self.num_slots, *input_shape),
+            dtype=input_dtype,
+            buffer=self._input_memory.buf,
+        )
+        self._outputs = np.ndarray(
+            (self.num_slots, *output_shape),
+            dtype=np.float32,
+            buffer=self._output_memory.buf,
+        )
+        layout = {
+            "input_name": self._input_memory.name,
+            "output_name": self._output_memory.name,
+            "num_slots": self.num_slots,
+            "input_shape": input_shape,
+            "input_dtype": input_dtype.str,
+            "output_shape": output_shape,
+        }
+
+        # Spawn rather than fork, which is unsafe once an interpreter has
+        # started threads in this process
+        context = multiprocessing.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._free_slots = queue.Queue()
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._error = None
+        self._closing = False
+        self._workers = [
+            context.Process(
+                target=_serve,
+                args=(model_path, options, layout, self._tasks, self._results),
+                daemon=True,
+            )
+            for _ in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._collector = None
+        self._wait_until_ready()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _wait_until_ready(self):
+        """
+        Wait for every worker to load the model
+
+        Raises:
+            RuntimeError: If a worker dies or fails to load the model in
+                time
+        """
+        deadline = time.monotonic() + START_TIMEOUT_SECONDS
+        num_ready = 0
+        while num_ready < len(self._workers):
+            try:
+                status, error = self._results.get(timeout=WORKER_CHECK_SECONDS)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self._workers):
+                    status, error = "error", "died loading the model"
+                elif time.monotonic() > deadline:
+                    status, error = "error", "timed out loading the model"
+                else:
+                    continue
+            if status != "ready":
+                self.close()
+                raise RuntimeError(f"an inference worker failed: {error}")
+            num_ready += 1
+
+    def _collect(self):
+        """
+        Hand the outputs the workers post to the waiting frames, until the
+        pool is closed or a worker dies
+        """
+        while True:
+            try:
+                slot, error = self._results.get(timeout=WORKER_CHECK_SECONDS)
+            except queue.Empty:
+                if self._closing:
+                    # Every output is in the queue once the workers stopped
+                    if not self._workers:
+                        return
+                    continue
+                if all(worker.is_alive() for worker in self._workers):
+                    continue
+                self._fail(RuntimeError("an inference worker died"))
+                return
+            with self._lock:
+                future = self._futures.pop(slot)
+            output = None if error else self._outputs[slot].copy()
+            self._free_slots.put(slot)
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(output)
+
+    def _fail(self, error):
+        """
+        Fail the frames in flight and every frame submitted from now on
+
+        Args:
+            error: The exception to fail the frames with
+        """
+        with self._lock:
+            self._error = error
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for future in futures:
+            future.set_exception(error)
+
+    def _check_error(self):
+        """
+        Raise the error that broke the pool, if any
+
+        Raises:
+            RuntimeError: If a worker died
+        """
+        if self._error is not None:
+            raise RuntimeError("the inference pool is broken") from self._error
+
+    def submit(self, input_image):
+        """
+        Copy a frame into a free input slot and queue it for the workers
+
+        Args:
+            input_image: An array of shape 1xSxSx3 holding the input image
+
+        Returns:
+            A `concurrent.futures.Future` of the model output
+
+        Raises:
+            RuntimeError: If a worker died
+        """
+        while True:
+            self._check_error()
+            try:
+                slot = self._free_slots.get(timeout=WORKER_CHECK_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        future = Future()
+        np.copyto(self._inputs[slot], input_image[0], casting="unsafe")
+        with self._lock:
+            self._check_error()
+            self._futures[slot] = future
+        self._tasks.put(slot)
+        return future
+
+    def infer(self, input_image):
+        """
+        Run the model on a frame and wait for the output
+
+        Args:
+            input_image: An array of shape 1xSxSx3 holding the input image
+
+        Returns:
+            A `numpy.ndarray` of the model output
+
+        Raises:
+            RuntimeError: If a worker died or failed to run the model
+        """
+        return self.submit(input_image).result()
+
+    def close(self):
+        """
+        Stop the workers once their current frame is done, and free the
+        shared memory
+        """
+        self._closing = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            # A worker that died holding a queue lock can leave the others
+            # stuck, so they are terminated after a while
+            worker.join(timeout=STOP_TIMEOUT_SECONDS)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self._workers = []
+        # Nothing is put on the results queue here: a worker killed while
+        # posting an output leaves its lock held, and the put would block
+        # the exit of this process
+        if self._collector is not None:
+            self._collector.join()
+            self._collector = None
+        del self._inputs, self._outputs
+        self._input_memory.close()
+        self._input_memory.unlink()
+        self._output_memory.close()
+        self._output_memory.unlink()
+
+
+class PooledModel(JustDanceModel):
+    """
+    A `JustDanceModel` whose inference runs in an `InferencePool`
+
+    Attributes:
+        pool (InferencePool): The pool running the model
+        model_path (str): The path to the model
+        input_size (int): The width and height of the model input
+        multi_pose (bool): Whether the model is MoveNet MultiPose
+    """
+
+    # pylint: disable-next=super-init-not-called
+    def __init__(self, pool):
+        """
+        Initialize a new `PooledModel` object
+
+        Args:
+            pool: An `InferencePool` object running the model
+        """
+        self.pool = pool
+        self.model_path = pool.model_path
+        self.input_size = pool.input_size
+        self.multi_pose = pool.multi_pose
+        self.supports_batch = True
+
+    def run_batch(self, input_images, batch_size=None):
+        """
+        Run the model on a batch of input images, spread over the workers
+
+        Args:
+            input_images: A list of arrays of shape 1xSxSx3
+            batch_size: Unused, the workers run one image at a time
+
+        Returns:
+            A list of the model outputs, one per image
+        """
+        futures = [
+            self.pool.submit(input_image) for input_image in input_images
+        ]
+        return [future.result() for future in futures]
+
+    def _invoke(self, input_image, num_outputs=None):
+        """
+        Run the model in the pool and wait for the output
+
+        Args:
+            input_image: An array of shape 1xSxSx3 holding the input image
+            num_outputs: Unused, the pool returns one output per image
+
+        Returns:
+            A `numpy.ndarray` of the model output
+        """
+        return self.pool.infer(input_image)
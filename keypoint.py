@@ -1,5 +1,6 @@
 """
-Dictionary that maps from joint names to keypoint indices.
+Dictionary that maps from joint names to keypoint indices, and the names
+of the joint angles scored by the game.
 """
 KEYPOINT_DICT = {
     "nose": 0,
@@ -42,3 +43,31 @@ KEYPOINT_EDGE_INDICES_TO_COLOR = {
     (12, 14): "c",
     (14, 16): "c",
 }
+
+# Names of the joint angles scored by the game, in storage order.
+JOINTS = [
+    "left_arm",
+    "right_arm",
+    "left_elbow",
+    "right_elbow",
+    "left_thigh",
+    "right_thigh",
+    "left_leg",
+    "right_leg",
+]
+
+# Key point indices of the (start, middle, end) joints of every angle in
+# `JOINTS`, with the angle measured at the middle joint.
+JOINT_TRIPLETS = [
+    (5, 7, 9),
+    (6, 8, 10),
+    (7, 5, 11),
+    (8, 6, 12),
+    (12, 11, 13),
+    (11, 12, 14),
+    (11, 13, 15),
+    (12, 14, 16),
+]
+
+# Key points scored below this confidence are treated as not detected.
+MIN_KEYPOINT_SCORE = 0.2
@@ -2,8 +2,17 @@
 Module to test functions for the Just Dance Game
 """
 import csv
+import json
+import os
+import numpy as np
 import pytest
-from just_dance_score import get_current_score, get_leaderboard_scores
+from just_dance_score import (
+    TAIL_BYTES,
+    get_current_score,
+    get_leaderboard_scores,
+    summary_path,
+)
+from just_dance_leaderboard import add_score, get_top_scores, import_csv
 from just_dance_model import JustDanceModel
 from just_dance_controller import JustDanceController
 
@@ -75,6 +84,73 @@ def test_get_leaderboard_scores(leaderboard_data):
         assert top_scores[i] >= top_scores[i + 1]
 
 
+def test_leaderboard_summary_follows_appends(tmp_path):
+    """
+    This function tests that the top scores of a CSV leaderboard stay
+    correct as scores are appended, a row still being written is left for
+    later, a rewritten file is scanned again, and the current score is read
+    from the end of a file larger than the tail that is read.
+
+    Args:
+        tmp_path: A temporary directory to hold the leaderboard files.
+    """
+    rng = np.random.default_rng(7)
+    filename = str(tmp_path / "leaderboard.csv")
+    scores = rng.uniform(0, 100, 2000).round(1)
+    with open(filename, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows([[0]] + [[score] for score in scores])
+
+    def expected_top(values):
+        return sorted((int(value) for value in values), reverse=True)[:5]
+
+    assert os.path.getsize(filename) > TAIL_BYTES
+    assert get_leaderboard_scores(filename) == expected_top(scores)
+    assert get_current_score(filename) == int(scores[-1])
+
+    with open(filename, "a", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows([[99.9], [12]])
+        file.write("100")
+    assert get_leaderboard_scores(filename) == expected_top(
+        list(scores) + [99.9]
+    )
+    with open(summary_path(filename), encoding="utf-8") as file:
+        assert json.load(file)["last"] == 12
+
+    with open(filename, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows([[0], [40], [30]])
+    assert get_leaderboard_scores(filename) == [40, 30]
+    assert get_current_score(filename) == 30
+
+
+def test_sqlite_leaderboard(leaderboard_data, tmp_path):
+    # pylint: disable=redefined-outer-name
+    """
+    This function tests that a CSV leaderboard imported into SQLite gives
+    the same current and top 5 scores through the same functions, and that
+    the top scores can be filtered by song and player.
+
+    Args:
+        leaderboard_data: test leaderboard csv file containing scores.
+        tmp_path: A temporary directory to hold the leaderboard files.
+    """
+    csv_file = str(tmp_path / "leaderboard.csv")
+    database = str(tmp_path / "leaderboard.db")
+    with open(csv_file, "w", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerows(leaderboard_data)
+
+    assert import_csv(csv_file, database, song="cheapthrills") == 7
+    assert get_current_score(database) == get_current_score(csv_file)
+    assert get_leaderboard_scores(database) == get_leaderboard_scores(csv_file)
+
+    add_score(database, 88.5, song="uptownfunk", player="sam")
+    add_score(database, 61, song="uptownfunk", player="alex")
+    assert get_current_score(database) == 61
+    assert get_top_scores(database, k=3) == [93, 88, 80]
+    assert get_top_scores(database, k=3, song="uptownfunk") == [88, 61]
+    assert get_top_scores(database, song="uptownfunk", player="alex") == [61]
+
+
 def test_angles_in_range():
     """
     This function tests the angles in the Just Dance game and ensures that
@@ -91,10 +167,11 @@ def test_angles_in_range():
     controller.release_capture()
 
     # Iterate through all the angles
+    # Angles of joints that were not detected are NaN and not scored
     for angle_list in controller.angles_video.values():
-        for angle in angle_list:
+        for angle in angle_list[~np.isnan(angle_list)]:
             assert 0 <= angle <= 180
 
     for angle_list in controller.angles_camera.values():
-        for angle in angle_list:
+        for angle in angle_list[~np.isnan(angle_list)]:
             assert 0 <= angle <= 180
@@ -0,0 +1,117 @@
+"""
+Module to test the batch scorer of the Just Dance Game
+"""
+import cv2
+import numpy as np
+import pytest
+import just_dance_batch
+from just_dance_controller import JustDanceController
+from just_dance_model import JustDanceModel
+from just_dance_recording import read_recording
+from just_dance_batch import (
+    _init_worker,
+    _score_in_worker,
+    _worker,
+    replay_recording,
+    score_recording,
+)
+from just_dance_benchmark import read_frames
+
+
+def test_score_recording_samples_by_video_time(fake_model, monkeypatch):
+    """
+    This function tests that scoring the 10 second test video as a recorded
+    performance, at 1 sample per second, decodes and scores 10 frames and
+    returns a score between 0 and 100.
+
+    Args:
+        fake_model: A model returning random key points.
+        monkeypatch: A fixture to count the frames decoded.
+    """
+    reference = np.random.default_rng(5).random((1000, 17, 3))
+    retrieved = []
+    video_capture = cv2.VideoCapture  # pylint: disable=no-member
+
+    class CountingCapture:
+        """
+        A capture that counts the frames it decodes.
+        """
+
+        def __init__(self, path):
+            self.capture = video_capture(path)
+            self.grab = self.capture.grab
+            self.get = self.capture.get
+            self.release = self.capture.release
+
+        def retrieve(self):
+            """
+            Decode the grabbed frame and count it.
+            """
+            retrieved.append(None)
+            return self.capture.retrieve()
+
+    monkeypatch.setattr(just_dance_batch.cv2, "VideoCapture", CountingCapture)
+    score, samples = score_recording(
+        fake_model, reference, "test/test.mp4", sample_rate=1
+    )
+    monkeypatch.undo()
+
+    assert samples == 10
+    assert len(retrieved) == 10
+    assert 0 <= score <= 100
+
+    dtw_score, _ = score_recording(
+        fake_model, reference, "test/test.mp4", sample_rate=1, dtw=True
+    )
+    assert 0 <= dtw_score <= 100
+
+
+def test_replay_recording_matches_the_game(fake_model, tmp_path):
+    """
+    This function tests that the camera key points a game saves can be
+    memory-mapped back and replayed to the game's score without the model,
+    which a batch worker does not load for them.
+    """
+    reference = np.random.default_rng(1).random((300, 17, 3), dtype=np.float32)
+    path = str(tmp_path / "game.jdkp")
+    camera = cv2.VideoCapture("test/test.mp4")  # pylint: disable=no-member
+    controller = JustDanceController(
+        fake_model,
+        "test/test.mp4",
+        camera=camera,
+        reference=reference,
+        record_path=path,
+    )
+    controller.recorder.chunk_frames = 4
+    frames = read_frames(max_frames=10)
+    for frame_index, frame in enumerate(frames):
+        controller.score_frames(frame_index, frame, frame, frame_index * 40)
+    controller.release_capture()
+    camera.release()
+
+    frame_shape, records = read_recording(path)
+    score, samples = replay_recording(reference, path)
+
+    assert frame_shape == frames[0].shape[:2]
+    assert list(records["frame_index"]) == list(range(10))
+    assert records["timestamp_ms"][-1] == 360
+    assert samples == 10
+    assert score == pytest.approx(controller.scorer.score, abs=1)
+
+    # The game sampled every 40 ms, which DTW reads from the timestamps
+    dtw_score, _ = replay_recording(reference, path, dtw=True)
+    assert dtw_score == pytest.approx(
+        JustDanceModel.final_score_dtw(
+            controller.angles_video,
+            controller.angles_camera,
+            20,
+            sample_rate=25,
+        ),
+        abs=1,
+    )
+
+    _init_worker("model/missing.tflite", reference, {})
+    result = _score_in_worker(path)
+    assert not result["error"]
+    assert float(result["score"]) == pytest.approx(score, abs=0.05)
+    assert _worker["model"] is None
@@ -0,0 +1,80 @@
+"""
+Module to test the benchmarks and metrics of the Just Dance Game
+"""
+import json
+import numpy as np
+from just_dance_metrics import LatencyHistogram, PipelineMetrics
+from just_dance_benchmark import (
+    benchmark_inference,
+    benchmark_leaderboard,
+    read_frames,
+)
+
+
+def test_benchmarks_produce_json_results(fake_model, tmp_path):
+    """
+    This function tests that the benchmarks time the model and the
+    leaderboard reads and return results that can be saved as JSON.
+    """
+    frames = read_frames(max_frames=5)
+    timings, key_points_video, _ = benchmark_inference(
+        fake_model, frames, frames
+    )
+    leaderboard = benchmark_leaderboard([10], str(tmp_path))
+
+    assert key_points_video.shape == (5, 17, 3)
+    assert timings["run_inference"]["calls"] == 4
+    for timing in leaderboard["10"].values():
+        if isinstance(timing, dict):
+            assert 0 <= timing["min_ms"] <= timing["median_ms"]
+            assert timing["median_ms"] <= timing["p95_ms"]
+    json.dumps({"inference": timings, "leaderboard": leaderboard})
+
+
+def test_latency_histogram_percentiles():
+    """
+    This function tests that the `LatencyHistogram` percentiles are within
+    the bucket precision of the exact percentiles, and that a disabled
+    `PipelineMetrics` records nothing while an enabled one writes its
+    summary.
+    """
+    rng = np.random.default_rng(0)
+    durations = rng.lognormal(16, 1, 10000).astype(np.int64)
+    histogram = LatencyHistogram()
+    for duration in durations:
+        histogram.record(int(duration))
+
+    assert histogram.count == len(durations)
+    assert len(histogram.counts) == len(LatencyHistogram().counts)
+    for percent in (50, 95, 99):
+        exact = np.percentile(durations, percent)
+        assert abs(histogram.percentile(percent) - exact) < 0.07 * exact
+    assert histogram.percentile(100) == durations.max()
+
+    disabled = PipelineMetrics(enabled=False)
+    assert disabled.lap("decode", disabled.start()) == 0
+    disabled.tick()
+    assert not disabled.stages and not disabled.counters
+
+
+def test_pipeline_metrics_summary(tmp_path):
+    """
+    This function tests that `PipelineMetrics` times stages, prints a
+    progress line when one is due and writes its summary as JSON.
+    """
+    lines = []
+    path = tmp_path / "metrics" / "game.json"
+    metrics = PipelineMetrics(path=str(path), log_interval=0, log=lines.append)
+
+    start = metrics.start()
+    start = metrics.lap("decode", start)
+    metrics.lap("frame", start)
+    metrics.increment("frames_dropped", 2)
+    metrics.tick()
+    metrics.close({"clock": {"frames_shown": 1}})
+
+    summary = json.loads(path.read_text(encoding="utf-8"))
+    assert summary["counters"] == {"frames_dropped": 2, "frames": 1}
+    assert summary["stages"]["decode"]["count"] == 1
+    assert summary["clock"] == {"frames_shown": 1}
+    assert len(lines) == 1 and "frames_dropped=2" in lines[0]
@@ -0,0 +1,81 @@
+"""
+Module to test the song catalog and reference cache of the Just Dance Game
+"""
+import shutil
+import numpy as np
+from just_dance_cache import bake_reference, load_reference
+import just_dance_catalog
+from just_dance_catalog import SongCatalog
+
+
+def test_reference_cache(fake_model, tmp_path):
+    """
+    This function tests that baking the key points of the test video stores
+    one row of key points and angles per frame, and that loading the cache
+    returns the same key points.
+
+    Args:
+        fake_model: A model returning random key points.
+        tmp_path: A temporary directory to hold the cache.
+    """
+    assert load_reference("test/test.mp4", "test/test.mp3", tmp_path) is None
+
+    bake_reference(fake_model, "test/test.mp4", tmp_path)
+    reference = load_reference("test/test.mp4", "test/test.mp3", tmp_path)
+
+    num_frames = len(reference["key_points"])
+    assert num_frames > 0
+    assert reference["key_points"].shape == (num_frames, 17, 3)
+    assert reference["angles"].shape == (num_frames, 8)
+    assert np.all((reference["angles"] >= 0) & (reference["angles"] <= 180))
+
+
+def test_song_catalog_indexes_songs_once(fake_model, tmp_path, monkeypatch):
+    """
+    This function tests that the `SongCatalog` reads the length, frame rate
+    and size of a new song from its files, serves them from its index
+    without opening the files again, and notices when the song is baked.
+    A song with audio but no video is indexed but not offered to play.
+
+    Args:
+        fake_model: A model returning random key points.
+        tmp_path: A temporary directory to hold the songs and the index.
+        monkeypatch: A fixture to make opening the media files fail.
+    """
+    songs_dir = tmp_path / "songs"
+    audio_dir = tmp_path / "songs_audio"
+    songs_dir.mkdir()
+    audio_dir.mkdir()
+    shutil.copyfile("test/test.mp4", songs_dir / "test_song.mp4")
+    shutil.copyfile("test/test.mp3", audio_dir / "test_song.mp3")
+    shutil.copyfile("test/test.mp3", audio_dir / "audio_only.mp3")
+    options = {
+        "songs_dir": str(songs_dir),
+        "audio_dir": str(audio_dir),
+        "index_path": str(tmp_path / "catalog.json"),
+        "model_path": "test/test.mp3",
+        "cache_dir": str(tmp_path / "cache"),
+    }
+
+    catalog = SongCatalog(**options)
+    entry = catalog.songs["test_song"]
+    assert catalog.titles() == {"Test Song": "test_song"}
+    assert catalog.songs["audio_only"]["video_key"] is None
+    assert catalog.song_length("test_song") == 10
+    assert entry["frame_count"] > 0 and entry["fps"] > 0
+    assert entry["cached"] is False
+
+    def fail(*args):
+        raise AssertionError("media file opened for an indexed song")
+
+    monkeypatch.setattr(just_dance_catalog, "probe_video", fail)
+    monkeypatch.setattr(just_dance_catalog, "MP3", fail)
+    monkeypatch.setattr(just_dance_catalog, "file_hash", fail)
+    bake_reference(
+        fake_model, catalog.video_path("test_song"), tmp_path / "cache"
+    )
+    catalog = SongCatalog(**options)
+    assert catalog.songs["test_song"]["cached"] is True
+    assert len(catalog.load_reference("test_song")["key_points"]) == (
+        entry["frame_count"]
+    )
@@ -0,0 +1,165 @@
+"""
+Module to test the game loop of the Just Dance Game
+"""
+import threading
+import time
+import cv2
+import numpy as np
+import pytest
+import just_dance_controller
+from just_dance_controller import JustDanceController
+from just_dance_capture import FrameReader
+from just_dance_timing import TRACKING_SAMPLE_RATE, FrameSampler
+
+
+def test_frame_reader_keeps_every_video_frame():
+    """
+    This function tests that a `FrameReader` without the drop-oldest policy
+    hands over every frame of the test video, in timestamp order, followed
+    by None.
+    """
+    capture = cv2.VideoCapture("test/test.mp4")  # pylint: disable=no-member
+    num_frames = int(
+        capture.get(cv2.CAP_PROP_FRAME_COUNT)  # pylint: disable=no-member
+    )
+    reader = FrameReader(capture, max_frames=2)
+    reader.start()
+
+    timestamps = []
+    frame, timestamp = reader.read()
+    while frame is not None:
+        timestamps.append(timestamp)
+        frame, timestamp = reader.read()
+    reader.stop()
+    capture.release()
+
+    assert len(timestamps) == num_frames
+    assert timestamps == sorted(timestamps)
+
+
+class FakeCapture:
+    """
+    A capture that returns numbered frames as fast as they are read, one
+    every 40 ms of video, standing in for a camera.
+    """
+
+    def __init__(self, num_frames):
+        self.num_frames = num_frames
+        self.position = 0
+
+    def read(self):
+        """
+        Return the next numbered frame, or no frame past the last one.
+        """
+        if self.position >= self.num_frames:
+            return False, None
+        self.position += 1
+        return True, np.full((4, 4, 3), self.position - 1, dtype=np.uint8)
+
+    def get(self, _):
+        """
+        Return the timestamp in milliseconds of the last frame read.
+        """
+        return (self.position - 1) * 40.0
+
+
+def test_frame_reader_drops_the_oldest_camera_frames():
+    """
+    This function tests that a `FrameReader` with the drop-oldest policy
+    never blocks on a full queue, and that the frames left in it are the
+    newest ones, followed by None.
+    """
+    reader = FrameReader(FakeCapture(50), max_frames=2, drop_oldest=True)
+    reader.start()
+    reader.join(timeout=5)
+
+    assert not reader.is_alive()
+    frame, timestamp = reader.read()
+    assert frame[0, 0, 0] == 49 and timestamp == 49 * 40.0
+    assert reader.read() == (None, None)
+
+
+def test_threaded_pipeline_shuts_down_when_stopped(fake_model):
+    """
+    This function tests that stopping a threaded game in the middle of the
+    song returns from `process_frames` promptly and ends the reader and
+    inference threads.
+    """
+    threads_before = threading.active_count()
+    camera = cv2.VideoCapture("test/test.mp4")  # pylint: disable=no-member
+    controller = JustDanceController(
+        fake_model,
+        "test/test.mp4",
+        camera=camera,
+        threaded=True,
+        display=False,
+        sampler=FrameSampler(None),
+    )
+    threading.Timer(0.3, controller.stop).start()
+    start = time.perf_counter()
+    controller.process_frames()
+    elapsed = time.perf_counter() - start
+    controller.release_capture()
+    camera.release()
+    time.sleep(0.1)
+
+    assert elapsed < 2
+    assert controller.angles_camera.num_frames > 0
+    assert threading.active_count() == threads_before
+
+
+def test_dropped_frames_still_pump_the_window(fake_model, monkeypatch):
+    """
+    This function tests that a threaded game that has fallen behind still
+    lets the window handle its events for the frames it drops, so the 'q'
+    key stops the game even when no frame is being shown.
+    """
+    keys = []
+
+    def wait_key(_):
+        keys.append(None)
+        return ord("q") if len(keys) >= 3 else -1
+
+    def show_frames(*_):
+        # A display far slower than the video, which never reads the keys
+        controller.window_open = True
+        time.sleep(0.2)
+
+    monkeypatch.setattr(just_dance_controller.cv2, "waitKey", wait_key)
+    camera = cv2.VideoCapture("test/test.mp4")  # pylint: disable=no-member
+    controller = JustDanceController(
+        fake_model, "test/test.mp4", camera=camera, threaded=True
+    )
+    controller.show_frames = show_frames
+    start = time.perf_counter()
+    controller.process_frames()
+    elapsed = time.perf_counter() - start
+    controller.release_capture()
+    camera.release()
+
+    assert controller.stopped.is_set()
+    assert len(keys) == 3
+    assert controller.clock.frames_dropped >= 3
+    assert elapsed < 2
+
+
+def test_tracking_game_samples_recent_crops(fake_model):
+    """
+    This function tests that a game tracking the player samples often
+    enough by default for the crop of one sample to still fit the next,
+    and hands the tracker the timestamp of every scored frame.
+    """
+    camera = cv2.VideoCapture("test/test.mp4")  # pylint: disable=no-member
+    controller = JustDanceController(
+        fake_model, "test/test.mp4", camera=camera, track_pose=True
+    )
+    frame = np.zeros((100, 200, 3), dtype=np.uint8)
+    controller.score_frames(0, frame, frame, timestamp=0)
+    controller.score_frames(3, frame, frame)
+    controller.release_capture()
+    camera.release()
+
+    assert controller.sampler.rate == TRACKING_SAMPLE_RATE
+    assert controller.tracker.updated_ms == pytest.approx(
+        3000 / controller.clock.frame_rate
+    )
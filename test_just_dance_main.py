@@ -0,0 +1,191 @@
+"""
+Module to test the game sessions of the Just Dance Game
+"""
+import shutil
+import threading
+import time
+import types
+import numpy as np
+from just_dance_controller import JustDanceController
+from just_dance_catalog import SongCatalog
+from just_dance_model import JustDanceModel
+import just_dance_main
+from keypoint import JOINTS
+
+
+def test_models_and_cameras_are_opened_once(fake_model, monkeypatch):
+    """
+    This function tests that `get_model` loads a model once even when many
+    games ask for it at the same time, that `preload_model` fills the same
+    cache, and that `get_camera` keeps a camera open across games and
+    reopens it once it has been closed.
+    """
+    loads = []
+
+    def load_model(model_path):
+        loads.append(model_path)
+        time.sleep(0.05)
+        return fake_model
+
+    class Camera:
+        """
+        A camera that records the index of each camera opened.
+        """
+
+        opened = []
+
+        def __init__(self, index):
+            self.open = True
+            Camera.opened.append(index)
+
+        def isOpened(self):  # pylint: disable=invalid-name
+            """
+            Return whether the camera has not been released.
+            """
+            return self.open
+
+        def release(self):
+            """
+            Close the camera.
+            """
+            self.open = False
+
+    monkeypatch.setattr(just_dance_main, "JustDanceModel", load_model)
+    monkeypatch.setattr(just_dance_main, "_models", {})
+    monkeypatch.setattr(just_dance_main, "_cameras", {})
+    monkeypatch.setattr(
+        just_dance_main, "cv2", types.SimpleNamespace(VideoCapture=Camera)
+    )
+
+    models = []
+    threads = [
+        threading.Thread(
+            target=lambda: models.append(just_dance_main.get_model("a"))
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    just_dance_main.preload_model("b").join()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(loads) == ["a", "b"]
+    assert all(model is fake_model for model in models)
+
+    camera = just_dance_main.get_camera(0)
+    assert just_dance_main.get_camera(0) is camera
+    just_dance_main.release_cameras()
+    assert not camera.open
+    assert just_dance_main.get_camera(0) is not camera
+    assert Camera.opened == [0, 0]
+
+
+def test_game_cancelled_while_loading_never_starts(monkeypatch):
+    """
+    This function tests that a game cancelled while it is being loaded
+    releases its capture and reports that it was cancelled without
+    starting the song, so no music plays.
+    """
+    calls = []
+
+    class Game:
+        """
+        A game that is cancelled while it loads.
+        """
+
+        def __init__(self, **_):
+            session.cancel()
+            self.controller = types.SimpleNamespace(
+                release_capture=lambda: calls.append("release_capture"),
+                stop=lambda: calls.append("stop"),
+            )
+
+        def run(self, song):
+            """
+            Record that the song was started.
+            """
+            calls.append(f"run {song}")
+
+    monkeypatch.setattr(just_dance_main, "get_model", lambda _: None)
+    monkeypatch.setattr(just_dance_main, "JustDanceGame", Game)
+    session = just_dance_main.GameSession("test")
+    session.run()
+
+    events = []
+    while not session.events.empty():
+        events.append(session.events.get_nowait()[0])
+    assert events == ["status", "status", "cancelled"]
+    assert "release_capture" in calls
+    assert "run test" not in calls
+
+
+def test_game_plays_the_music_from_the_song_catalog(
+    fake_model, tmp_path, monkeypatch
+):
+    """
+    This function tests that a game started from the song catalog plays the
+    music file the catalog has for the song.
+    """
+    (tmp_path / "songs").mkdir()
+    (tmp_path / "music").mkdir()
+    shutil.copyfile("test/test.mp4", tmp_path / "songs" / "test_song.mp4")
+    shutil.copyfile("test/test.mp3", tmp_path / "music" / "test_song.mp3")
+    catalog = SongCatalog(
+        songs_dir=str(tmp_path / "songs"),
+        audio_dir=str(tmp_path / "music"),
+        index_path=str(tmp_path / "catalog.json"),
+        cache_dir=str(tmp_path / "cache"),
+    )
+    played = []
+    monkeypatch.setattr(just_dance_main, "get_model", lambda _: fake_model)
+    monkeypatch.setattr(just_dance_main, "get_camera", lambda _: object())
+    monkeypatch.setattr(
+        JustDanceController, "play_sound", staticmethod(played.append)
+    )
+    monkeypatch.setattr(JustDanceController, "process_frames", lambda _: None)
+    monkeypatch.setattr(JustDanceController, "close_windows", lambda _: None)
+    session = just_dance_main.GameSession(
+        "test_song",
+        leaderboard_file=str(tmp_path / "leaderboard.csv"),
+        catalog=catalog,
+    )
+    session.run()
+
+    events = []
+    while not session.events.empty():
+        events.append(session.events.get_nowait())
+    assert events[-1] == ("finished", 0)
+    assert played == [str(tmp_path / "music" / "test_song.mp3")]
+
+
+def test_game_scores_with_dtw_when_asked(fake_model, tmp_path, monkeypatch):
+    """
+    This function tests that a game set to score with DTW aligns the angles
+    of the whole song at the rate it sampled them, instead of reading the
+    running score.
+    """
+    monkeypatch.setattr(just_dance_main, "get_model", lambda _: fake_model)
+    monkeypatch.setattr(just_dance_main, "get_camera", lambda _: object())
+    monkeypatch.setattr(
+        just_dance_main, "load_reference", lambda *_, **__: None
+    )
+    game = just_dance_main.JustDanceGame(
+        str(tmp_path / "model.tflite"), "test/test.mp4", 0, dtw=True
+    )
+    game.controller.cap1.release()
+    rng = np.random.default_rng(3)
+    video = np.cumsum(rng.normal(0, 60, (40, len(JOINTS))), axis=0)
+    game.controller.angles_video.extend(video)
+    game.controller.angles_camera.extend(np.roll(video, 1, axis=0))
+
+    game.calculate_final_score()
+
+    assert game.controller.scorer.score == 0
+    assert game.score == JustDanceModel.final_score_dtw(
+        dict(zip(JOINTS, video.T)),
+        dict(zip(JOINTS, np.roll(video, 1, axis=0).T)),
+        20,
+        sample_rate=game.controller.sampler.rate,
+    )
+    assert game.score > 20
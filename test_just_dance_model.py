@@ -0,0 +1,225 @@
+"""
+Module to test the pose model of the Just Dance Game
+"""
+import sys
+import types
+import numpy as np
+import pytest
+import just_dance_model
+from just_dance_model import JustDanceModel
+from keypoint import JOINT_TRIPLETS
+
+
+class FakeInterpreter:
+    """
+    An interpreter that follows the TensorFlow Lite calls the model makes,
+    returning the mean of each input image as every key point. Like the
+    real interpreter, `tensor` gives live views of the input buffer and
+    `invoke` refuses to run while one is held.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.allocations = 0
+        self._input = np.zeros((1, 192, 192, 3), dtype=np.float32)
+        self._output = None
+
+    def allocate_tensors(self):
+        """
+        Count the allocation and give the input tensor a new buffer.
+        """
+        self.allocations += 1
+        self._input = np.zeros_like(self._input)
+
+    def get_input_details(self):
+        """
+        Return the details of the float32 input tensor.
+        """
+        return [{"index": 0, "dtype": np.float32, "shape": self._input.shape}]
+
+    def get_output_details(self):
+        """
+        Return the details of the key point output tensor.
+        """
+        return [{"index": 1, "shape": (len(self._input), 1, 17, 3)}]
+
+    def resize_tensor_input(self, index, shape):
+        """
+        Give the input tensor a new shape, to be allocated.
+        """
+        assert index == 0
+        self._input = np.zeros(shape, dtype=np.float32)
+
+    def tensor(self, index):
+        """
+        Return a function giving a live view of the input or output tensor.
+        """
+        assert index in (0, 1)
+        if index == 1:
+            return lambda: self._output[...]
+        return lambda: self._input[...]
+
+    def invoke(self):
+        """
+        Fill the output with the mean of each input image.
+        """
+        # The attribute and the argument are the only references, unless a
+        # view returned by `tensor` is still alive
+        if sys.getrefcount(self._input) > 2:
+            raise RuntimeError("a reference to the input tensor is alive")
+        means = self._input.mean(axis=(1, 2, 3))
+        self._output = np.repeat(means, 51).reshape(-1, 1, 17, 3)
+
+
+def original_angle(frame_shape, key_points, start, middle, end):
+    """
+    The angle between three joints as the game first calculated it, one
+    triplet at a time from integer pixel coordinates.
+    """
+    height, width = frame_shape[:2]
+    shaped = np.squeeze(np.multiply(key_points, [height, width, 1]))
+    joints = [
+        np.array([int(shaped[index][0]), int(shaped[index][1])])
+        for index in (start, middle, end)
+    ]
+    radians = np.arctan2(
+        joints[2][1] - joints[1][1], joints[2][0] - joints[1][0]
+    ) - np.arctan2(joints[0][1] - joints[1][1], joints[0][0] - joints[1][0])
+    angle = np.abs(radians * 180.0 / np.pi)
+    return 360 - angle if angle > 180.0 else angle
+
+
+def test_calculate_angles_matches_the_original_arithmetic():
+    """
+    This function tests that the batched `calculate_angles` gives the same
+    angles as the original per-triplet arithmetic, including for key points
+    outside the frame, and checks hand-computed angles and the NaN of a
+    joint that was not detected.
+    """
+    key_points = np.random.default_rng(1).uniform(-0.5, 1.5, (20, 17, 3))
+    frame_shape = (360, 640, 3)
+
+    angles = JustDanceModel.calculate_angles(key_points, frame_shape)
+
+    assert angles.shape == (20, 8)
+    for i, triplet in enumerate(JOINT_TRIPLETS):
+        for frame_index in range(20):
+            assert angles[frame_index, i] == pytest.approx(
+                original_angle(frame_shape, key_points[frame_index], *triplet)
+            )
+
+    # Left shoulder, elbow and wrist at a right angle, in a straight line,
+    # and at 270 degrees, which is measured the short way round as 90
+    hand_made = np.zeros((3, 17, 3))
+    hand_made[..., 2] = 1
+    hand_made[:, 5] = [0.5, 0.2, 1]
+    hand_made[:, 7] = [0.5, 0.5, 1]
+    hand_made[0, 9] = [0.2, 0.5, 1]
+    hand_made[1, 9] = [0.5, 0.8, 1]
+    hand_made[2, 9] = [0.8, 0.5, 1]
+    assert JustDanceModel.calculate_angles(hand_made, (100, 100))[
+        :, 0
+    ] == pytest.approx([90, 180, 90])
+
+    # A wrist the model is not sure of leaves the left elbow angle out
+    hand_made[0, 9, 2] = 0.1
+    masked = JustDanceModel.calculate_angles(
+        hand_made[:1], (100, 100), min_score=0.3
+    )
+    assert np.isnan(masked[0, 0])
+    assert not np.isnan(masked[0, 1:]).any()
+
+
+def test_model_copies_each_frame_into_the_input_tensor(monkeypatch):
+    """
+    This function tests that frames copied straight into the interpreter's
+    input tensor give outputs that follow the frames, with no view of the
+    tensor left alive during `invoke`, and that an output is not changed
+    by the next inference.
+    """
+    monkeypatch.setattr(
+        just_dance_model, "load_interpreter_class", lambda _: FakeInterpreter
+    )
+    model = JustDanceModel("model.tflite")
+    dark = model.prepare_input(np.full((360, 640, 3), 10, dtype=np.uint8))
+    bright = model.prepare_input(np.full((360, 640, 3), 200, dtype=np.uint8))
+
+    first = model.run_inference(dark)
+    second = model.run_inference(bright)
+    third = model.run_inference(dark)
+
+    assert first.shape == (1, 1, 17, 3)
+    assert np.all(first == 10) and np.all(second == 200)
+    assert np.array_equal(first, third)
+
+
+def test_padded_batches_keep_the_input_tensor(monkeypatch):
+    """
+    This function tests that batches of varying length padded to one batch
+    size give each image its own output without reallocating the
+    interpreter's tensors after the first batch.
+    """
+    monkeypatch.setattr(
+        just_dance_model, "load_interpreter_class", lambda _: FakeInterpreter
+    )
+    model = JustDanceModel("model.tflite")
+    images = [np.full((1, 192, 192, 3), value) for value in range(1, 5)]
+
+    model.run_batch(images, batch_size=4)
+    allocations = model.interpreter.allocations
+    for size in (1, 3, 2, 4, 1):
+        outputs = model.run_batch(images[:size], batch_size=4)
+        assert [float(output.mean()) for output in outputs] == list(
+            range(1, size + 1)
+        )
+        assert all(output.shape == (1, 1, 17, 3) for output in outputs)
+    assert model.interpreter.allocations == allocations
+    assert model.batch_size == 4 and model.supports_batch
+
+    model.run_batch(images[:2])
+    assert model.interpreter.allocations == allocations + 1
+
+
+def test_load_interpreter_class_prefers_the_lightest_backend(monkeypatch):
+    """
+    This function tests that the interpreter class comes from the first
+    installed backend in order of preference, that a backend can be chosen
+    by name, and that an unknown or missing backend raises ImportError.
+    """
+    installed = {
+        "tflite_runtime.interpreter": types.SimpleNamespace(
+            Interpreter="tflite_runtime"
+        ),
+        "tensorflow": types.SimpleNamespace(
+            lite=types.SimpleNamespace(Interpreter="tensorflow")
+        ),
+    }
+
+    def import_module(name):
+        if name not in installed:
+            raise ImportError(name)
+        return installed[name]
+
+    monkeypatch.setattr(
+        just_dance_model,
+        "importlib",
+        types.SimpleNamespace(import_module=import_module),
+    )
+    load = just_dance_model.load_interpreter_class
+
+    assert load() == "tflite_runtime"
+    assert load("tensorflow") == "tensorflow"
+    with pytest.raises(ImportError):
+        load("litert")
+    with pytest.raises(ImportError):
+        load("onnxruntime")
+
+    installed["ai_edge_litert.interpreter"] = types.SimpleNamespace(
+        Interpreter="litert"
+    )
+    assert load() == "litert"
+
+    installed.clear()
+    with pytest.raises(ImportError, match="No TensorFlow Lite interpreter"):
+        load()
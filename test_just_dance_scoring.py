@@ -0,0 +1,226 @@
+"""
+Module to test the scoring of the Just Dance Game
+"""
+import numpy as np
+import pytest
+from just_dance_model import JustDanceModel
+from just_dance_angles import AngleBuffer
+from just_dance_scoring import IncrementalScorer, MultiPlayerScorer, dtw_align
+from just_dance_tracking import PlayerTracker
+from keypoint import JOINTS
+
+
+def test_angle_buffer_matches_angle_dictionary():
+    """
+    This function tests that storing angles in an `AngleBuffer` grows the
+    buffer past its initial capacity, exposes every joint as a column, and
+    gives the same final score as the dictionary of angle lists.
+    """
+    rng = np.random.default_rng(2)
+    frame = np.zeros((360, 640, 3), dtype=np.uint8)
+    buffers = [AngleBuffer(capacity=4), AngleBuffer(capacity=4)]
+    dictionaries = [{joint: [] for joint in JOINTS} for _ in range(2)]
+
+    for _ in range(10):
+        for buffer, dictionary in zip(buffers, dictionaries):
+            key_points = rng.random((1, 1, 17, 3))
+            JustDanceModel.store_angles(buffer, frame, key_points)
+            JustDanceModel.store_angles(dictionary, frame, key_points)
+
+    assert buffers[0].array.shape == (10, 8)
+    assert list(buffers[0]) == JOINTS
+    for joint in JOINTS:
+        assert np.allclose(buffers[0][joint], dictionaries[0][joint])
+    assert JustDanceModel.final_score(
+        *buffers, 20
+    ) == JustDanceModel.final_score(*dictionaries, 20)
+
+
+def test_incremental_scorer_matches_final_score():
+    """
+    This function tests that updating an `IncrementalScorer` one frame at a
+    time ends with the same score as `final_score` over all the angles.
+    """
+    rng = np.random.default_rng(3)
+    angles_video = AngleBuffer()
+    angles_camera = AngleBuffer()
+    angles_video.extend(rng.uniform(0, 180, (50, 8)))
+    angles_camera.extend(rng.uniform(0, 180, (50, 8)))
+    scorer = IncrementalScorer(threshold=60)
+
+    assert scorer.score == 0
+    for video_row, camera_row in zip(angles_video.array, angles_camera.array):
+        scorer.update(video_row, camera_row)
+
+    assert scorer.num_samples == 50
+    assert scorer.score == JustDanceModel.final_score(
+        angles_video, angles_camera, 60
+    )
+
+
+def test_dtw_forgives_a_dancer_behind_the_video():
+    """
+    This function tests that DTW matches identical sequences sample by
+    sample, and that a dancer copying the video 3 samples late scores
+    higher with `final_score_dtw` than with `final_score`, and that at the
+    rate games sample at by default the window still spans one sample.
+    """
+    rng = np.random.default_rng(4)
+    video = np.cumsum(rng.normal(0, 15, (200, 8)), axis=0)
+    camera = np.roll(video, 3, axis=0)
+
+    assert np.array_equal(dtw_align(video, video, 5), np.arange(200))
+
+    angles_video = dict(zip(JOINTS, video.T))
+    angles_camera = dict(zip(JOINTS, camera.T))
+    assert JustDanceModel.final_score_dtw(
+        angles_video, angles_camera, 20, window_ms=200, sample_rate=30
+    ) > JustDanceModel.final_score(angles_video, angles_camera, 20)
+
+    # At the rate games sample by default, 500 ms is less than a sample,
+    # but a dancer one sample late is still forgiven
+    jumpy = np.cumsum(rng.normal(0, 60, (200, 8)), axis=0)
+    angles_video = dict(zip(JOINTS, jumpy.T))
+    one_late = dict(zip(JOINTS, np.roll(jumpy, 1, axis=0).T))
+    assert JustDanceModel.final_score_dtw(
+        angles_video, one_late, 20
+    ) > JustDanceModel.final_score(angles_video, one_late, 20)
+
+
+def test_dtw_scores_a_game_without_samples_as_zero():
+    """
+    This function tests that DTW gives an empty path when either sequence
+    is empty, and that `final_score_dtw` then scores 0 like `final_score`.
+    """
+    samples = np.zeros((5, len(JOINTS)))
+    empty = np.zeros((0, len(JOINTS)))
+    assert len(dtw_align(empty, empty, 3)) == 0
+    assert len(dtw_align(samples, empty, 3)) == 0
+    assert len(dtw_align(empty, samples, 3)) == 0
+
+    no_angles = {joint: [] for joint in JOINTS}
+    some_angles = dict(zip(JOINTS, samples.T))
+    assert JustDanceModel.final_score(no_angles, no_angles, 20) == 0
+    assert JustDanceModel.final_score_dtw(no_angles, no_angles, 20) == 0
+    assert JustDanceModel.final_score_dtw(some_angles, no_angles, 20) == 0
+    assert JustDanceModel.final_score_dtw(no_angles, some_angles, 20) == 0
+
+
+def test_scoring_skips_joints_that_were_not_detected():
+    """
+    This function tests that angles of key points scored below `min_score`
+    are NaN, and that `final_score`, the `IncrementalScorer` and
+    `final_score_dtw` leave them out instead of counting them as misses.
+    """
+    key_points = np.random.default_rng(6).random((40, 17, 3))
+    key_points[:, :, 2] = 0.9
+    key_points[::2, 9, 2] = 0.1  # left wrist hidden in every other frame
+    key_points[:, 10, 2] = 0.1  # right wrist never detected
+
+    angles = JustDanceModel.calculate_angles(key_points, (360, 640), None, 0.2)
+    assert (
+        np.isnan(angles[::2, 0]).all() and not np.isnan(angles[1::2, 0]).any()
+    )
+    assert np.isnan(angles[:, 1]).all()
+    assert not np.isnan(angles[:, 2:]).any()
+
+    angles_video = AngleBuffer()
+    angles_camera = AngleBuffer()
+    angles_video.extend(angles)
+    angles_camera.extend(angles)
+    scorer = IncrementalScorer()
+    for video_row, camera_row in zip(angles_video.array, angles_camera.array):
+        scorer.update(video_row, camera_row)
+
+    assert (
+        JustDanceModel.score_calculator(angles[:, 0], angles[:, 0], 20) == 100
+    )
+    assert JustDanceModel.final_score(angles_video, angles_camera, 20) == 100
+    assert scorer.score == 100
+    assert (
+        JustDanceModel.final_score_dtw(angles_video, angles_camera, 20) == 100
+    )
+
+
+def test_multi_player_scorer_matches_one_scorer_per_player():
+    """
+    This function tests that scoring several players in one batch gives
+    each player the score of their own `IncrementalScorer`, and that
+    frames a player is missing from are left out of their score.
+    """
+    rng = np.random.default_rng(0)
+    angles_video = rng.uniform(0, 180, (50, len(JOINTS)))
+    angles_players = angles_video[:, None] + rng.normal(0, 20, (50, 3, 8))
+    angles_players[10:20, 1] = np.nan
+
+    scorer = MultiPlayerScorer(max_players=4, capacity=8)
+    for video, players in zip(angles_video, angles_players):
+        scorer.update(video, np.vstack([players, np.full(8, np.nan)]))
+
+    assert scorer.angles.shape == (50, 4, 8)
+    assert list(scorer.players) == [0, 1, 2]
+    for player in range(3):
+        single = IncrementalScorer()
+        for video, players in zip(angles_video, angles_players):
+            single.update(video, players[player])
+        assert scorer.scores[player] == pytest.approx(single.score)
+    assert scorer.scores[3] == 0
+
+
+def test_new_player_does_not_inherit_the_score_of_a_player_who_left():
+    """
+    This function tests that a player who takes the slot of a player who
+    left the game starts from a clean score.
+    """
+    tracker = PlayerTracker(max_players=1, max_missed=2)
+    scorer = MultiPlayerScorer(max_players=1)
+    angles_video = np.full(len(JOINTS), 90.0)
+    leaver = [0.2, 0.1, 0.9, 0.3, 0.9]
+    joiner = [0.2, 0.6, 0.9, 0.8, 0.9]
+
+    def sample(boxes, angles):
+        slots, joined = tracker.update(boxes)
+        scorer.reset_players(joined)
+        angles_players = np.full(scorer.hits.shape, np.nan)
+        angles_players[slots[slots >= 0]] = angles
+        scorer.update(angles_video, angles_players)
+        return slots
+
+    for _ in range(5):
+        sample([leaver], angles_video)
+    assert scorer.scores[0] == 100
+    for _ in range(3):
+        sample(np.empty((0, 5)), angles_video)
+    assert not tracker.active[0]
+
+    for _ in range(4):
+        assert list(sample([joiner], angles_video + 90)) == [0]
+    assert scorer.scores[0] == 20
+    assert list(scorer.counts[0]) == [4] * len(JOINTS)
+    assert np.isnan(scorer.angles[:8, 0]).all()
+
+
+def test_scores_agree_when_no_joint_is_compared():
+    """
+    This function tests that `final_score` and the `IncrementalScorer` both
+    score 0 when the dancer was never detected, and that DTW does not match
+    a dancer with the frames where the video's dancer was not detected,
+    which would leave their moves out of the score.
+    """
+    angles_video = AngleBuffer()
+    angles_camera = AngleBuffer()
+    rng = np.random.default_rng(5)
+    angles_video.extend(rng.uniform(0, 180, (10, 8)))
+    angles_camera.extend(np.full((10, 8), np.nan))
+    scorer = IncrementalScorer()
+    for video_row, camera_row in zip(angles_video.array, angles_camera.array):
+        scorer.update(video_row, camera_row)
+
+    assert JustDanceModel.final_score(angles_video, angles_camera, 20) == 0
+    assert scorer.score == 0
+
+    video = np.cumsum(rng.normal(0, 15, (60, 8)), axis=0)
+    camera = np.cumsum(rng.normal(0, 15, (60, 8)), axis=0)
+    video[20:26] = np.nan
+    alignment = dtw_align(video, camera, 5)
+    assert np.count_nonzero((alignment >= 20) & (alignment < 26)) <= 6
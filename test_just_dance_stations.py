@@ -0,0 +1,70 @@
+"""
+Module to test the shared inference of the Just Dance Game
+"""
+import numpy as np
+import pytest
+from just_dance_stations import (
+    InferenceServer,
+    RoundRobinQueue,
+    StationModel,
+    padded_batch_size,
+)
+
+
+def test_round_robin_queue_serves_every_station():
+    """
+    This function tests that a station queueing many frames cannot keep
+    the other stations' frames out of a batch.
+    """
+    requests = RoundRobinQueue()
+    for frame in range(10):
+        requests.put("busy", frame)
+    requests.put("quiet", "a")
+    requests.put("other", "b")
+
+    assert requests.take(3) == [("busy", 0), ("quiet", "a"), ("other", "b")]
+    requests.put("quiet", "c")
+    assert requests.take(3) == [("busy", 1), ("quiet", "c"), ("busy", 2)]
+    assert len(requests.close()) == 7
+    assert not requests.take(3)
+    with pytest.raises(RuntimeError):
+        requests.put("quiet", "d")
+
+
+def test_inference_server_batches_station_frames(fake_model):
+    """
+    This function tests that the inference server runs the frames of
+    several stations in batches and returns each station its own output.
+    """
+    batch_sizes = []
+
+    def run_batch(input_images, batch_size=None):
+        batch_sizes.append((len(input_images), batch_size))
+        return [image[:, :1, :1, :1] for image in input_images]
+
+    fake_model.run_batch = run_batch
+    server = InferenceServer(None, max_batch=4, models=[fake_model])
+    futures = [
+        server.submit(station, np.full((1, 192, 192, 3), station))
+        for station in range(6)
+    ]
+    server.start()
+    outputs = [future.result(timeout=5) for future in futures]
+    station = StationModel(server, "station", "test/test.mp3")
+    station_output = station.run_inference(np.full((1, 192, 192, 3), 9))
+    server.close()
+
+    assert [int(output.item()) for output in outputs] == list(range(6))
+    assert int(station_output.item()) == 9
+    assert batch_sizes == [(4, 4), (2, 2), (1, 1)]
+    assert server.frames == 7
+
+
+def test_batches_are_padded_to_a_power_of_two():
+    """
+    This function tests that a batch is padded to the next power of two
+    frames up to the largest batch, so a lone frame runs on its own.
+    """
+    sizes = [padded_batch_size(frames, 8) for frames in range(1, 9)]
+    assert sizes == [1, 2, 4, 4, 8, 8, 8, 8]
+    assert [padded_batch_size(frames, 6) for frames in (3, 5, 6)] == [4, 6, 6]
@@ -0,0 +1,60 @@
+"""
+Module to test the timing of the Just Dance Game
+"""
+import numpy as np
+from just_dance_timing import FrameSampler, MediaClock
+
+
+def test_frame_sampler_follows_video_time():
+    """
+    This function tests that a `FrameSampler` takes the same number of
+    samples per second of video whatever the frame rate, on a fixed grid
+    of video times, samples every
+    frame when its rate is None, and lowers its adaptive rate when
+    inference takes longer than its budget.
+    """
+    for frame_rate in (24, 30, 60):
+        sampler = FrameSampler(rate=2)
+        timestamps = np.arange(10 * frame_rate) * 1000 / frame_rate
+        samples = [t for t in timestamps if sampler.should_sample(t)]
+        assert len(samples) == 20
+
+    # At 7 samples per second of a 30 fps video, every sample is taken at
+    # the first frame of its slot instead of slipping a frame later each
+    # time, and a jump in the video does not bunch samples up
+    sampler = FrameSampler(rate=7)
+    timestamps = np.arange(300) * 1000 / 30
+    samples = [t for t in timestamps if sampler.should_sample(t)]
+    assert len(samples) == 70
+    slots = np.arange(70) * 1000 / 7
+    assert np.all((samples >= slots) & (samples < slots + 1000 / 30))
+    assert [sampler.should_sample(t) for t in (20_000, 20_050, 20_150)] == [
+        True,
+        False,
+        True,
+    ]
+
+    sampler = FrameSampler(rate=None)
+    assert all(sampler.should_sample(t) for t in range(100))
+
+    sampler = FrameSampler(rate=10, adaptive=True, budget=0.5)
+    sampler.record(0.2)
+    assert sampler.rate < 10
+
+
+def test_media_clock_waits_for_frames_and_reports_late_ones():
+    """
+    This function tests that the `MediaClock` shows frames no earlier than
+    they are due, and counts how many frames behind the music the video is.
+    """
+    clock = MediaClock(frame_rate=100)
+    clock.start()
+
+    clock.wait_for_frame(5)
+    assert clock.frames_behind(5) >= 0
+    assert clock.frames_behind(100) < 0
+    assert clock.stats()["frames_shown"] == 1
+    assert clock.stats()["mean_drift_ms"] >= 0
+
+    clock.record_dropped(3)
+    assert clock.stats()["frames_dropped"] == 3
@@ -0,0 +1,98 @@
+"""
+Module to test the dancer tracking of the Just Dance Game
+"""
+import numpy as np
+import pytest
+from just_dance_tracking import PlayerTracker, PoseTracker, box_iou
+
+
+def test_pose_tracker_crops_around_the_dancer():
+    """
+    This function tests that the `PoseTracker` letterboxes the whole frame
+    until it finds the dancer, then crops a square around the dancer's hips
+    and maps the key points back to the whole frame.
+    """
+    frame = np.full((100, 200, 3), 255, dtype=np.uint8)
+    tracker = PoseTracker(input_size=64)
+
+    image, crop = tracker.crop_input(frame)
+    assert image.shape == (1, 64, 64, 3)
+    assert image[0, 0].max() == 0 and image[0, 32].min() == 255
+    centre = np.full((1, 1, 17, 3), 0.5, dtype=np.float32)
+    assert np.allclose(tracker.map_to_frame(centre, crop, frame.shape), 0.5)
+
+    # A dancer standing in the middle of the frame, hips at (60, 100)
+    key_points = np.zeros((1, 1, 17, 3), dtype=np.float32)
+    key_points[..., 0] = 0.6
+    key_points[..., 1] = 0.5
+    key_points[..., 2] = 0.9
+    key_points[0, 0, [5, 6], 0] = 0.4
+    tracker.update(key_points, frame.shape)
+    top, left, size = tracker.crop
+    assert size < 100
+    assert np.isclose(top + size / 2, 60) and np.isclose(left + size / 2, 100)
+    mapped = tracker.map_to_frame(centre, tracker.crop, frame.shape)
+    assert np.allclose(mapped[..., :2], [0.6, 0.5])
+
+    key_points[..., 2] = 0.1
+    tracker.update(key_points, frame.shape)
+    assert tracker.crop is None
+
+
+def test_pose_tracker_drops_a_stale_crop(fake_model):
+    """
+    This function tests that the `PoseTracker` crops the whole frame again
+    when its last crop is older than `max_age_ms`, and keeps using it for
+    recent frames or frames without a timestamp.
+    """
+    frame = np.full((100, 200, 3), 255, dtype=np.uint8)
+    key_points = np.full((1, 1, 17, 3), 0.5, dtype=np.float32)
+    key_points[..., 2] = 0.9
+    key_points[0, 0, [5, 6], 0] = 0.4
+    fake_model.run_inference = lambda _: key_points.copy()
+    tracker = PoseTracker(input_size=64, max_age_ms=500)
+    crops = []
+    crop_input = tracker.crop_input
+
+    def record_crop(image):
+        crops.append(tracker.crop)
+        return crop_input(image)
+
+    tracker.crop_input = record_crop
+    for timestamp in (0, 200, 3533, None):
+        tracker.run(fake_model, frame, timestamp)
+
+    assert crops[0] is None and crops[1] is not None
+    assert crops[2] is None and crops[3] is not None
+    assert tracker.updated_ms is None
+    tracker.reset()
+    assert tracker.crop is None
+
+
+def test_player_tracker_keeps_players_in_their_slots():
+    """
+    This function tests that people keep their player slot as they move,
+    whatever order the model lists them in, and that a player who leaves
+    frees their slot.
+    """
+    overlaps = box_iou([[0, 0, 2, 2]], [[1, 1, 3, 3], [4, 4, 5, 5]])
+    assert overlaps.shape == (1, 2)
+    assert list(overlaps[0]) == pytest.approx([1 / 7, 0])
+
+    tracker = PlayerTracker(max_players=3, max_missed=1)
+    left = [0.2, 0.1, 0.9, 0.3, 0.9]
+    right = [0.2, 0.6, 0.9, 0.8, 0.8]
+    nobody = [0, 0, 0, 0, 0.05]
+    slots, joined = tracker.update([left, nobody, right])
+    assert list(slots) == [0, -1, 1]
+    assert list(joined) == [0, 1]
+
+    moved_left = [0.25, 0.12, 0.9, 0.32, 0.9]
+    moved_right = [0.2, 0.58, 0.9, 0.78, 0.9]
+    slots, joined = tracker.update([moved_right, moved_left])
+    assert list(slots) == [1, 0]
+    assert len(joined) == 0
+
+    tracker.update([moved_left])
+    tracker.update([moved_left])
+    assert list(tracker.active) == [True, False, False]
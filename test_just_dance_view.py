@@ -0,0 +1,78 @@
+"""
+Module to test the game window of the Just Dance Game
+"""
+import threading
+import cv2
+import numpy as np
+from just_dance_controller import JustDanceController
+from just_dance_view import FrameCompositor, FrameDisplay
+
+
+def test_frame_compositor_fills_its_canvas():
+    """
+    This function tests that the `FrameCompositor` draws both frames at the
+    same height into a canvas of the requested size, reusing the canvas
+    between frames.
+    """
+    compositor = FrameCompositor((800, 300))
+    video_frame = np.full((360, 640, 3), 50, dtype=np.uint8)
+    camera_frame = np.full((480, 640, 3), 200, dtype=np.uint8)
+
+    combined = compositor.compose(video_frame, camera_frame)
+
+    assert combined.shape == (300, 800, 3)
+    # 640 and 480 wide at equal heights, so the video takes 4/7 of the width
+    assert np.all(combined[:, :457] == 50)
+    assert np.all(combined[:, 458:] == 200)
+    assert compositor.compose(video_frame, camera_frame) is combined
+
+
+def test_frame_display_shows_game_frames_on_its_own_thread(
+    fake_model, monkeypatch
+):
+    """
+    This function tests that a controller given a `FrameDisplay` only posts
+    its frames, leaving every OpenCV window call to the thread that shows
+    them, which sees the newest frame and reports the window size back.
+    """
+    window_threads = []
+
+    def window_call(result):
+        def call(*_):
+            window_threads.append(threading.get_ident())
+            return result
+
+        return call
+
+    for name, result in (
+        ("namedWindow", None),
+        ("imshow", None),
+        ("waitKey", ord("q")),
+        ("getWindowImageRect", (0, 0, 640, 200)),
+        ("destroyWindow", None),
+    ):
+        monkeypatch.setattr(cv2, name, window_call(result))
+
+    display = FrameDisplay("test", size=(320, 100))
+    controller = JustDanceController(
+        fake_model, "test/test.mp4", camera=object(), window=display
+    )
+    frames = [np.full((90, 160, 3), value, np.uint8) for value in (50, 200)]
+    thread = threading.Thread(
+        target=lambda: [
+            controller.show_frames(frame, frame) for frame in frames
+        ]
+    )
+    thread.start()
+    thread.join()
+    controller.cap1.release()
+
+    assert not window_threads
+    key = display.show()
+    assert key == ord("q")
+    assert set(window_threads) == {threading.get_ident()}
+    assert display.size == (640, 200)
+    controller.show_frames(frames[0], frames[0])
+    assert controller.compositor.canvas.shape == (200, 640, 3)
+    display.close()
+    assert not display.window_open
@@ -0,0 +1,125 @@
+"""
+Module to test the inference worker processes of the Just Dance Game
+"""
+import queue
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pytest
+import just_dance_workers
+
+
+@pytest.fixture(scope="module")
+def mean_model_path(tmp_path_factory):
+    """
+    A fixture that builds a TensorFlow Lite model returning the mean of the
+    input image as every key point, for tests that load the model in other
+    processes. Skips the test when TensorFlow is not installed.
+    """
+    tf = pytest.importorskip("tensorflow")
+
+    @tf.function(input_signature=[tf.TensorSpec([1, 192, 192, 3], tf.float32)])
+    def mean_key_points(image):
+        mean = tf.reduce_mean(image, axis=[1, 2, 3], keepdims=True)
+        return tf.tile(tf.reshape(mean, [1, 1, 1, 1]), [1, 1, 17, 3])
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [mean_key_points.get_concrete_function()], mean_key_points
+    )
+    path = tmp_path_factory.mktemp("model") / "mean.tflite"
+    path.write_bytes(converter.convert())
+    return str(path)
+
+
+def test_inference_worker_uses_shared_memory_slots(fake_model, monkeypatch):
+    """
+    This function tests that an inference worker reads its frames from the
+    shared input slots and writes the key points to the matching output
+    slots, sending only slot numbers through its queues.
+    """
+    # pylint: disable-next=protected-access
+    fake_model._invoke = lambda image: np.full(
+        (1, 1, 17, 3), image.mean(), dtype=np.float32
+    )
+    monkeypatch.setattr(
+        just_dance_workers, "JustDanceModel", lambda *_, **__: fake_model
+    )
+    input_memory = SharedMemory(create=True, size=2 * 4 * 4 * 3)
+    output_memory = SharedMemory(create=True, size=2 * 17 * 3 * 4)
+    try:
+        inputs = np.ndarray((2, 4, 4, 3), np.uint8, buffer=input_memory.buf)
+        inputs[0], inputs[1] = 5, 7
+        tasks, results = queue.Queue(), queue.Queue()
+        for slot in (1, 0, None):
+            tasks.put(slot)
+        just_dance_workers._serve(  # pylint: disable=protected-access
+            "model.tflite",
+            {},
+            {
+                "input_name": input_memory.name,
+                "output_name": output_memory.name,
+                "num_slots": 2,
+                "input_shape": (4, 4, 3),
+                "input_dtype": "|u1",
+                "output_shape": (1, 1, 17, 3),
+            },
+            tasks,
+            results,
+        )
+        outputs = np.ndarray(
+            (2, 1, 1, 17, 3), np.float32, buffer=output_memory.buf
+        ).copy()
+        del inputs
+    finally:
+        input_memory.close()
+        input_memory.unlink()
+        output_memory.close()
+        output_memory.unlink()
+
+    assert [results.get_nowait() for _ in range(3)] == [
+        ("ready", None),
+        (1, None),
+        (0, None),
+    ]
+    assert results.empty()
+    assert np.all(outputs[0] == 5) and np.all(outputs[1] == 7)
+
+
+def test_inference_pool_recycles_slots_and_fails_when_a_worker_dies(
+    mean_model_path,
+):
+    # pylint: disable=redefined-outer-name,protected-access
+    """
+    This function tests that an inference pool runs more frames than it has
+    slots, that the frames in flight fail instead of hanging when a worker
+    dies, and that closing the pool frees its shared memory.
+    """
+    pool = just_dance_workers.InferencePool(
+        mean_model_path, num_workers=1, num_slots=2
+    )
+    memory_names = [pool._input_memory.name, pool._output_memory.name]
+    try:
+        images = [np.full((1, 192, 192, 3), value) for value in range(6)]
+        outputs = [pool.infer(image) for image in images]
+        assert [float(output.mean()) for output in outputs] == list(range(6))
+        futures = [pool.submit(image) for image in images[:2]]
+        assert [
+            float(future.result(timeout=5).mean()) for future in futures
+        ] == [
+            0,
+            1,
+        ]
+        assert pool._free_slots.qsize() == 2
+
+        pool._workers[0].kill()
+        pool._workers[0].join()
+        future = pool.submit(images[0])
+        with pytest.raises(RuntimeError, match="died"):
+            future.result(timeout=10)
+        with pytest.raises(RuntimeError, match="broken"):
+            pool.submit(images[1])
+    finally:
+        pool.close()
+
+    for name in memory_names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)